@@ -1,25 +1,193 @@
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+
 import grpc
-import helloworld_pb2
-import helloworld_pb2_grpc
+from opentelemetry import trace
 
 import tracing_lib
-import time
 
-def run(stats, tenant, msg_id):
-    print(f"Sending Client Request {tenant} {msg_id}")
+# load generator for client -> service1 -> service2
+#   closed loop: N workers, each sends its next request when the previous one returns
+#   open loop:   requests are started at a fixed rate whatever the response times, latency is measured from the
+#                scheduled start so a slow server is not hidden by the generator slowing down
+# e.g.
+#   python client.py --mode closed --workers 16 --duration 60 --warmup 5 --tenants tenant1=3,tenant2=1
+#   python client.py --mode open --rps 200 --duration 60 --json run1.json
+
+PERCENTILES = [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p999", 0.999)]
+
+# every request runs in a client_request span, the parent of the grpc client span and the exemplar of its latency.
+# follows the tracer provider grpc_otel_config sets up, a no-op with --no-telemetry
+request_tracer = trace.get_tracer("otel_test_client")
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def add_error(self, code):
+        with self.lock:
+            self.errors[code] = self.errors.get(code, 0) + 1
+
+
+# parse "tenant1=3,tenant2=1" (weights default to 1) into ([tenants], [weights])
+def parse_tenants(spec):
+    tenants, weights = [], []
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        tenants.append(name.strip())
+        weights.append(float(weight) if weight else 1.0)
+    return tenants, weights
+
+
+def request_span(tenant, msg_id):
+    return request_tracer.start_span("client_request", attributes={"tenant_id": tenant, "msg_id": msg_id})
+
+
+def run(stats, tenant, msg_id, target="localhost:50051", timeout=None):
     start = time.time()
-    with grpc.insecure_channel("localhost:50051") as channel:
-        stub = helloworld_pb2_grpc.GreeterStub(channel)
-        data = {"src":"client", "tenant":tenant,"msg_id":msg_id}
-        response = stub.SayHello(helloworld_pb2.HelloRequest(name=str(data)))
-        time.sleep(0.5)
-    stats.add(process_time=int(round(time.time() - start,3)*1000), tenant=tenant, msg_id=msg_id)
-    print("Greeter client received: " + response.message)
+    with tracing_lib.tenant_baggage(tenant), trace.use_span(request_span(tenant, msg_id), end_on_exit=True) as span:
+        response = tracing_lib.channel_pool.invoke(target, "SayHello", tracing_lib.make_request("client", tenant, msg_id), timeout=timeout)
+        if stats is not None:
+            stats.add(process_time=int(round(time.time() - start, 3) * 1000), tenant=tenant, msg_id=msg_id, span=span)
+    return response
+
+
+def closed_loop(args, stats, tenants, weights, msg_ids, measure_from, stop_at):
+    result = LoadResult()
+
+    def worker():
+        while time.perf_counter() < stop_at:
+            tenant = random.choices(tenants, weights)[0]
+            start = time.perf_counter()
+            try:
+                run(stats, tenant, str(next(msg_ids)), args.target, args.timeout)
+                if start >= measure_from:
+                    result.add(time.perf_counter() - start)
+            except grpc.RpcError as e:
+                if start >= measure_from:
+                    result.add_error(e.code().name)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(args.workers)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return result
+
+
+def open_loop(args, stats, tenants, weights, msg_ids, measure_from, stop_at):
+    result = LoadResult()
+    pending = []
+    interval = 1.0 / args.rps
+    scheduled = time.perf_counter()
+
+    def on_done(future, tenant, msg_id, scheduled, span):
+        latency = time.perf_counter() - scheduled
+        span.end()
+        if future.exception() is not None:
+            if scheduled >= measure_from:
+                result.add_error(future.code().name)
+            return
+        if stats is not None:
+            stats.add(process_time=int(round(latency, 3) * 1000), tenant=tenant, msg_id=msg_id, span=span)
+        if scheduled >= measure_from:
+            result.add(latency)
+
+    while scheduled < stop_at:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        tenant = random.choices(tenants, weights)[0]
+        msg_id = str(next(msg_ids))
+        stub = tracing_lib.channel_pool.get_stub(args.target)
+        span = request_span(tenant, msg_id)
+        with tracing_lib.tenant_baggage(tenant), trace.use_span(span):
+            future = stub.SayHello.future(tracing_lib.make_request("client", tenant, msg_id), timeout=args.timeout)
+        future.add_done_callback(lambda f, t=tenant, m=msg_id, s=scheduled, sp=span: on_done(f, t, m, s, sp))
+        pending.append(future)
+        scheduled += interval
+    for future in pending:
+        try:
+            future.result()
+        except grpc.RpcError:
+            pass
+    return result
+
+
+def summarize(args, result, duration):
+    latencies = sorted(result.latencies)
+    errors = sum(result.errors.values())
+    total = len(latencies) + errors
+    summary = {
+        "mode": args.mode,
+        "target": args.target,
+        "workers": args.workers if args.mode == "closed" else None,
+        "rps_target": args.rps if args.mode == "open" else None,
+        "tenants": args.tenants,
+        "duration_s": duration,
+        "warmup_s": args.warmup,
+        "requests": total,
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "errors": result.errors,
+        "latency_ms": {},
+    }
+    for name, q in PERCENTILES:
+        if latencies:
+            summary["latency_ms"][name] = round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+        else:
+            summary["latency_ms"][name] = None
+    return summary
+
+
+def print_summary(summary):
+    latency = ", ".join(f"{name}={value}" for name, value in summary["latency_ms"].items())
+    print(f"mode={summary['mode']} requests={summary['requests']} throughput={summary['throughput_rps']} req/s "
+          f"error_rate={summary['error_rate']} {summary['errors']}")
+    print(f"latency ms: {latency}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="load generator for the Greeter services")
+    parser.add_argument("--target", default="localhost:50051")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent workers (closed loop)")
+    parser.add_argument("--rps", type=float, default=10, help="requests per second (open loop)")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds, after warmup")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument("--tenants", default="tenant1,tenant2", help="tenant mix, e.g. tenant1=3,tenant2=1")
+    parser.add_argument("--timeout", type=float, default=30, help="per request timeout in seconds")
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument("--no-telemetry", action="store_true", help="skip OTel setup in the client")
+    parser.add_argument("--spans-per-second", type=float, help="cap sampled traces per tenant per second")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    service_name = "otel_test_client"
-    tracer, logger, metrics, stats = tracing_lib.grpc_otel_config(service_name=service_name)
-    for msg_idx in range(200):
-        for tenant in ["tenant1","tenant2"]:
-            run(stats, tenant, str(msg_idx+1))
-        time.sleep(2)
+    args = parse_args()
+    stats = None
+    if not args.no_telemetry:
+        service_name = "otel_test_client"
+        tracer, logger, metrics, stats = tracing_lib.grpc_otel_config(service_name=service_name, spans_per_second=args.spans_per_second)
+    tenants, weights = parse_tenants(args.tenants)
+    msg_ids = itertools.count(1)
+    measure_from = time.perf_counter() + args.warmup
+    stop_at = measure_from + args.duration
+    load = closed_loop if args.mode == "closed" else open_loop
+    result = load(args, stats, tenants, weights, msg_ids, measure_from, stop_at)
+    summary = summarize(args, result, args.duration)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
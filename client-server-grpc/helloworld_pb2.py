@@ -13,7 +13,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10helloworld.proto\x12\nhelloworld\"\x1c\n\x0cHelloRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\"\x1d\n\nHelloReply\x12\x0f\n\x07message\x18\x01 \x01(\t2I\n\x07Greeter\x12>\n\x08SayHello\x12\x18.helloworld.HelloRequest\x1a\x16.helloworld.HelloReply\"\x00\x42\x36\n\x1bio.grpc.examples.helloworldB\x0fHelloWorldProtoP\x01\xa2\x02\x03HLWb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10helloworld.proto\x12\nhelloworld\"\xce\x01\n\x0cHelloRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0b\n\x03src\x18\x02 \x01(\t\x12\x0e\n\x06tenant\x18\x03 \x01(\t\x12\x0e\n\x06msg_id\x18\x04 \x01(\t\x12\x0b\n\x03seq\x18\x05 \x01(\x04\x12\x41\n\rtrace_context\x18\x06 \x03(\x0b\x32*.helloworld.HelloRequest.TraceContextEntry\x1a\x33\n\x11TraceContextEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"9\n\nHelloReply\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0b\n\x03seq\x18\x02 \x01(\x04\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"\xf3\x03\n\x10TelemetryRequest\x12\x1b\n\x0esampling_ratio\x18\x01 \x01(\x01H\x00\x88\x01\x01\x12W\n\x17tenant_spans_per_second\x18\x02 \x03(\x0b\x32\x36.helloworld.TelemetryRequest.TenantSpansPerSecondEntry\x12\x16\n\tlog_level\x18\x03 \x01(\tH\x01\x88\x01\x01\x12 \n\x13unsampled_log_level\x18\x04 \x01(\tH\x02\x88\x01\x01\x12\x1b\n\x0e\x65xception_mode\x18\x05 \x01(\tH\x03\x88\x01\x01\x12(\n\x1b\x65xception_full_per_interval\x18\x06 \x01(\rH\x04\x88\x01\x01\x12\x15\n\rreset_latency\x18\x07 \x01(\x08\x12\x18\n\x0b\x65mit_policy\x18\x08 \x01(\tH\x05\x88\x01\x01\x1a;\n\x19TenantSpansPerSecondEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x42\x11\n\x0f_sampling_ratioB\x0c\n\n_log_levelB\x16\n\x14_unsampled_log_levelB\x11\n\x0f_exception_modeB\x1e\n\x1c_exception_full_per_intervalB\x0e\n\x0c_emit_policy\"\xcc\x04\n\x0fTelemetryStatus\x12\x0b\n\x03pid\x18\x01 \x01(\x03\x12\x16\n\x0esampling_ratio\x18\x02 \x01(\x01\x12\x0f\n\x07sampler\x18\x03 \x01(\t\x12V\n\x17tenant_spans_per_second\x18\x04 \x03(\x0b\x32\x35.helloworld.TelemetryStatus.TenantSpansPerSecondEntry\x12\x11\n\tlog_level\x18\x05 \x01(\t\x12\x1b\n\x13unsampled_log_level\x18\x06 \x01(\t\x12\x16\n\x0e\x65xception_mode\x18\x07 \x01(\t\x12#\n\x1b\x65xception_full_per_interval\x18\x08 \x01(\r\x12%\n\x05pools\x18\t \x03(\x0b\x32\x16.helloworld.PoolStatus\x12.\n\rexport_queues\x18\n \x03(\x0b\x32\x17.helloworld.QueueStatus\x12\x39\n\x07\x64ropped\x18\x0b \x03(\x0b\x32(.helloworld.TelemetryStatus.DroppedEntry\x12*\n\x07latency\x18\x0c \x03(\x0b\x32\x19.helloworld.LatencyStatus\x12\x13\n\x0b\x65mit_policy\x18\r \x01(\t\x1a;\n\x19TenantSpansPerSecondEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x1a.\n\x0c\x44roppedEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x04:\x02\x38\x01\"X\n\nPoolStatus\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04size\x18\x02 \x01(\r\x12\x0c\n\x04\x62usy\x18\x03 \x01(\r\x12\x0e\n\x06queued\x18\x04 \x01(\r\x12\x10\n\x08rejected\x18\x05 \x01(\x04\">\n\x0bQueueStatus\x12\x0e\n\x06signal\x18\x01 \x01(\t\x12\r\n\x05\x64\x65pth\x18\x02 \x01(\r\x12\x10\n\x08\x63\x61pacity\x18\x03 \x01(\r\"t\n\rLatencyStatus\x12\x0e\n\x06tenant\x18\x01 \x01(\t\x12\r\n\x05\x63ount\x18\x02 \x01(\x04\x12\x0e\n\x06p50_ms\x18\x03 \x01(\x01\x12\x0e\n\x06p90_ms\x18\x04 \x01(\x01\x12\x0e\n\x06p99_ms\x18\x05 \x01(\x01\x12\x14\n\x0cp99_trace_id\x18\x06 \x01(\t2\x93\x01\n\x07Greeter\x12>\n\x08SayHello\x12\x18.helloworld.HelloRequest\x1a\x16.helloworld.HelloReply\"\x00\x12H\n\x0eSayHelloStream\x12\x18.helloworld.HelloRequest\x1a\x16.helloworld.HelloReply\"\x00(\x01\x30\x01\x32\xaa\x01\n\x0eTelemetryAdmin\x12K\n\x0cGetTelemetry\x12\x1c.helloworld.TelemetryRequest\x1a\x1b.helloworld.TelemetryStatus\"\x00\x12K\n\x0cSetTelemetry\x12\x1c.helloworld.TelemetryRequest\x1a\x1b.helloworld.TelemetryStatus\"\x00\x42\x36\n\x1bio.grpc.examples.helloworldB\x0fHelloWorldProtoP\x01\xa2\x02\x03HLWb\x06proto3')
 
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'helloworld_pb2', globals())
@@ -21,10 +21,38 @@ if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
   DESCRIPTOR._serialized_options = b'\n\033io.grpc.examples.helloworldB\017HelloWorldProtoP\001\242\002\003HLW'
-  _HELLOREQUEST._serialized_start=32
-  _HELLOREQUEST._serialized_end=60
-  _HELLOREPLY._serialized_start=62
-  _HELLOREPLY._serialized_end=91
-  _GREETER._serialized_start=93
-  _GREETER._serialized_end=166
+  _HELLOREQUEST_TRACECONTEXTENTRY._options = None
+  _HELLOREQUEST_TRACECONTEXTENTRY._serialized_options = b'8\001'
+  _TELEMETRYREQUEST_TENANTSPANSPERSECONDENTRY._options = None
+  _TELEMETRYREQUEST_TENANTSPANSPERSECONDENTRY._serialized_options = b'8\001'
+  _TELEMETRYSTATUS_TENANTSPANSPERSECONDENTRY._options = None
+  _TELEMETRYSTATUS_TENANTSPANSPERSECONDENTRY._serialized_options = b'8\001'
+  _TELEMETRYSTATUS_DROPPEDENTRY._options = None
+  _TELEMETRYSTATUS_DROPPEDENTRY._serialized_options = b'8\001'
+  _HELLOREQUEST._serialized_start=33
+  _HELLOREQUEST._serialized_end=239
+  _HELLOREQUEST_TRACECONTEXTENTRY._serialized_start=188
+  _HELLOREQUEST_TRACECONTEXTENTRY._serialized_end=239
+  _HELLOREPLY._serialized_start=241
+  _HELLOREPLY._serialized_end=298
+  _TELEMETRYREQUEST._serialized_start=301
+  _TELEMETRYREQUEST._serialized_end=800
+  _TELEMETRYREQUEST_TENANTSPANSPERSECONDENTRY._serialized_start=617
+  _TELEMETRYREQUEST_TENANTSPANSPERSECONDENTRY._serialized_end=676
+  _TELEMETRYSTATUS._serialized_start=803
+  _TELEMETRYSTATUS._serialized_end=1391
+  _TELEMETRYSTATUS_TENANTSPANSPERSECONDENTRY._serialized_start=617
+  _TELEMETRYSTATUS_TENANTSPANSPERSECONDENTRY._serialized_end=676
+  _TELEMETRYSTATUS_DROPPEDENTRY._serialized_start=1345
+  _TELEMETRYSTATUS_DROPPEDENTRY._serialized_end=1391
+  _POOLSTATUS._serialized_start=1393
+  _POOLSTATUS._serialized_end=1481
+  _QUEUESTATUS._serialized_start=1483
+  _QUEUESTATUS._serialized_end=1545
+  _LATENCYSTATUS._serialized_start=1547
+  _LATENCYSTATUS._serialized_end=1663
+  _GREETER._serialized_start=1666
+  _GREETER._serialized_end=1813
+  _TELEMETRYADMIN._serialized_start=1816
+  _TELEMETRYADMIN._serialized_end=1986
 # @@protoc_insertion_point(module_scope)
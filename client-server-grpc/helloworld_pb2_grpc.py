@@ -20,6 +20,11 @@ class GreeterStub(object):
                 request_serializer=helloworld__pb2.HelloRequest.SerializeToString,
                 response_deserializer=helloworld__pb2.HelloReply.FromString,
                 )
+        self.SayHelloStream = channel.stream_stream(
+                '/helloworld.Greeter/SayHelloStream',
+                request_serializer=helloworld__pb2.HelloRequest.SerializeToString,
+                response_deserializer=helloworld__pb2.HelloReply.FromString,
+                )
 
 
 class GreeterServicer(object):
@@ -33,6 +38,14 @@ class GreeterServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def SayHelloStream(self, request_iterator, context):
+        """Sends greetings over one long-lived stream. Replies may arrive out of
+        order, each echoes the seq of its request.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_GreeterServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -41,6 +54,11 @@ def add_GreeterServicer_to_server(servicer, server):
                     request_deserializer=helloworld__pb2.HelloRequest.FromString,
                     response_serializer=helloworld__pb2.HelloReply.SerializeToString,
             ),
+            'SayHelloStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.SayHelloStream,
+                    request_deserializer=helloworld__pb2.HelloRequest.FromString,
+                    response_serializer=helloworld__pb2.HelloReply.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'helloworld.Greeter', rpc_method_handlers)
@@ -68,3 +86,122 @@ class Greeter(object):
             helloworld__pb2.HelloReply.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def SayHelloStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/helloworld.Greeter/SayHelloStream',
+            helloworld__pb2.HelloRequest.SerializeToString,
+            helloworld__pb2.HelloReply.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+
+class TelemetryAdminStub(object):
+    """Runtime telemetry controls and stats of a server, served next to Greeter
+    (tracing_lib.TelemetryAdmin).
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.GetTelemetry = channel.unary_unary(
+                '/helloworld.TelemetryAdmin/GetTelemetry',
+                request_serializer=helloworld__pb2.TelemetryRequest.SerializeToString,
+                response_deserializer=helloworld__pb2.TelemetryStatus.FromString,
+                )
+        self.SetTelemetry = channel.unary_unary(
+                '/helloworld.TelemetryAdmin/SetTelemetry',
+                request_serializer=helloworld__pb2.TelemetryRequest.SerializeToString,
+                response_deserializer=helloworld__pb2.TelemetryStatus.FromString,
+                )
+
+
+class TelemetryAdminServicer(object):
+    """Runtime telemetry controls and stats of a server, served next to Greeter
+    (tracing_lib.TelemetryAdmin).
+    """
+
+    def GetTelemetry(self, request, context):
+        """Current settings and stats
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SetTelemetry(self, request, context):
+        """Applies the fields that are set, then returns the settings and stats
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_TelemetryAdminServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'GetTelemetry': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetTelemetry,
+                    request_deserializer=helloworld__pb2.TelemetryRequest.FromString,
+                    response_serializer=helloworld__pb2.TelemetryStatus.SerializeToString,
+            ),
+            'SetTelemetry': grpc.unary_unary_rpc_method_handler(
+                    servicer.SetTelemetry,
+                    request_deserializer=helloworld__pb2.TelemetryRequest.FromString,
+                    response_serializer=helloworld__pb2.TelemetryStatus.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'helloworld.TelemetryAdmin', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+ # This class is part of an EXPERIMENTAL API.
+class TelemetryAdmin(object):
+    """Runtime telemetry controls and stats of a server, served next to Greeter
+    (tracing_lib.TelemetryAdmin).
+    """
+
+    @staticmethod
+    def GetTelemetry(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/helloworld.TelemetryAdmin/GetTelemetry',
+            helloworld__pb2.TelemetryRequest.SerializeToString,
+            helloworld__pb2.TelemetryStatus.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def SetTelemetry(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/helloworld.TelemetryAdmin/SetTelemetry',
+            helloworld__pb2.TelemetryRequest.SerializeToString,
+            helloworld__pb2.TelemetryStatus.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -1,33 +1,115 @@
-import grpc
+import sys
+
 import helloworld_pb2
-import helloworld_pb2_grpc
 import tracing_lib
 from opentelemetry import trace
 
 
+# calls to service2 get what is left of the caller's deadline minus deadline_margin seconds (30s when the caller
+# set none). hedge is an optional tracing_lib.HedgePolicy. with stream (a tracing_lib.GreeterStream to service2)
+# all requests are forwarded over that one long-lived stream instead of a unary call each; hedge does not apply.
+# with cache (a tracing_lib.ResponseCache) service2's response is reused for repeated (tenant, msg_id) requests,
+# e.g. client retries, and concurrent identical requests share one call
 class Service1(tracing_lib.HelloHandler):
-    def __init__(self, service_name, tracer=None, logger=None, stats=None):
+    def __init__(self, service_name, tracer=None, logger=None, stats=None, target="localhost:50052", hedge=None,
+                 deadline_margin=0.05, stream=None, cache=None):
         super().__init__(service_name, tracer, logger, stats)
+        self.target = target
+        self.hedge = hedge
+        self.deadline_margin = deadline_margin
+        self.stream = stream
+        self.cache = cache
 
     def handle_message(self, request_from, tenant, msg_id):
-        print("handle_message")
-        with grpc.insecure_channel("localhost:50052") as channel:
-            span = trace.get_current_span()
-            self.log_msg(span, f"server_1 - sending to server_2 - {tenant} {msg_id}")
-            stub = helloworld_pb2_grpc.GreeterStub(channel)
-            data = {"src":request_from, "tenant":tenant, "msg_id": msg_id}
-            response = stub.SayHello(helloworld_pb2.HelloRequest(name=str(data)), timeout=30)
-            #self.log_msg(span, f"server_1 - got response from server2 {response}")
-            value = getattr(response, "message")
-            value = f"{value} - response {self.service_name}"
-            # linked_span_context = self.gen_linked_span_context()
-            # with self.tracer.start_as_current_span("span_with_link", links=[trace.Link(context=linked_span_context)]) as another_span:
-            #     self.log_msg(another_span, "Started span with links")
-            return helloworld_pb2.HelloReply(message=value)
+        tracing_lib.diagnostics.print("handle_message")
+        span = trace.get_current_span()
+        self.log_msg(span, "server_1 - sending to server_2 - %s %s", tenant, msg_id)
+        request = tracing_lib.make_request(request_from, tenant, msg_id)
+        timeout = tracing_lib.downstream_timeout(default=30, margin=self.deadline_margin)
+        if self.cache is not None:
+            response = self.cache.call((tenant, msg_id), lambda: self.call_service2(request, timeout), timeout=timeout)
+        else:
+            response = self.call_service2(request, timeout)
+        #self.log_msg(span, f"server_1 - got response from server2 {response}")
+        value = getattr(response, "message")
+        value = f"{value} - response {self.service_name}"
+        # linked_span_context = self.gen_linked_span_context()
+        # with self.tracer.start_as_current_span("span_with_link", links=[trace.Link(context=linked_span_context)]) as another_span:
+        #     self.log_msg(another_span, "Started span with links")
+        return helloworld_pb2.HelloReply(message=value)
+
+    def call_service2(self, request, timeout):
+        if self.stream is not None:
+            return self.stream.call(request, timeout=timeout)
+        if self.hedge is not None:
+            return tracing_lib.channel_pool.hedged_invoke(self.target, "SayHello", request, self.hedge, timeout=timeout)
+        return tracing_lib.channel_pool.invoke(self.target, "SayHello", request, timeout=timeout)
+
+
+class AsyncService1(tracing_lib.AsyncHelloHandler):
+    def __init__(self, service_name, tracer=None, logger=None, stats=None, target="localhost:50052", hedge=None,
+                 deadline_margin=0.05, cache=None):
+        super().__init__(service_name, tracer, logger, stats)
+        self.target = target
+        self.hedge = hedge
+        self.deadline_margin = deadline_margin
+        self.cache = cache
+
+    async def handle_message(self, request_from, tenant, msg_id):
+        tracing_lib.diagnostics.print("handle_message")
+        span = trace.get_current_span()
+        self.log_msg(span, "server_1 - sending to server_2 - %s %s", tenant, msg_id)
+        request = tracing_lib.make_request(request_from, tenant, msg_id)
+        timeout = tracing_lib.downstream_timeout(default=30, margin=self.deadline_margin)
+        if self.cache is not None:
+            response = await self.cache.async_call((tenant, msg_id), lambda: self.call_service2(request, timeout),
+                                                   timeout=timeout)
+        else:
+            response = await self.call_service2(request, timeout)
+        value = getattr(response, "message")
+        value = f"{value} - response {self.service_name}"
+        return helloworld_pb2.HelloReply(message=value)
 
+    async def call_service2(self, request, timeout):
+        if self.hedge is not None:
+            return await tracing_lib.aio_channel_pool.hedged_invoke(self.target, "SayHello", request, self.hedge, timeout=timeout)
+        return await tracing_lib.aio_channel_pool.invoke(self.target, "SayHello", request, timeout=timeout)
 
+
+# handler and admission controller of the threaded server, with OTel configured. with --workers this runs in
+# each worker after the fork, so each worker has its own stream, cache and hedge state
+def threaded_server(service_name):
+    tracer, logger, metrics, stats = tracing_lib.grpc_otel_config(service_name=service_name)
+    hedge = tracing_lib.HedgePolicy() if "--hedge" in sys.argv else None
+    cache = tracing_lib.ResponseCache(metrics=metrics, meter_name=service_name) if "--cache" in sys.argv else None
+    stream = tracing_lib.GreeterStream("localhost:50052") if "--stream" in sys.argv else None
+    handler = Service1(service_name="service1", tracer=tracer, logger=logger, stats=stats, hedge=hedge,
+                       stream=stream, cache=cache)
+    admission = None
+    if "--admission" in sys.argv:
+        admission = tracing_lib.AdmissionController(fair=True, metrics=metrics, meter_name=service_name)
+    return handler, admission
+
+
+# python service1.py [--aio] [--admission] [--hedge] [--stream] [--cache] [--workers N] [--admin]
+#   --admission puts the threaded server behind an adaptive concurrency limit with per-tenant fair queuing
+#   --hedge sends a second attempt to service2 when the first is slower than the recent p95
+#   --stream forwards to service2 over one SayHelloStream (threaded server only)
+#   --cache reuses service2's response for repeated (tenant, msg_id) requests for 30s
+#   --workers pre-forks N server processes sharing the port (threaded server only)
+#   --admin also serves TelemetryAdmin, see telemetry_admin.py (threaded server only)
 if __name__ == "__main__":
     service_name = "otel_test_service_1"
-    tracer, logger, metrics, stats = tracing_lib.grpc_otel_config(service_name=service_name)
-    handler = Service1(service_name="service1", tracer=tracer, logger=logger, stats=stats)
-    tracing_lib.start_grpc_server(50051, handler)
+    if "--aio" in sys.argv:
+        tracer, logger, metrics, stats = tracing_lib.grpc_otel_config(service_name=service_name, aio=True)
+        hedge = tracing_lib.HedgePolicy() if "--hedge" in sys.argv else None
+        cache = tracing_lib.ResponseCache(metrics=metrics, meter_name=service_name) if "--cache" in sys.argv else None
+        handler = AsyncService1(service_name="service1", tracer=tracer, logger=logger, stats=stats, hedge=hedge,
+                                cache=cache)
+        tracing_lib.start_aio_grpc_server(50051, handler)
+    elif "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+        tracing_lib.start_prefork_server(50051, workers, lambda worker: threaded_server(service_name),
+                                         admin="--admin" in sys.argv)
+    else:
+        tracing_lib.start_grpc_server(50051, *threaded_server(service_name), admin="--admin" in sys.argv)
@@ -1,4 +1,5 @@
-import threading
+import asyncio
+import sys
 import time
 
 import helloworld_pb2
@@ -15,11 +16,11 @@ class Service2(tracing_lib.HelloHandler):
         try:
             raise ValueError('Invalid input')
         except ValueError as e:
-            span.record_exception(e)
+            tracing_lib.record_exception(span, e)
         time.sleep(.3)
         linked_span_context = self.gen_linked_span_context()
         with self.tracer.start_as_current_span("child_linked_span",links=[trace.Link(context=linked_span_context)]) as linked_span:
-            self.log_msg(linked_span, f"Started span service_1 {tenant} {msg_id}")
+            self.log_msg(linked_span, "Started span service_1 %s %s", tenant, msg_id)
             time.sleep(.3)
         response = helloworld_pb2.HelloReply(message=f"Hello [{request_from}] - response {self.service_name}")
         return response
@@ -30,27 +31,98 @@ class Service2(tracing_lib.HelloHandler):
             linked_span.set_attribute("attr1", "linked-attr1")
             linked_span.set_attribute("attr2", "linked-attr2")
             linked_span.add_event("event-1")
-            print(f"linked_span > {tracing_lib.span_info(linked_span.get_span_context())}")
+            tracing_lib.diagnostics.print_span("linked_span > ", linked_span)
             with self.tracer.start_as_current_span("child-span") as child_span:
                 self.log_msg(child_span, "Starting child-span")
                 child_span.set_attribute("attr1", "child-attr1")
                 child_span.set_attribute("attr2", "child-attr2")
                 child_span.add_event("event-2")
-                print(f"child_span > {tracing_lib.span_info(child_span.get_span_context())}")
-                threading.Thread(target=self.linked_child_span, args=(child_span,)).start()
+                tracing_lib.diagnostics.print_span("child_span > ", child_span)
+                # runs with child-span as the current span, rejected (no sub span) when the pool is backed up
+                tracing_lib.background.submit(self.linked_child_span)
             return linked_span.get_span_context()
 
-    def linked_child_span(self, parent_span):
-        parent_span_context = trace.set_span_in_context(parent_span)
-        with self.tracer.start_as_current_span("child-sub-span", context=parent_span_context) as span:
+    def linked_child_span(self):
+        with self.tracer.start_as_current_span("child-sub-span") as span:
             span.set_attribute("attr1", "child-sub-attr1")
             span.set_attribute("attr2", "child-sub-attr2")
             span.add_event("event-3")
             time.sleep(2)
-            print(f"linked_span_done > {tracing_lib.span_info(span.get_span_context())}")
+            tracing_lib.diagnostics.print_span("linked_span_done > ", span)
 
-if __name__ == "__main__":
-    service_name = "otel_test_service_2"
+
+class AsyncService2(tracing_lib.AsyncHelloHandler):
+    def __init__(self, service_name, tracer=None, logger=None, stats=None):
+        super().__init__(service_name, tracer, logger, stats)
+        # keep references to background span tasks until they finish
+        self.background_tasks = set()
+
+    async def handle_message(self, request_from, tenant, msg_id):
+        span = trace.get_current_span()
+        try:
+            raise ValueError('Invalid input')
+        except ValueError as e:
+            tracing_lib.record_exception(span, e)
+        await asyncio.sleep(.3)
+        linked_span_context = self.gen_linked_span_context()
+        with self.tracer.start_as_current_span("child_linked_span",links=[trace.Link(context=linked_span_context)]) as linked_span:
+            self.log_msg(linked_span, "Started span service_1 %s %s", tenant, msg_id)
+            await asyncio.sleep(.3)
+        response = helloworld_pb2.HelloReply(message=f"Hello [{request_from}] - response {self.service_name}")
+        return response
+
+    def gen_linked_span_context(self):
+        with self.tracer.start_as_current_span("linked-span",context=trace.Context()) as linked_span:
+            self.log_msg(linked_span, "Starting span linked-service")
+            linked_span.set_attribute("attr1", "linked-attr1")
+            linked_span.set_attribute("attr2", "linked-attr2")
+            linked_span.add_event("event-1")
+            tracing_lib.diagnostics.print_span("linked_span > ", linked_span)
+            with self.tracer.start_as_current_span("child-span") as child_span:
+                self.log_msg(child_span, "Starting child-span")
+                child_span.set_attribute("attr1", "child-attr1")
+                child_span.set_attribute("attr2", "child-attr2")
+                child_span.add_event("event-2")
+                tracing_lib.diagnostics.print_span("child_span > ", child_span)
+                # the task copies the current context, so child-sub-span parents under child-span
+                task = asyncio.create_task(self.linked_child_span())
+                self.background_tasks.add(task)
+                task.add_done_callback(self.background_tasks.discard)
+            return linked_span.get_span_context()
+
+    async def linked_child_span(self):
+        with self.tracer.start_as_current_span("child-sub-span") as span:
+            span.set_attribute("attr1", "child-sub-attr1")
+            span.set_attribute("attr2", "child-sub-attr2")
+            span.add_event("event-3")
+            await asyncio.sleep(2)
+            tracing_lib.diagnostics.print_span("linked_span_done > ", span)
+
+
+# handler and admission controller of the threaded server, with OTel configured. with --workers this runs in
+# each worker after the fork
+def threaded_server(service_name):
     tracer, logger, metrics, stats = tracing_lib.grpc_otel_config(service_name=service_name)
     handler = Service2(service_name="service2", tracer=tracer, logger=logger, stats=stats)
-    tracing_lib.start_grpc_server(50052, handler)
+    admission = None
+    if "--admission" in sys.argv:
+        admission = tracing_lib.AdmissionController(fair=True, metrics=metrics, meter_name=service_name)
+    return handler, admission
+
+
+# python service2.py [--aio] [--admission] [--workers N] [--admin]
+#   --admission puts the threaded server behind an adaptive concurrency limit with per-tenant fair queuing
+#   --workers pre-forks N server processes sharing the port (threaded server only)
+#   --admin also serves TelemetryAdmin, see telemetry_admin.py (threaded server only)
+if __name__ == "__main__":
+    service_name = "otel_test_service_2"
+    if "--aio" in sys.argv:
+        tracer, logger, metrics, stats = tracing_lib.grpc_otel_config(service_name=service_name, aio=True)
+        handler = AsyncService2(service_name="service2", tracer=tracer, logger=logger, stats=stats)
+        tracing_lib.start_aio_grpc_server(50052, handler)
+    elif "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+        tracing_lib.start_prefork_server(50052, workers, lambda worker: threaded_server(service_name),
+                                         admin="--admin" in sys.argv)
+    else:
+        tracing_lib.start_grpc_server(50052, *threaded_server(service_name), admin="--admin" in sys.argv)
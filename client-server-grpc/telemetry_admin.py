@@ -0,0 +1,63 @@
+import argparse
+
+import grpc
+from google.protobuf import json_format
+
+import helloworld_pb2
+import helloworld_pb2_grpc
+
+# reads or changes the telemetry settings of a service started with --admin (tracing_lib.TelemetryAdmin) and
+# prints its settings and stats. without any setting it only reads them
+# e.g.
+#   python telemetry_admin.py --target localhost:50051
+#   python telemetry_admin.py --sampling-ratio 0.1 --log-level CRITICAL --exception-mode summary --reset-latency
+#   python telemetry_admin.py --tenant-limit tenant1=5 --tenant-limit tenant2=50
+
+
+def build_request(args):
+    request = helloworld_pb2.TelemetryRequest(reset_latency=args.reset_latency)
+    if args.sampling_ratio is not None:
+        request.sampling_ratio = args.sampling_ratio
+    if args.log_level is not None:
+        request.log_level = args.log_level
+    if args.unsampled_log_level is not None:
+        request.unsampled_log_level = args.unsampled_log_level
+    if args.exception_mode is not None:
+        request.exception_mode = args.exception_mode
+    if args.exception_full_per_interval is not None:
+        request.exception_full_per_interval = args.exception_full_per_interval
+    if args.emit_policy is not None:
+        request.emit_policy = args.emit_policy
+    for item in args.tenant_limit:
+        tenant, _, rate = item.partition("=")
+        request.tenant_spans_per_second[tenant] = float(rate)
+    return request
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="runtime telemetry controls of a service started with --admin")
+    parser.add_argument("--target", default="localhost:50051")
+    parser.add_argument("--sampling-ratio", type=float, help="share (0..1) of new traces sampled")
+    parser.add_argument("--tenant-limit", action="append", default=[], metavar="TENANT=SPANS_PER_SECOND",
+                        help="sampled traces per second for a tenant (services with a TenantRateLimitedSampler)")
+    parser.add_argument("--log-level", help="threshold of the service logger, e.g. WARNING")
+    parser.add_argument("--unsampled-log-level", help="drop records of unsampled traces below this level, NONE for off")
+    parser.add_argument("--exception-mode", choices=["full", "first_n", "summary", "off"])
+    parser.add_argument("--exception-full-per-interval", type=int, help="stacks per fingerprint per interval (first_n)")
+    parser.add_argument("--emit-policy", choices=["all", "dedup", "log", "event"],
+                        help="where log_msg messages go: log records, span events or both")
+    parser.add_argument("--reset-latency", action="store_true", help="start the latency percentiles over")
+    parser.add_argument("--timeout", type=float, default=5)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    request = build_request(args)
+    with grpc.insecure_channel(args.target) as channel:
+        stub = helloworld_pb2_grpc.TelemetryAdminStub(channel)
+        if request.ListFields():
+            status = stub.SetTelemetry(request, timeout=args.timeout)
+        else:
+            status = stub.GetTelemetry(request, timeout=args.timeout)
+    print(json_format.MessageToJson(status, preserving_proto_field_name=True))
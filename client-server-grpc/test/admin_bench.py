@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# cost of telemetry at the settings TelemetryAdmin can change at runtime. the server (a child process, with
+# admin=True) exports traces and logs to an in-process OTLP sink; every request logs twice, has a work span with
+# ~--work-ms of CPU and records an exception raised a few frames deep. between phases the settings are changed
+# with SetTelemetry on the running server, no restart:
+#   full      sampling ratio 1, logs at ERROR, exceptions with full stacks
+#   reduced   ratio 0.1, logs of unsampled traces dropped, stacks only for the first 5 per fingerprint a minute
+#   minimal   ratio 0, service logger at CRITICAL, exceptions not recorded
+# per phase it reports requests/s, server CPU ms per request (/proc, Linux), client p50/p99, spans and log
+# records exported per request, and the requests the server counted since its latency was reset for the phase.
+# run from client-server-grpc: PYTHONPATH=. python test/admin_bench.py [--duration 5] [--threads 8] [--work-ms 1]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+PHASES = {
+    "full": dict(sampling_ratio=1.0, log_level="ERROR", unsampled_log_level="NONE", exception_mode="full"),
+    "reduced": dict(sampling_ratio=0.1, log_level="ERROR", unsampled_log_level="CRITICAL", exception_mode="first_n",
+                    exception_full_per_interval=5),
+    "minimal": dict(sampling_ratio=0.0, log_level="CRITICAL", unsampled_log_level="NONE", exception_mode="off"),
+}
+PAYLOAD = json.dumps({"src": "client", "tenant": "tenant1", "items": list(range(50))})
+
+
+def child(args):
+    import tracing_lib
+
+    class TelemetryHeavyHandler(tracing_lib.HelloHandler):
+        def work(self):
+            with self.tracer.start_as_current_span("work") as span:
+                end = time.thread_time() + args.work_ms / 1000
+                while time.thread_time() < end:
+                    pass
+                try:
+                    self.validate(json.loads(PAYLOAD))
+                except ValueError as e:
+                    tracing_lib.record_exception(span, e)
+
+        def validate(self, payload):
+            self.check_items(payload["items"])
+
+        def check_items(self, items):
+            if len(items) > 10:
+                raise ValueError(f"too many items: {len(items)}")
+
+    tracing_lib.diagnostics.stream = open(os.devnull, "w")
+    tracer, logger, _, stats = tracing_lib.grpc_otel_config(service_name="admin_bench", traces=True, logs=True,
+                                                            metrics=False)
+    logger.propagate = False
+    handler = TelemetryHeavyHandler("admin_bench", tracer=tracer, logger=logger, stats=stats)
+    server = tracing_lib.create_grpc_server(0, handler, admin=True)
+    server.wait_for_termination()
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime, fields 14 and 15 counting from 1
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0
+
+
+def run_phase(target, admin, args):
+    import tracing_lib
+
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.duration
+
+    def worker(idx):
+        request = tracing_lib.make_request("admin_bench", "tenant1", str(idx))
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            tracing_lib.channel_pool.invoke(target, "SayHello", request, timeout=30)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(idx,)) for idx in range(args.threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies
+
+
+def main(args):
+    import grpc
+    import helloworld_pb2
+    import helloworld_pb2_grpc
+    import otlp_sink
+
+    sink = otlp_sink.OtlpSink().start()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, HERE, os.environ.get("PYTHONPATH", "")]),
+               PYTHONUNBUFFERED="1", OTEL_TEST_EXPORT_PROFILE="latency", OTEL_TEST_EXPORT_SERVER=sink.host,
+               OTEL_TEST_EXPORT_HTTP_PORT=str(sink.http_port), OTEL_TEST_EXPORT_GRPC_PORT=str(sink.grpc_port))
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--work-ms", str(args.work_ms)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    port = None
+    for line in proc.stdout:
+        if line.startswith("Server started"):
+            port = int(line.split()[-1])
+            break
+    target = f"localhost:{port}"
+    channel = grpc.insecure_channel(target)
+    admin = helloworld_pb2_grpc.TelemetryAdminStub(channel)
+    print(f"{args.threads} threads, {args.duration}s per phase, {args.work_ms}ms CPU per request")
+    print(f"{'phase':8s} {'req/s':>7s} {'cpu_ms':>7s} {'p50_ms':>7s} {'p99_ms':>7s} {'spans/req':>9s} "
+          f"{'logs/req':>8s} {'srv_count':>9s}")
+    try:
+        for name, settings in PHASES.items():
+            status = admin.SetTelemetry(helloworld_pb2.TelemetryRequest(reset_latency=True, **settings), timeout=5)
+            # let the previous phase's telemetry reach the sink before counting this one
+            time.sleep(1)
+            sink.reset()
+            cpu = cpu_seconds(status.pid)
+            latencies = run_phase(target, admin, args)
+            cpu = cpu_seconds(status.pid) - cpu
+            time.sleep(1)
+            counts = sink.counts()
+            status = admin.GetTelemetry(helloworld_pb2.TelemetryRequest(), timeout=5)
+            requests = len(latencies)
+            print(f"{name:8s} {requests / args.duration:7.0f} {cpu / requests * 1000:7.2f} "
+                  f"{percentile(latencies, 0.5):7.2f} {percentile(latencies, 0.99):7.2f} "
+                  f"{counts['spans'] / requests:9.2f} {counts['logs'] / requests:8.2f} "
+                  f"{sum(latency.count for latency in status.latency):9d}")
+        print(f"last status: sampler {status.sampler}, pools "
+              + ", ".join(f"{p.name} {p.busy}/{p.size} busy {p.queued} queued" for p in status.pools)
+              + ", export queues " + ", ".join(f"{q.signal} {q.depth}/{q.capacity}" for q in status.export_queues))
+    finally:
+        channel.close()
+        proc.terminate()
+        proc.wait()
+        sink.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="telemetry cost at the settings TelemetryAdmin changes at runtime")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of load per phase")
+    parser.add_argument("--threads", type=int, default=8, help="client threads, closed loop")
+    parser.add_argument("--work-ms", type=float, default=1, help="server CPU milliseconds per request")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
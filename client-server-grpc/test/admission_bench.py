@@ -0,0 +1,152 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+# server behaviour under overload with and without tracing_lib.AdmissionController.
+# the server (a child process) burns --work-ms of CPU per request, so with the GIL its latency grows with the
+# number of requests running at once. the parent sends an open loop of --rps (above what the server can do)
+# from two tenants, "heavy" sending --heavy-share of the requests and "light" the rest, each with a --deadline.
+# per configuration and tenant it reports requests served, shed (RESOURCE_EXHAUSTED), timed out, and the
+# p50/p99 latency of the served ones.
+#   unbounded      the original server: 10 threads, requests queue without limit
+#   aimd/gradient  adaptive limit with one FIFO queue
+#   gradient_fair  adaptive limit with per-tenant round-robin queues
+# client and server each want a core; on a single CPU the load generator's own scheduling delay shows up in the
+# latencies (measured from the scheduled send time), compare served/shed/timeout counts first.
+# run from client-server-grpc: PYTHONPATH=. python test/admission_bench.py [--rps 300] [--duration 10]
+
+CONFIGS = ["unbounded", "aimd", "gradient", "gradient_fair"]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def child(args):
+    import tracing_lib
+
+    class BurnHandler(tracing_lib.HelloHandler):
+        def SayHello(self, request, context):
+            # CPU time of this thread, so requests running at once share the GIL and each takes longer
+            end = time.thread_time() + args.work_ms / 1000
+            while time.thread_time() < end:
+                pass
+            return self.handle_message(request.src, request.tenant, request.msg_id)
+
+    admission = None
+    if args.child != "unbounded":
+        algorithm = "aimd" if args.child == "aimd" else "gradient"
+        limit = tracing_lib.ConcurrencyLimit(algorithm=algorithm, latency_threshold_ms=args.work_ms * 4, window=0.5)
+        fair = args.child == "gradient_fair"
+        # fair queuing also caps each tenant's share of the queue, so the heavy tenant can't fill it on its own
+        admission = tracing_lib.AdmissionController(limit=limit, max_queue=20, max_queue_per_tenant=10 if fair else None,
+                                                    queue_timeout=args.deadline / 4, fair=fair)
+    server = tracing_lib.create_grpc_server(0, BurnHandler("bench"), admission)
+    signal.signal(signal.SIGTERM, lambda *_: server.stop(0))
+    try:
+        server.wait_for_termination()
+    finally:
+        if admission is not None:
+            print(f"LIMIT {admission.limit.current()}", flush=True)
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def run_config(config, args):
+    import grpc
+    import tracing_lib
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(HERE), os.environ.get("PYTHONPATH", "")]),
+               PYTHONUNBUFFERED="1")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", config, "--work-ms", str(args.work_ms),
+           "--deadline", str(args.deadline)]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, text=True)
+    port = None
+    for line in proc.stdout:
+        if line.startswith("Server started"):
+            port = int(line.split()[-1])
+            break
+    results = {tenant: {"ok": [], "shed": 0, "timeout": 0, "other": 0} for tenant in ("heavy", "light")}
+    lock = threading.Lock()
+    pending = []
+
+    def on_done(future, tenant, scheduled):
+        latency = time.perf_counter() - scheduled
+        with lock:
+            if future.exception() is None:
+                results[tenant]["ok"].append(latency)
+            elif future.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+                results[tenant]["shed"] += 1
+            elif future.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                results[tenant]["timeout"] += 1
+            else:
+                results[tenant]["other"] += 1
+
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        stub = tracing_lib.greeter_stub(channel)
+        grpc.channel_ready_future(channel).result(timeout=10)
+        interval = 1.0 / args.rps
+        scheduled = time.perf_counter()
+        stop_at = scheduled + args.duration
+        idx = 0
+        while scheduled < stop_at:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # every 1/(1-heavy_share)-th request is from the light tenant
+            tenant = "light" if (idx * (1 - args.heavy_share)) % 1 + (1 - args.heavy_share) >= 1 else "heavy"
+            future = stub.SayHello.future(tracing_lib.make_request("bench", tenant, str(idx)), timeout=args.deadline)
+            future.add_done_callback(lambda f, t=tenant, s=scheduled: on_done(f, t, s))
+            pending.append(future)
+            scheduled += interval
+            idx += 1
+        for future in pending:
+            try:
+                future.result()
+            except grpc.RpcError:
+                pass
+    proc.terminate()
+    limit = None
+    for line in proc.stdout:
+        if line.startswith("LIMIT "):
+            limit = int(line.split()[1])
+    proc.wait()
+    return results, limit
+
+
+def main(args):
+    print(f"{args.rps} req/s for {args.duration}s, {args.work_ms}ms CPU per request, deadline {args.deadline}s")
+    print(f"{'config':14s} {'tenant':6s} {'served':>7s} {'shed':>6s} {'timeout':>8s} {'p50_ms':>8s} {'p99_ms':>8s}")
+    for config in args.configs.split(","):
+        results, limit = run_config(config, args)
+        for tenant, r in results.items():
+            print(f"{config:14s} {tenant:6s} {len(r['ok']):7d} {r['shed']:6d} {r['timeout'] + r['other']:8d} "
+                  f"{percentile(r['ok'], 0.5):8.1f} {percentile(r['ok'], 0.99):8.1f}")
+        if limit is not None:
+            print(f"{config:14s} final concurrency limit {limit}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="overload behaviour with and without admission control")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="comma separated subset of " + ",".join(CONFIGS))
+    parser.add_argument("--rps", type=float, default=300, help="offered load, requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--work-ms", type=float, default=5, help="CPU milliseconds per request")
+    parser.add_argument("--deadline", type=float, default=2, help="client deadline in seconds")
+    parser.add_argument("--heavy-share", type=float, default=0.8, help="fraction of requests from the heavy tenant")
+    parser.add_argument("--child", choices=CONFIGS, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
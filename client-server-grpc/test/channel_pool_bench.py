@@ -0,0 +1,106 @@
+import argparse
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from opentelemetry import trace
+from opentelemetry.instrumentation import grpc as grpc_instrumentation
+from opentelemetry.sdk.trace import TracerProvider
+
+import helloworld_pb2
+import helloworld_pb2_grpc
+import tracing_lib
+
+# local two-service benchmark: client -> forwarder (service1 role) -> echo (service2 role).
+# compares the forwarder opening a channel per request (the old service1 code) with tracing_lib.ChannelPool.
+# grpc instrumentation is on (spans are created but not exported), so interceptor wiring cost is included.
+# run from client-server-grpc: PYTHONPATH=. python test/channel_pool_bench.py [--seconds 5] [--threads 8]
+
+
+class Echo(helloworld_pb2_grpc.GreeterServicer):
+    def SayHello(self, request, context):
+        return helloworld_pb2.HelloReply(message=request.msg_id)
+
+
+class Forwarder(helloworld_pb2_grpc.GreeterServicer):
+    def __init__(self, target, pool=None):
+        self.target = target
+        self.pool = pool
+
+    def SayHello(self, request, context):
+        if self.pool is not None:
+            return self.pool.invoke(self.target, "SayHello", request, timeout=30)
+        with grpc.insecure_channel(self.target) as channel:
+            return helloworld_pb2_grpc.GreeterStub(channel).SayHello(request, timeout=30)
+
+
+def serve(servicer):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    helloworld_pb2_grpc.add_GreeterServicer_to_server(servicer, server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    return server, f"localhost:{port}"
+
+
+def drive(target, seconds, threads):
+    pool = tracing_lib.ChannelPool()
+    latencies = []
+    errors = [0]
+    stop_at = time.perf_counter() + seconds
+
+    def worker(idx):
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                pool.invoke(target, "SayHello", tracing_lib.make_request("bench", "tenant1", str(idx)), timeout=30)
+                latencies.append(time.perf_counter() - start)
+            except grpc.RpcError:
+                errors[0] += 1
+
+    workers = [threading.Thread(target=worker, args=(idx,)) for idx in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    pool.close()
+    latencies.sort()
+    return latencies, errors[0]
+
+
+def report(name, latencies, errors, seconds):
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float("nan")
+    print(f"{name:24s} {len(latencies) / seconds:8.0f} req/s  p50={pct(0.5):6.2f}ms  p99={pct(0.99):6.2f}ms  errors={errors}")
+
+
+def run(name, pool, seconds, threads):
+    echo_server, echo_target = serve(Echo())
+    forward_server, forward_target = serve(Forwarder(echo_target, pool))
+    drive(forward_target, 0.5, threads)
+    latencies, errors = drive(forward_target, seconds, threads)
+    report(name, latencies, errors, seconds)
+    forward_server.stop(0)
+    echo_server.stop(0)
+    if pool is not None:
+        pool.close()
+
+
+def main(args):
+    trace.set_tracer_provider(TracerProvider())
+    grpc_instrumentation.GrpcInstrumentorServer().instrument()
+    grpc_instrumentation.GrpcInstrumentorClient().instrument()
+    run("channel per request", None, args.seconds, args.threads)
+    run("pooled, size=1", tracing_lib.ChannelPool(size=1), args.seconds, args.threads)
+    run("pooled, size=4", tracing_lib.ChannelPool(size=4), args.seconds, args.threads)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="per-request channels against tracing_lib.ChannelPool")
+    parser.add_argument("--seconds", type=float, default=5, help="seconds of load per configuration")
+    parser.add_argument("--threads", type=int, default=8, help="client threads")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
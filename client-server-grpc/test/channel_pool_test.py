@@ -0,0 +1,96 @@
+import asyncio
+import time
+from concurrent import futures
+
+import grpc
+import pytest
+
+import helloworld_pb2
+import helloworld_pb2_grpc
+import tracing_lib
+
+# tracing_lib.ChannelPool/AioChannelPool.reconnect: a channel replaced after an UNAVAILABLE error is not closed
+# under the calls still running on it, they complete, and the next call goes out on the new channel. hedged
+# attempts failing with UNAVAILABLE replace their channel too.
+# run from client-server-grpc: python -m pytest test/channel_pool_test.py
+
+
+class SlowGreeter(helloworld_pb2_grpc.GreeterServicer):
+    def SayHello(self, request, context):
+        time.sleep(0.5)
+        return helloworld_pb2.HelloReply(message=f"Hello {request.msg_id}")
+
+
+def start_server():
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    helloworld_pb2_grpc.add_GreeterServicer_to_server(SlowGreeter(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, f"127.0.0.1:{port}"
+
+
+def test_reconnect_keeps_calls_in_flight():
+    server, target = start_server()
+    pool = tracing_lib.ChannelPool()
+    try:
+        request = tracing_lib.make_request("test", "tenant1", "1")
+        stub = pool.get_stub(target)
+        in_flight = stub.SayHello.future(request, timeout=5)
+        time.sleep(0.1)
+        pool.reconnect(target, stub)
+        assert pool.get_stub(target) is not stub
+        assert in_flight.result().message
+        assert pool.invoke(target, "SayHello", request, timeout=5).message
+    finally:
+        pool.close()
+        server.stop(0)
+
+
+def test_aio_reconnect_keeps_calls_in_flight():
+    server, target = start_server()
+
+    async def run():
+        pool = tracing_lib.AioChannelPool()
+        request = tracing_lib.make_request("test", "tenant1", "1")
+        stub = pool.get_stub(target)
+        in_flight = asyncio.ensure_future(stub.SayHello(request, timeout=5))
+        await asyncio.sleep(0.1)
+        await pool.reconnect(target, stub)
+        assert pool.get_stub(target) is not stub
+        assert (await in_flight).message
+        assert (await pool.invoke(target, "SayHello", request, timeout=5)).message
+        await asyncio.gather(*pool.closing)
+        await pool.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.stop(0)
+
+
+def test_hedged_attempt_unavailable_reconnects():
+    # nothing listens on the port, every attempt fails fast with UNAVAILABLE
+    server, target = start_server()
+    server.stop(0)
+    request = tracing_lib.make_request("test", "tenant1", "1")
+    pool = tracing_lib.ChannelPool()
+    try:
+        stub = pool.get_stub(target)
+        with pytest.raises(grpc.RpcError) as e:
+            pool.hedged_invoke(target, "SayHello", request, tracing_lib.HedgePolicy(), timeout=5)
+        assert e.value.code() == grpc.StatusCode.UNAVAILABLE
+        assert pool.get_stub(target) is not stub
+    finally:
+        pool.close()
+
+    async def run():
+        pool = tracing_lib.AioChannelPool()
+        stub = pool.get_stub(target)
+        with pytest.raises(grpc.aio.AioRpcError) as e:
+            await pool.hedged_invoke(target, "SayHello", request, tracing_lib.HedgePolicy(), timeout=5)
+        assert e.value.code() == grpc.StatusCode.UNAVAILABLE
+        assert pool.get_stub(target) is not stub
+        await asyncio.gather(*pool.closing)
+        await pool.close()
+
+    asyncio.run(run())
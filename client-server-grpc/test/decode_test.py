@@ -0,0 +1,51 @@
+from concurrent import futures
+
+import grpc
+import pytest
+
+import helloworld_pb2
+import helloworld_pb2_grpc
+import tracing_lib
+
+# tracing_lib.decode_request: typed fields, the legacy str(dict) `name` payload (unquoted scalars kept as str),
+# and bad payloads, which the server answers with INVALID_ARGUMENT instead of a traceback.
+# run from client-server-grpc: python -m pytest test/decode_test.py
+
+
+def test_typed_and_legacy():
+    typed = helloworld_pb2.HelloRequest(src="client")
+    assert tracing_lib.decode_request(typed) == ("client", "", "")
+    legacy = helloworld_pb2.HelloRequest(name=str({"src": "client", "tenant": "t1", "msg_id": 5}))
+    assert tracing_lib.decode_request(legacy) == ("client", "t1", "5")
+    quoted = helloworld_pb2.HelloRequest(name=str({"src": 'say "hi"', "tenant": "t1", "msg_id": None}))
+    assert tracing_lib.decode_request(quoted) == ('say "hi"', "t1", "None")
+    nested = helloworld_pb2.HelloRequest(name=str({"src": "client", "tenant": "t1", "meta": {"k": 1}}))
+    assert tracing_lib.decode_request(nested) == ("client", "t1", "")
+    both = tracing_lib.make_request("client", "t2", "7", legacy=True)
+    assert tracing_lib.decode_request(both) == ("client", "t2", "7")
+
+
+@pytest.mark.parametrize("name", ['"x"', 'garbage"', "hello", "['a', 'b']", '{"src": "a"', "{garbage}",
+                                  "{'src': 'a' junk}", "{'src': 'a', garbage}", "{'src': 'a'}x"])
+def test_bad_legacy_payload(name):
+    request = helloworld_pb2.HelloRequest(name=name)
+    with pytest.raises(tracing_lib.InvalidRequest):
+        tracing_lib.decode_request(request)
+    assert tracing_lib.request_tenant(request) == "unknown"
+
+
+def test_server_rejects_bad_payload():
+    handler = tracing_lib.HelloHandler("decode_test")
+    handler.work = lambda: None
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    helloworld_pb2_grpc.add_GreeterServicer_to_server(handler, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = tracing_lib.greeter_stub(channel)
+            with pytest.raises(grpc.RpcError) as e:
+                stub.SayHello(helloworld_pb2.HelloRequest(name='"x"'), timeout=5)
+    finally:
+        server.stop(0)
+    assert e.value.code() == grpc.StatusCode.INVALID_ARGUMENT
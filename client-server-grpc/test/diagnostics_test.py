@@ -0,0 +1,75 @@
+import io
+import logging
+import threading
+import time
+
+import tracing_lib
+
+# tracing_lib.DiagnosticsSink: output is written on the writer thread, but log records carry the caller's time,
+# thread and source location, and a full queue drops and counts instead of blocking.
+# run from client-server-grpc: python -m pytest test/diagnostics_test.py
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record, threading.current_thread().name))
+
+
+def test_log_record_made_by_caller():
+    sink = tracing_lib.DiagnosticsSink()
+    logger = logging.getLogger("diagnostics_test")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = ListHandler()
+    logger.addHandler(handler)
+    try:
+        before = time.time()
+        sink.submit(time.sleep, 0.2)
+        sink.log(logger, logging.INFO, "request %s", 1)
+        sink.log(logger, logging.DEBUG, "skipped")
+        assert sink.flush()
+    finally:
+        logger.removeHandler(handler)
+    [(record, written_on)] = handler.records
+    assert written_on == "diagnostics-sink"
+    assert record.getMessage() == "request 1"
+    assert record.threadName == threading.current_thread().name
+    assert record.funcName == "test_log_record_made_by_caller"
+    assert record.pathname == __file__
+    # made before the writer was done sleeping
+    assert before <= record.created < before + 0.2
+
+
+def test_emit_reports_its_caller(monkeypatch):
+    sink = tracing_lib.DiagnosticsSink()
+    monkeypatch.setattr(tracing_lib, "diagnostics", sink)
+    monkeypatch.setattr(tracing_lib.emit_policy, "state", tracing_lib.EmitPolicy("log").state)
+    logger = logging.getLogger("diagnostics_test.emit")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = ListHandler()
+    logger.addHandler(handler)
+    try:
+        tracing_lib.emit(logger, logging.INFO, "hello")
+        assert sink.flush()
+    finally:
+        logger.removeHandler(handler)
+    [(record, _)] = handler.records
+    assert record.funcName == "test_emit_reports_its_caller"
+
+
+def test_full_queue_drops():
+    sink = tracing_lib.DiagnosticsSink(max_queue=1, stream=io.StringIO())
+    release = threading.Event()
+    sink.submit(release.wait)
+    time.sleep(0.1)
+    assert sink.print("queued")
+    assert not sink.print("dropped")
+    assert sink.dropped == 1
+    release.set()
+    assert sink.flush()
+    assert sink.stream.getvalue() == "queued\n"
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# telemetry exported per request under each tracing_lib.EMIT_POLICIES policy. per policy a child process exports
+# traces and logs to an in-process OTLP sink and runs --requests requests shaped like Service2's: a request span
+# with HelloHandler.process's two log_msg calls and a child span with one more, --ratio of the traces sampled.
+# per policy it reports the OTLP bytes, spans and log records received per request, the child's CPU per request,
+# messages the diagnostics queue dropped, and the bytes saved against "all" (every message as a log record and a
+# span event).
+# run from client-server-grpc: PYTHONPATH=. python test/emit_bench.py [--requests 5000] [--ratio 0.5] [--policies all,dedup,log,event]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def child(args):
+    from opentelemetry import _logs
+    from opentelemetry import trace
+
+    import tracing_lib
+
+    tracing_lib.diagnostics.stream = open(os.devnull, "w")
+    tracer, logger, _, stats = tracing_lib.grpc_otel_config(service_name="emit_bench", traces=True, logs=True,
+                                                            metrics=False, sampling_ratio=args.ratio,
+                                                            emit=args.policy)
+    logger.propagate = False
+    handler = tracing_lib.HelloHandler("emit_bench", tracer=tracer, logger=logger, stats=stats)
+    request_from = "client -> emit_bench"
+    cpu = time.process_time()
+    for idx in range(args.requests):
+        with tracer.start_as_current_span("SayHello") as span:
+            handler.log_msg(span, "request from : %s, %s, %s", request_from, "tenant1", idx)
+            with tracer.start_as_current_span("child-span") as child_span:
+                handler.log_msg(child_span, "Starting child-span")
+            handler.log_msg(span, "got response %s, %s, %s", request_from, "tenant1", idx)
+        # console lines and log records go through the diagnostics queue, which drops when a tight loop outruns
+        # its writer; a server's requests are further apart
+        tracing_lib.diagnostics.flush()
+    trace.get_tracer_provider().force_flush()
+    _logs.get_logger_provider().force_flush()
+    print(json.dumps({"cpu": time.process_time() - cpu, "dropped": tracing_lib.diagnostics.dropped}))
+
+
+def main(args):
+    import otlp_sink
+
+    sink = otlp_sink.OtlpSink().start()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, HERE, os.environ.get("PYTHONPATH", "")]),
+               OTEL_TEST_EXPORT_PROFILE="throughput", OTEL_TEST_EXPORT_SERVER=sink.host,
+               OTEL_TEST_EXPORT_HTTP_PORT=str(sink.http_port), OTEL_TEST_EXPORT_GRPC_PORT=str(sink.grpc_port))
+    print(f"{args.requests} requests, 3 messages each, sampling ratio {args.ratio}")
+    print(f"{'policy':7s} {'bytes/req':>9s} {'spans/req':>9s} {'logs/req':>8s} {'cpu_ms':>7s} {'dropped':>7s} {'saved':>6s}")
+    baseline = None
+    try:
+        for policy in args.policies.split(","):
+            sink.reset()
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--policy", policy,
+                   "--requests", str(args.requests), "--ratio", str(args.ratio)]
+            out = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            # the child flushed before exiting, give the sink a moment to finish counting
+            time.sleep(0.5)
+            counts = sink.counts()
+            per_request = counts["bytes"] / args.requests
+            baseline = per_request if baseline is None and policy == "all" else baseline
+            saved = f"{(1 - per_request / baseline) * 100:5.1f}%" if baseline else ""
+            print(f"{policy:7s} {per_request:9.0f} {counts['spans'] / args.requests:9.2f} "
+                  f"{counts['logs'] / args.requests:8.2f} {result['cpu'] / args.requests * 1000:7.3f} {result['dropped']:7d} {saved:>6s}")
+    finally:
+        sink.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="export bytes per request under each emit policy")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--ratio", type=float, default=0.5, help="share of traces sampled")
+    parser.add_argument("--policies", default="all,dedup,log,event", help="comma separated, all first for 'saved'")
+    parser.add_argument("--policy", help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
@@ -0,0 +1,80 @@
+import logging
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.sampling import ALWAYS_OFF
+
+import tracing_lib
+
+# tracing_lib.emit and EmitPolicy: each message goes to the sinks its level and its span's sampling state pick,
+# formatted once (the console line, the log record and the span event are the same string), and never to a span
+# event of an unsampled span.
+# run from client-server-grpc: python -m pytest test/emit_test.py
+
+
+class Recorder:
+    def __init__(self):
+        self.printed, self.logged = [], []
+
+    def print(self, msg, *args):
+        self.printed.append(msg % args if args else msg)
+
+    def log(self, _logger, level, msg, *args, stacklevel=1):
+        self.logged.append((level, msg % args if args else msg))
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(tracing_lib, "diagnostics", recorder)
+    yield recorder
+    tracing_lib.emit_policy.configure("all")
+
+
+def emit_all(tracer, logger):
+    with tracer.start_as_current_span("request") as span:
+        tracing_lib.emit(logger, logging.ERROR, "request %s", 1, span=span, prefix="svc - ")
+        tracing_lib.emit(logger, logging.CRITICAL, "failed")
+    return span
+
+
+@pytest.mark.parametrize("policy, sampled_events, sampled_logs, unsampled_logs", [
+    ("all", 2, 2, 2),
+    ("dedup", 2, 1, 2),
+    ("log", 0, 2, 2),
+    ("event", 2, 0, 0),
+])
+def test_policies(recorder, policy, sampled_events, sampled_logs, unsampled_logs):
+    tracing_lib.emit_policy.configure(policy)
+    logger = logging.getLogger("emit_test")
+    logger.setLevel(logging.INFO)
+
+    span = emit_all(TracerProvider().get_tracer("emit_test"), logger)
+    assert [event.name for event in span.events] == ["svc - request 1", "failed"][:sampled_events]
+    assert len(recorder.logged) == sampled_logs
+    assert recorder.printed == ["svc - request 1", "failed"]
+    if sampled_logs:
+        assert recorder.logged[-1] == (logging.CRITICAL, "failed")
+
+    recorder.logged.clear()
+    emit_all(TracerProvider(sampler=ALWAYS_OFF).get_tracer("emit_test"), logger)
+    assert len(recorder.logged) == unsampled_logs
+
+
+def test_default_sends_both():
+    assert tracing_lib.EmitPolicy().name == "all"
+    assert tracing_lib.EmitPolicy().sinks(logging.INFO, True) == {"console", "log", "event"}
+
+
+def test_custom_rules():
+    policy = tracing_lib.EmitPolicy({logging.NOTSET: ((), ()), logging.WARNING: (("event",), ("log", "event"))})
+    assert policy.name == "custom"
+    assert policy.sinks(logging.INFO, True) == frozenset()
+    assert policy.sinks(logging.ERROR, True) == {"event"}
+    # an unsampled span's events are never exported
+    assert policy.sinks(logging.ERROR, False) == {"log"}
+    with pytest.raises(ValueError):
+        policy.configure({logging.NOTSET: (("stdout",), ())})
+    with pytest.raises(ValueError):
+        policy.configure("verbose")
+    assert policy.name == "custom"
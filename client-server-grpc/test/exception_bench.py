@@ -0,0 +1,45 @@
+import sys
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+
+import tracing_lib
+
+# CPU per recorded exception at a high error rate (every request fails the same way, as in Service2.handle_message):
+# span.record_exception vs tracing_lib.ExceptionRecorder in each mode. each request gets its own span.
+# run from client-server-grpc: PYTHONPATH=. python test/exception_bench.py [requests]
+
+
+def handle(depth=3):
+    # a few frames, like a failing call inside a handler
+    if depth:
+        return handle(depth - 1)
+    raise ValueError("Invalid input")
+
+
+def run(tracer, record, requests):
+    cpu = time.process_time()
+    for _ in range(requests):
+        with tracer.start_as_current_span("request") as span:
+            try:
+                handle()
+            except ValueError as e:
+                record(span, e)
+    return (time.process_time() - cpu) / requests * 1e6
+
+
+def baseline(tracer, requests):
+    # raising and catching without recording, subtracted to get the recording cost
+    return run(tracer, lambda span, e: None, requests)
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    tracer = TracerProvider().get_tracer("exception_bench")
+    base = baseline(tracer, requests)
+    sdk = run(tracer, lambda span, e: span.record_exception(e), requests) - base
+    print(f"{'span.record_exception':24s} {sdk:8.2f} us/request")
+    for mode in tracing_lib.ExceptionRecorder.MODES:
+        recorder = tracing_lib.ExceptionRecorder(mode=mode)
+        cost = run(tracer, recorder.record, requests) - base
+        print(f"{'recorder ' + mode:24s} {cost:8.2f} us/request  ({(sdk - cost) / sdk * 100:5.1f}% saved)")
@@ -0,0 +1,44 @@
+import threading
+
+import tracing_lib
+
+# tracing_lib.ContextExecutor.occupancy: busy, queued and rejected tasks are counted by the executor itself, and
+# TelemetryAdmin reports them for every pool, the grpc server's included (max_queue=None, which never rejects).
+# run from client-server-grpc: python -m pytest test/executor_test.py
+
+
+def test_occupancy():
+    pool = tracing_lib.ContextExecutor(max_workers=2, max_queue=3, name="executor_test")
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def task():
+        started.release()
+        release.wait()
+
+    try:
+        futures = [pool.submit(task) for _ in range(4)]
+        assert futures[-1] is None
+        started.acquire()
+        started.acquire()
+        assert pool.occupancy() == (2, 2, 1, 1)
+        status = tracing_lib.TelemetryAdmin(pools={"server": pool}).status()
+        server = [(p.size, p.busy, p.queued, p.rejected) for p in status.pools if p.name == "server"]
+        assert server == [(2, 2, 1, 1)]
+    finally:
+        release.set()
+        pool.shutdown()
+    assert pool.occupancy() == (2, 0, 0, 1)
+
+
+def test_unbounded_never_rejects():
+    pool = tracing_lib.ContextExecutor(max_workers=1, max_queue=None, name="executor_test")
+    release = threading.Event()
+    try:
+        futures = [pool.submit(release.wait) for _ in range(100)]
+        assert all(future is not None for future in futures)
+        _, busy, queued, rejected = pool.occupancy()
+        assert (busy + queued, rejected) == (100, 0)
+    finally:
+        release.set()
+        pool.shutdown()
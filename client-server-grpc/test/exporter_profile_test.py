@@ -0,0 +1,51 @@
+import logging
+
+from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+from opentelemetry.sdk._logs.export import SimpleLogRecordProcessor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+import tracing_lib
+from otlp_sink import OtlpSink
+
+# tracing_lib.ExporterProfile: the HTTP trace and log exporters share one requests.Session, shutting down one
+# provider leaves the connection to the other, and shutdown_telemetry closes the session once both are done.
+# run from client-server-grpc: python -m pytest test/exporter_profile_test.py
+
+
+def connections(session):
+    return len(session.get_adapter("http://").poolmanager.pools)
+
+
+def test_shared_session_outlives_first_shutdown(monkeypatch):
+    sink = OtlpSink().start()
+    profile = tracing_lib.ExporterProfile("default", server=sink.host, http_port=sink.http_port,
+                                          grpc_port=sink.grpc_port)
+    tracer_provider = TracerProvider(shutdown_on_exit=False)
+    tracer_provider.add_span_processor(SimpleSpanProcessor(profile.span_exporter()))
+    logger_provider = LoggerProvider(shutdown_on_exit=False)
+    logger_provider.add_log_record_processor(SimpleLogRecordProcessor(profile.log_exporter()))
+    logger = logging.getLogger("exporter_profile_test")
+    logger.propagate = False
+    handler = LoggingHandler(logger_provider=logger_provider)
+    logger.addHandler(handler)
+    session = profile.session
+    try:
+        assert session in tracing_lib.http_sessions
+        tracer_provider.get_tracer("exporter_profile_test").start_span("request").end()
+        logger.error("first")
+        assert connections(session) == 1
+        tracer_provider.shutdown()
+        assert connections(session) == 1
+        logger.error("second")
+        assert sink.wait_for("logs", 2)
+
+        monkeypatch.setattr(tracing_lib.trace, "get_tracer_provider", lambda: tracer_provider)
+        monkeypatch.setattr(tracing_lib._logs, "get_logger_provider", lambda: logger_provider)
+        monkeypatch.setattr(tracing_lib.otel_metrics, "get_meter_provider", lambda: None)
+        tracing_lib.shutdown_telemetry()
+        assert session not in tracing_lib.http_sessions
+        assert connections(session) == 0
+    finally:
+        logger.removeHandler(handler)
+        sink.stop()
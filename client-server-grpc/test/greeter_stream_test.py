@@ -0,0 +1,60 @@
+from concurrent import futures
+
+import grpc
+import pytest
+
+import helloworld_pb2_grpc
+import tracing_lib
+
+# tracing_lib.GreeterStream failures: a call waiting for room in a full window gives up at its timeout with
+# DeadlineExceeded, and calls on a stream the server ends without replying fail with an UNAVAILABLE RpcError.
+# run from client-server-grpc: python -m pytest test/greeter_stream_test.py
+
+
+class SilentGreeter(helloworld_pb2_grpc.GreeterServicer):
+    # reads the messages and never replies, until the client ends the stream
+    def SayHelloStream(self, request_iterator, context):
+        for _ in request_iterator:
+            pass
+        return
+        yield
+
+
+class ClosingGreeter(helloworld_pb2_grpc.GreeterServicer):
+    # ends the stream straight away
+    def SayHelloStream(self, request_iterator, context):
+        return iter(())
+
+
+def start_server(servicer):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    helloworld_pb2_grpc.add_GreeterServicer_to_server(servicer, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, f"127.0.0.1:{port}"
+
+
+def test_full_window_times_out():
+    server, target = start_server(SilentGreeter())
+    stream = tracing_lib.GreeterStream(target, window=1)
+    try:
+        stream.send(tracing_lib.make_request("test", "tenant1", "1"))
+        with pytest.raises(grpc.RpcError) as e:
+            stream.call(tracing_lib.make_request("test", "tenant1", "2"), timeout=0.2)
+        assert e.value.code() == grpc.StatusCode.DEADLINE_EXCEEDED
+    finally:
+        stream.close()
+        server.stop(0)
+
+
+def test_closed_stream_is_unavailable():
+    server, target = start_server(ClosingGreeter())
+    stream = tracing_lib.GreeterStream(target)
+    try:
+        with pytest.raises(grpc.RpcError) as e:
+            stream.call(tracing_lib.make_request("test", "tenant1", "1"), timeout=5)
+        assert e.value.code() == grpc.StatusCode.UNAVAILABLE
+        assert e.value.details()
+    finally:
+        stream.close()
+        server.stop(0)
@@ -0,0 +1,108 @@
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+import helloworld_pb2_grpc
+import tracing_lib
+from service1 import Service1
+
+# tail latency of Service1's call to service2, with and without hedging (tracing_lib.HedgePolicy).
+# service2 is a local stand-in answering after --base-ms, except for a share of slow outliers (--outlier-ms).
+# Service1.handle_message is called directly from --threads client threads, so the 0.5-1.5s sleep in
+# HelloHandler.SayHello does not hide the downstream latency. scenarios:
+#   outliers   --outlier-rate of the requests are slow, the case hedging is for
+#   degraded   half of the requests are slow; the retry budget should keep the extra load near budget_ratio
+# per run it reports call latency percentiles and the downstream requests sent per call (load amplification).
+# run from client-server-grpc: PYTHONPATH=. python test/hedge_bench.py [--calls 2000] [--threads 8]
+
+PERCENTILES = [("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999)]
+
+
+class OutlierHandler(tracing_lib.HelloHandler):
+    def __init__(self, base_ms, outlier_ms, outlier_rate):
+        super().__init__("service2_standin", logger=logging.getLogger("hedge_bench"))
+        self.base_ms = base_ms
+        self.outlier_ms = outlier_ms
+        self.outlier_rate = outlier_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def SayHello(self, request, context):
+        with self.lock:
+            self.requests += 1
+        slow = random.random() < self.outlier_rate
+        time.sleep((self.outlier_ms if slow else self.base_ms) / 1000)
+        return self.handle_message(request.src, request.tenant, request.msg_id)
+
+
+def run(service, downstream, calls, threads):
+    latencies = []
+    lock = threading.Lock()
+    remaining = iter(range(calls))
+
+    def worker():
+        for idx in remaining:
+            start = time.perf_counter()
+            service.handle_message("hedge_bench", "tenant1", str(idx))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    downstream.requests = 0
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    latencies.sort()
+    result = {name: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 for name, q in PERCENTILES}
+    result["amplification"] = downstream.requests / calls
+    return result
+
+
+def main(args):
+    # log_msg is skipped entirely below CRITICAL, and console diagnostics are discarded
+    logging.getLogger("hedge_bench").setLevel(logging.CRITICAL)
+    tracing_lib.diagnostics.stream = open(os.devnull, "w")
+    scenarios = {"outliers": args.outlier_rate, "degraded": 0.5}
+    print(f"service2 stand-in: {args.base_ms}ms, outliers {args.outlier_ms}ms; {args.calls} calls from {args.threads} threads")
+    print(f"{'scenario':9s} {'config':9s} " + " ".join(f"{name + '_ms':>8s}" for name, _ in PERCENTILES)
+          + f" {'sent/call':>9s} {'hedges':>7s} {'wins':>6s}")
+    for scenario, outlier_rate in scenarios.items():
+        downstream = OutlierHandler(args.base_ms, args.outlier_ms, outlier_rate)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=args.threads * 4))
+        helloworld_pb2_grpc.add_GreeterServicer_to_server(downstream, server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        target = f"127.0.0.1:{port}"
+        for config in ["no_hedge", "hedge"]:
+            hedge = tracing_lib.HedgePolicy(budget_ratio=args.budget) if config == "hedge" else None
+            service = Service1("service1", logger=logging.getLogger("hedge_bench"), target=target, hedge=hedge)
+            # warm up the channel and the hedge delay estimate
+            run(service, downstream, min(200, args.calls), args.threads)
+            if hedge is not None:
+                hedge.hedges = hedge.hedge_wins = 0
+            result = run(service, downstream, args.calls, args.threads)
+            print(f"{scenario:9s} {config:9s} " + " ".join(f"{result[name]:8.1f}" for name, _ in PERCENTILES)
+                  + f" {result['amplification']:9.3f} {hedge.hedges if hedge else 0:7d} {hedge.hedge_wins if hedge else 0:6d}")
+        server.stop(0)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="hedged downstream calls against slow outliers")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--base-ms", type=float, default=10)
+    parser.add_argument("--outlier-ms", type=float, default=300)
+    parser.add_argument("--outlier-rate", type=float, default=0.03)
+    parser.add_argument("--budget", type=float, default=0.1, help="HedgePolicy budget_ratio")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
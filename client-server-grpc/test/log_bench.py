@@ -0,0 +1,75 @@
+import contextlib
+import logging
+import os
+import sys
+import time
+
+from opentelemetry import trace
+from opentelemetry.instrumentation.logging import LoggingInstrumentor
+from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+from opentelemetry.sdk._logs.export import BatchLogRecordProcessor, LogExporter, LogExportResult
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+import tracing_lib
+
+# log calls per second through HelloHandler.log_msg and log_lazy, for sampled and unsampled traces,
+# with the default pipeline (LoggingHandler) and the sampling-aware one (SamplingAwareLoggingHandler + log_policy).
+# run from client-server-grpc: PYTHONPATH=. python test/log_bench.py [calls]
+
+
+class DiscardExporter(LogExporter):
+    def export(self, batch):
+        return LogExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=30000):
+        return True
+
+    def shutdown(self):
+        pass
+
+
+def handler_for(mode, logger_provider):
+    if mode == "sampling_aware":
+        tracing_lib.log_policy.unsampled_level = logging.CRITICAL
+        return tracing_lib.SamplingAwareLoggingHandler(logger_provider=logger_provider)
+    tracing_lib.log_policy.unsampled_level = None
+    return LoggingHandler(logger_provider=logger_provider)
+
+
+def rate(fn, calls):
+    start = time.perf_counter()
+    for idx in range(calls):
+        fn(idx)
+    return calls / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    tracer = TracerProvider().get_tracer("log_bench")
+    logger_provider = LoggerProvider()
+    logger_provider.add_log_record_processor(BatchLogRecordProcessor(DiscardExporter()))
+    LoggingInstrumentor().instrument()
+    logger = logging.getLogger("log_bench")
+    logger.propagate = False
+    handler = tracing_lib.HelloHandler("bench", logger=logger)
+    unsampled = NonRecordingSpan(SpanContext(trace_id=0x1, span_id=0x2, is_remote=True, trace_flags=TraceFlags(0)))
+
+    with open(os.devnull, "w") as devnull:
+        for mode in ["default", "sampling_aware"]:
+            log_handler = handler_for(mode, logger_provider)
+            logger.addHandler(log_handler)
+            for sampling in ["sampled", "unsampled"]:
+                if sampling == "sampled":
+                    span_cm = tracer.start_as_current_span("bench")
+                else:
+                    span_cm = trace.use_span(unsampled)
+                with span_cm as span, contextlib.redirect_stdout(devnull):
+                    log_msg = rate(lambda idx: handler.log_msg(span, "request from : %s, %s, %s", "client -> bench", "tenant1", idx), calls)
+                    lazy = rate(lambda idx: tracing_lib.log_lazy(logger, logging.ERROR, "request %s %s", "tenant1", idx), calls)
+                    # log_msg output is written by the diagnostics thread, drain it before the next case
+                    tracing_lib.diagnostics.flush(timeout=60)
+                print(f"{mode:15s} {sampling:10s} log_msg={log_msg:10.0f}/s  log_lazy={lazy:10.0f}/s  "
+                      f"diagnostics_dropped={tracing_lib.diagnostics.dropped}")
+            logger.removeHandler(log_handler)
+    logger_provider.shutdown()
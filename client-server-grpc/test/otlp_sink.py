@@ -0,0 +1,157 @@
+import gzip
+import threading
+import time
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import grpc
+from opentelemetry.proto.collector.logs.v1 import logs_service_pb2, logs_service_pb2_grpc
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2, metrics_service_pb2_grpc
+from opentelemetry.proto.collector.trace.v1 import trace_service_pb2, trace_service_pb2_grpc
+
+# in-process stand-in for an OTLP collector, for benchmarks and tests without network access.
+# accepts OTLP/HTTP (protobuf, optionally gzip) on /v1/traces, /v1/logs, /v1/metrics and OTLP/gRPC for all
+# three signals, and only counts what it receives. stop() and start() again rebind the same ports.
+#
+#   sink = OtlpSink().start()
+#   tracing_lib.configure_tracing(server=sink.host, port=sink.http_port)
+#   ...
+#   sink.counts()  -> {"spans": .., "logs": .., "metric_points": .., "requests": .., "bytes": ..}
+
+REQUESTS = {
+    "/v1/traces": trace_service_pb2.ExportTraceServiceRequest,
+    "/v1/logs": logs_service_pb2.ExportLogsServiceRequest,
+    "/v1/metrics": metrics_service_pb2.ExportMetricsServiceRequest,
+}
+RESPONSES = {
+    "/v1/traces": trace_service_pb2.ExportTraceServiceResponse,
+    "/v1/logs": logs_service_pb2.ExportLogsServiceResponse,
+    "/v1/metrics": metrics_service_pb2.ExportMetricsServiceResponse,
+}
+
+
+def count_items(request):
+    if isinstance(request, trace_service_pb2.ExportTraceServiceRequest):
+        return "spans", sum(len(s.spans) for r in request.resource_spans for s in r.scope_spans)
+    if isinstance(request, logs_service_pb2.ExportLogsServiceRequest):
+        return "logs", sum(len(s.log_records) for r in request.resource_logs for s in r.scope_logs)
+    points = 0
+    for r in request.resource_metrics:
+        for s in r.scope_metrics:
+            for m in s.metrics:
+                data = getattr(m, m.WhichOneof("data"))
+                points += len(data.data_points)
+    return "metric_points", points
+
+
+class OtlpSink:
+    def __init__(self, host="127.0.0.1", http_port=0, grpc_port=0, delay=0.0):
+        self.host = host
+        self.http_port = http_port
+        self.grpc_port = grpc_port
+        # seconds to wait before answering each export, to stand in for a slow collector
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.http_server = None
+        self.grpc_server = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.received = {"spans": 0, "logs": 0, "metric_points": 0, "requests": 0, "bytes": 0}
+
+    def counts(self):
+        with self.lock:
+            return dict(self.received)
+
+    def record(self, request, size):
+        kind, items = count_items(request)
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            self.received[kind] += items
+            self.received["requests"] += 1
+            self.received["bytes"] += size
+
+    # wait until at least `items` of `kind` arrived, returns the count seen
+    def wait_for(self, kind, items, timeout=10):
+        stop_at = time.time() + timeout
+        while time.time() < stop_at:
+            seen = self.counts()[kind]
+            if seen >= items:
+                return seen
+            time.sleep(0.01)
+        return self.counts()[kind]
+
+    def start(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                size = len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                if path not in REQUESTS:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                sink.record(REQUESTS[path].FromString(body), size)
+                response = RESPONSES[path]().SerializeToString()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-protobuf")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((self.host, self.http_port), Handler)
+        self.http_server.daemon_threads = True
+        self.http_port = self.http_server.server_address[1]
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+        class TraceService(trace_service_pb2_grpc.TraceServiceServicer):
+            def Export(self, request, context):
+                sink.record(request, request.ByteSize())
+                return trace_service_pb2.ExportTraceServiceResponse()
+
+        class LogsService(logs_service_pb2_grpc.LogsServiceServicer):
+            def Export(self, request, context):
+                sink.record(request, request.ByteSize())
+                return logs_service_pb2.ExportLogsServiceResponse()
+
+        class MetricsService(metrics_service_pb2_grpc.MetricsServiceServicer):
+            def Export(self, request, context):
+                sink.record(request, request.ByteSize())
+                return metrics_service_pb2.ExportMetricsServiceResponse()
+
+        self.grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        trace_service_pb2_grpc.add_TraceServiceServicer_to_server(TraceService(), self.grpc_server)
+        logs_service_pb2_grpc.add_LogsServiceServicer_to_server(LogsService(), self.grpc_server)
+        metrics_service_pb2_grpc.add_MetricsServiceServicer_to_server(MetricsService(), self.grpc_server)
+        self.grpc_port = self.grpc_server.add_insecure_port(f"{self.host}:{self.grpc_port}")
+        self.grpc_server.start()
+        return self
+
+    def stop(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+        if self.grpc_server is not None:
+            self.grpc_server.stop(0).wait()
+            self.grpc_server = None
+
+
+if __name__ == "__main__":
+    sink = OtlpSink(http_port=4318, grpc_port=4317).start()
+    print(f"otlp sink listening on {sink.host} http={sink.http_port} grpc={sink.grpc_port}")
+    try:
+        while True:
+            time.sleep(10)
+            print(sink.counts())
+    except KeyboardInterrupt:
+        sink.stop()
@@ -0,0 +1,37 @@
+import timeit
+
+import helloworld_pb2
+import tracing_lib
+
+# parse cost per request for the legacy str(dict) payload vs the typed HelloRequest fields.
+# each case includes decoding the wire bytes, as the server does per call.
+# run from client-server-grpc: PYTHONPATH=. python test/parse_bench.py
+
+N = 100000
+
+legacy_wire = tracing_lib.make_request("client -> service1", "tenant1", "12345", legacy=True)
+legacy_wire.ClearField("src")
+legacy_wire.ClearField("tenant")
+legacy_wire.ClearField("msg_id")
+legacy_wire = legacy_wire.SerializeToString()
+typed_wire = tracing_lib.make_request("client -> service1", "tenant1", "12345").SerializeToString()
+
+
+def old_eval():
+    data = eval(helloworld_pb2.HelloRequest.FromString(legacy_wire).name)
+    return data["src"], data["tenant"], data["msg_id"]
+
+
+def compat_legacy():
+    return tracing_lib.decode_request(helloworld_pb2.HelloRequest.FromString(legacy_wire))
+
+
+def typed():
+    return tracing_lib.decode_request(helloworld_pb2.HelloRequest.FromString(typed_wire))
+
+
+if __name__ == "__main__":
+    assert old_eval() == compat_legacy() == typed()
+    for name, fn in [("old eval(name)", old_eval), ("compat legacy name", compat_legacy), ("typed fields", typed)]:
+        best = min(timeit.repeat(fn, number=N, repeat=5))
+        print(f"{name:20s} {best / N * 1e6:8.3f} us/request")
@@ -0,0 +1,157 @@
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+# throughput of a pre-forked server (tracing_lib.start_prefork_server) with 1, 2, 4 and 8 workers.
+# the server (a child process, forking its workers) burns --work-ms of CPU per request, so a single process is
+# capped at one core by the GIL. load comes from --clients client processes, each with --threads threads that
+# have their own connection (SO_REUSEPORT balances per connection) and send closed loop for --duration.
+# per worker count it reports requests/s, the speedup over 1 worker, how long the coordinated shutdown took and,
+# with --traces, the share of server spans that reached the in-process OTLP sink after the shutdown flush.
+# the speedup is bounded by the cores the machine has (os.cpu_count() is printed), client processes included.
+# run from client-server-grpc: PYTHONPATH=. python test/prefork_bench.py [--workers 1,2,4,8] [--duration 10] [--traces]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def server(args):
+    import tracing_lib
+
+    class BurnHandler(tracing_lib.HelloHandler):
+        def SayHello(self, request, context):
+            end = time.thread_time() + args.work_ms / 1000
+            while time.thread_time() < end:
+                pass
+            return self.handle_message(request.src, request.tenant, request.msg_id)
+
+    def setup(worker):
+        tracer, logger, _, stats = tracing_lib.grpc_otel_config(service_name="prefork_bench", traces=args.traces,
+                                                                logs=False, metrics=False)
+        return BurnHandler("bench", tracer=tracer, logger=logger, stats=stats), None
+
+    exit_codes = tracing_lib.start_prefork_server(0, args.server, setup)
+    print(f"EXIT {','.join(str(code) for code in exit_codes)}", flush=True)
+
+
+def client(args):
+    import threading
+    import grpc
+    import tracing_lib
+
+    counts = []
+
+    def worker():
+        # a local subchannel pool, so every thread opens its own connection instead of sharing one
+        with grpc.insecure_channel(f"localhost:{args.client}", options=[("grpc.use_local_subchannel_pool", 1)]) as channel:
+            stub = tracing_lib.greeter_stub(channel)
+            request = tracing_lib.make_request("prefork_bench", "tenant1", "1")
+            stub.SayHello(request, wait_for_ready=True, timeout=30)
+            count = 0
+            stop_at = time.monotonic() + args.duration
+            while time.monotonic() < stop_at:
+                stub.SayHello(request, timeout=30)
+                count += 1
+            counts.append(count)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"DONE {sum(counts)}", flush=True)
+
+
+def run_workers(workers, args, env):
+    cmd = [sys.executable, os.path.abspath(__file__), "--server", str(workers), "--work-ms", str(args.work_ms)]
+    if args.traces:
+        cmd.append("--traces")
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+    # the parent's port line and the workers' start lines come in any order, and the processes share the pipe,
+    # so one process's line can land in the middle of another's: search the lines instead of matching their start
+    port, started = None, 0
+    for line in proc.stdout:
+        match = re.search(r"Pre-forked \d+ workers, listening on (\d+)", line)
+        if match:
+            port = int(match.group(1))
+        started += line.count("Server started")
+        if port is not None and started == workers:
+            break
+    if port is None or started < workers:
+        proc.kill()
+        raise RuntimeError(f"server with {workers} workers exited before starting (exit code {proc.wait()})")
+    clients = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--client", str(port), "--threads",
+                                 str(args.threads), "--duration", str(args.duration)],
+                                cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+               for _ in range(args.clients)]
+    requests = 0
+    for c in clients:
+        for line in c.stdout:
+            if line.startswith("DONE "):
+                requests += int(line.split()[1])
+        c.wait()
+    stop_start = time.perf_counter()
+    proc.send_signal(signal.SIGTERM)
+    exit_codes = None
+    for line in proc.stdout:
+        match = re.search(r"EXIT (\S+)", line)
+        if match:
+            exit_codes = match.group(1)
+    proc.wait()
+    return requests, (time.perf_counter() - stop_start) * 1000, exit_codes
+
+
+def main(args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, HERE, os.environ.get("PYTHONPATH", "")]),
+               PYTHONUNBUFFERED="1", OTEL_TEST_SIGNALS="traces" if args.traces else "none")
+    sink = None
+    if args.traces:
+        import otlp_sink
+        sink = otlp_sink.OtlpSink().start()
+        env.update(OTEL_TEST_EXPORT_SERVER=sink.host, OTEL_TEST_EXPORT_HTTP_PORT=str(sink.http_port),
+                   OTEL_TEST_EXPORT_GRPC_PORT=str(sink.grpc_port))
+    print(f"{os.cpu_count()} CPUs, {args.work_ms}ms CPU per request, {args.clients} client processes x "
+          f"{args.threads} threads, {args.duration}s, tracing {'on' if args.traces else 'off'}")
+    print(f"{'workers':>7s} {'req/s':>8s} {'speedup':>8s} {'stop_ms':>8s} {'exported':>9s} {'exit':>8s}")
+    base = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        if sink is not None:
+            sink.reset()
+        requests, stop_ms, exit_codes = run_workers(workers, args, env)
+        # the warm-up call of every client thread is not counted, its span is
+        exported = ""
+        if sink is not None:
+            exported = f"{sink.received['spans'] / (requests + args.clients * args.threads) * 100:8.1f}%"
+        rps = requests / args.duration
+        base = base or rps
+        speedup = rps / base if base else 0.0
+        print(f"{workers:7d} {rps:8.0f} {speedup:7.2f}x {stop_ms:8.0f} {exported:>9s} {exit_codes:>8s}")
+    if sink is not None:
+        sink.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="pre-forked server throughput per worker count")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per worker count")
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads (connections) per client process")
+    parser.add_argument("--work-ms", type=float, default=2, help="CPU milliseconds per request")
+    parser.add_argument("--traces", action="store_true", help="workers export spans to an in-process OTLP sink")
+    parser.add_argument("--server", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--client", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.server:
+        server(args)
+    elif args.client:
+        client(args)
+    else:
+        main(args)
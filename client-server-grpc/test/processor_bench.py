@@ -0,0 +1,129 @@
+import argparse
+import logging
+import threading
+import time
+
+from opentelemetry.sdk._logs import LoggerProvider
+from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+import tracing_lib
+
+# producer contention in the span/log processors: 1 to 64 threads emit --items in total, as fast as they can,
+# into BatchSpanProcessor/BatchLogRecordProcessor and tracing_lib's ThreadBuffered processors, which export to
+# an exporter that only counts. per signal, processor and thread count it reports emits per second, the mean
+# wall time of one emit as seen by a producer, items exported per second (until the shutdown flush is done),
+# items dropped, and for the buffered processors the p99 queue latency. the same span / log record is emitted
+# every time so only the processor is measured, not creating it. batches are 512 items and the queues hold
+# --queue items (per thread for the buffered processors); with the default 2048 producers outrun the flusher
+# and a dropped item is cheaper than a queued one, so compare exported/s as well as emits/s.
+# run from client-server-grpc: PYTHONPATH=. python test/processor_bench.py [--items 200000] [--threads 1,2,4,8,16,32,64] [--queue 2048]
+
+
+class CountingExporter:
+    def __init__(self):
+        self.items = 0
+
+    def export(self, batch, *args, **kwargs):
+        self.items += len(batch)
+
+    def shutdown(self, *args, **kwargs):
+        pass
+
+    def force_flush(self, *args, **kwargs):
+        return True
+
+
+def sample_span():
+    with TracerProvider().get_tracer("processor_bench").start_as_current_span("request") as span:
+        span.set_attribute("tenant_id", "tenant1")
+    return span
+
+
+def sample_log_record():
+    records = []
+
+    class Capture:
+        def on_emit(self, log_record):
+            records.append(log_record)
+
+        def shutdown(self):
+            pass
+
+        def force_flush(self, timeout_millis=30000):
+            return True
+
+    provider = LoggerProvider()
+    provider.add_log_record_processor(Capture())
+    logger = logging.getLogger("processor_bench")
+    logger.propagate = False
+    logger.addHandler(tracing_lib.LoggingHandler(logger_provider=provider))
+    logger.error("request from %s", "client")
+    return records[0]
+
+
+def run(processor, emit, item, items, threads):
+    per_thread = items // threads
+    busy = []
+    start_line = threading.Barrier(threads + 1)
+
+    def producer():
+        start_line.wait()
+        start = time.perf_counter()
+        for _ in range(per_thread):
+            emit(item)
+        busy.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=producer) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    start_line.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    processor.shutdown()
+    flushed = time.perf_counter() - start
+    return per_thread * threads / elapsed, sum(busy) / (per_thread * threads) * 1e6, flushed
+
+
+def main(args):
+    span, log_record = sample_span(), sample_log_record()
+    settings = dict(max_queue_size=args.queue, max_export_batch_size=512)
+    configs = {
+        ("traces", "sdk"): lambda e: BatchSpanProcessor(e, **settings),
+        ("traces", "buffered"): lambda e: tracing_lib.ThreadBufferedSpanProcessor(e, **settings),
+        ("logs", "sdk"): lambda e: BatchLogRecordProcessor(e, **settings),
+        ("logs", "buffered"): lambda e: tracing_lib.ThreadBufferedLogProcessor(e, **settings),
+    }
+    print(f"{args.items} items per run, queue {args.queue}")
+    print(f"{'signal':6s} {'processor':9s} {'threads':>7s} {'emits/s':>10s} {'emit_us':>8s} {'exported/s':>10s} "
+          f"{'dropped':>8s} {'p99_queue_ms':>13s}")
+    for (signal, name), make in configs.items():
+        for threads in [int(t) for t in args.threads.split(",")]:
+            exporter = CountingExporter()
+            processor = make(exporter)
+            if signal == "traces":
+                emit, item = processor.on_end, span
+            else:
+                emit, item = processor.on_emit, log_record
+            rate, emit_us, flushed = run(processor, emit, item, args.items, threads)
+            emitted = args.items // threads * threads
+            p99 = ""
+            if isinstance(processor, tracing_lib.ThreadBufferedProcessor):
+                p99 = f"{processor.queue_latency.percentile(0.99):13.0f}"
+            print(f"{signal:6s} {name:9s} {threads:7d} {rate:10.0f} {emit_us:8.2f} {exporter.items / flushed:10.0f} "
+                  f"{emitted - exporter.items:8d} {p99:>13s}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="span/log processor throughput under producer contention")
+    parser.add_argument("--items", type=int, default=200000, help="items emitted per run, split over the threads")
+    parser.add_argument("--threads", default="1,2,4,8,16,32,64", help="comma separated producer thread counts")
+    parser.add_argument("--queue", type=int, default=2048, help="max_queue_size of every processor")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
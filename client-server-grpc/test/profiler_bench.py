@@ -0,0 +1,121 @@
+import argparse
+import ast
+import logging
+import os
+import threading
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+
+import tracing_lib
+
+# cost and output of tracing_lib.SpanProfiler. --threads threads run --requests "SayHello" spans, each parsing a
+# legacy payload with ast.literal_eval, formatting log records and waiting on a simulated downstream call, and
+# every --slow-every-th request waits 10x longer downstream. per configuration it reports the wall time and CPU
+# per request, the profiler's own sampling time and the samples attributed to spans, then which share of the
+# sampled time each of the three steps got, read from the collapsed stacks.
+#   off          no profiler
+#   100hz/1000hz every span sampled at that rate
+#   slow_only    1000hz, only spans running longer than --slow-ms
+# run from client-server-grpc: PYTHONPATH=. python test/profiler_bench.py [--requests 2000] [--threads 8]
+
+STEPS = ["parse_payload", "format_logs", "downstream_call"]
+PAYLOAD = str({"src": "client", "tenant": "tenant1", "msg_id": "1", "items": list(range(200))})
+# ast.parse on several threads at once can fail with "AST constructor recursion depth mismatch" on python < 3.12
+parse_lock = threading.Lock()
+
+
+def parse_payload():
+    with parse_lock:
+        return ast.literal_eval(PAYLOAD)
+
+
+def format_logs(logger):
+    for idx in range(20):
+        logger.info("request %s from %s: %s", idx, "client", PAYLOAD[:100])
+
+
+def downstream_call(ms):
+    time.sleep(ms / 1000)
+
+
+def run(tracer, logger, args):
+    remaining = iter(range(args.requests))
+
+    def worker():
+        for idx in remaining:
+            with tracer.start_as_current_span("SayHello"):
+                parse_payload()
+                format_logs(logger)
+                downstream_call(args.downstream_ms * (10 if idx % args.slow_every == 0 else 1))
+
+    start, cpu = time.perf_counter(), time.process_time()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return (time.perf_counter() - start) / args.requests * 1000, (time.process_time() - cpu) / args.requests * 1000
+
+
+def main(args):
+    logger = logging.getLogger("profiler_bench")
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(open(os.devnull, "w")))
+    logger.setLevel(logging.INFO)
+    configs = {
+        "off": None,
+        "100hz": dict(rate_hz=100),
+        "1000hz": dict(rate_hz=1000),
+        "slow_only": dict(rate_hz=1000, slow_ms=args.slow_ms),
+    }
+    print(f"{args.requests} requests on {args.threads} threads, downstream {args.downstream_ms}ms "
+          f"(x10 every {args.slow_every}th)")
+    print(f"{'config':10s} {'wall_ms':>8s} {'cpu_ms':>8s} {'samples':>8s} {'sample_ms':>10s} {'profiled':>9s}")
+    breakdowns = {}
+    for name, config in configs.items():
+        provider = TracerProvider()
+        profiler = None
+        if config is not None:
+            profiler = tracing_lib.SpanProfiler(**config, tracer_provider=provider).start()
+            provider.add_span_processor(profiler)
+        wall, cpu = run(provider.get_tracer("profiler_bench"), logger, args)
+        provider.shutdown()
+        if profiler is None:
+            print(f"{name:10s} {wall:8.3f} {cpu:8.3f}")
+            continue
+        breakdowns[name] = breakdown(profiler)
+        print(f"{name:10s} {wall:8.3f} {cpu:8.3f} {profiler.samples:8d} {profiler.sample_seconds * 1000:10.1f} "
+              f"{sum(breakdowns[name].values()):9d}")
+    print("where the profiled time went")
+    for name, totals in breakdowns.items():
+        total = sum(totals.values()) or 1
+        print(f"{name:10s} " + ", ".join(f"{step} {count / total * 100:.1f}%" for step, count in totals.items()))
+    if args.out:
+        profiler.write_collapsed(args.out)
+        print(f"saved {args.out}")
+
+
+# samples per step, from the collapsed stacks
+def breakdown(profiler):
+    totals = dict.fromkeys(STEPS + ["other"], 0)
+    for line in profiler.collapsed():
+        stack, count = line.rsplit(" ", 1)
+        step = next((s for s in STEPS if f":{s}" in stack), "other")
+        totals[step] += int(count)
+    return totals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="span profiler overhead and attribution")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--downstream-ms", type=float, default=5)
+    parser.add_argument("--slow-every", type=int, default=20, help="every n-th request waits 10x longer downstream")
+    parser.add_argument("--slow-ms", type=float, default=20, help="slow_ms for the slow_only configuration")
+    parser.add_argument("--out", help="write the last configuration's collapsed stacks here")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,158 @@
+import gc
+import threading
+import tracemalloc
+
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.sampling import ALWAYS_OFF
+
+import tracing_lib
+
+# memory ceiling of RequestStats in histogram mode: after warmup, memory must stay flat no matter how many
+# requests (and distinct msg_ids) are added between exports, also with exemplars kept for every request.
+# exemplars carry the trace/span id of sampled request spans to the exported points, msg_id is never an attribute.
+# the request counter, reset by every export, loses no request added while an export runs.
+# run from client-server-grpc: python -m pytest test/request_stats_test.py  or  PYTHONPATH=. python test/request_stats_test.py
+
+MEMORY_CEILING_BYTES = 64 * 1024
+# transient allocations inside the SDK record path are freed again, but bound them too
+PEAK_CEILING_BYTES = 256 * 1024
+TENANTS = ["tenant1", "tenant2", "tenant3"]
+
+
+def add_requests(stats, count, tracer=None):
+    for idx in range(count):
+        if tracer is None:
+            stats.add(idx % 2000, tenant=TENANTS[idx % len(TENANTS)], msg_id=str(idx))
+            continue
+        with tracer.start_as_current_span("request") as span:
+            stats.add(idx % 2000, tenant=TENANTS[idx % len(TENANTS)], msg_id=str(idx), span=span)
+
+
+def metric_points(reader, name):
+    points = []
+    for resource_metrics in reader.get_metrics_data().resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                if metric.name == name:
+                    points.extend(metric.data.data_points)
+    return points
+
+
+def test_histogram_memory_ceiling():
+    reader = InMemoryMetricReader()
+    stats = tracing_lib.RequestStats(metrics=MeterProvider(metric_readers=[reader]), meter_name="stats_test", mode="histogram")
+    add_requests(stats, 10000)
+    gc.collect()
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    add_requests(stats, 50000)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"growth={current - baseline} bytes, peak={peak - baseline} bytes over 50000 requests")
+    assert current - baseline < MEMORY_CEILING_BYTES
+    assert peak - baseline < PEAK_CEILING_BYTES
+
+    points = {point.attributes["tenant"]: point for point in metric_points(reader, "stats_test_process_time")}
+    assert sorted(points) == sorted(TENANTS)
+    assert sum(point.count for point in points.values()) == 60000
+    assert all("msg_id" not in point.attributes for point in points.values())
+
+
+def test_exemplars_link_points_to_traces():
+    reader = InMemoryMetricReader()
+    stats = tracing_lib.RequestStats(metrics=MeterProvider(metric_readers=[reader]), meter_name="stats_test",
+                                     mode="histogram", exemplars_per_bucket=2)
+    tracer = TracerProvider().get_tracer("stats_test")
+    add_requests(stats, 3000, tracer)
+    gc.collect()
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    add_requests(stats, 20000, tracer)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert current - baseline < MEMORY_CEILING_BYTES
+
+    # the slowest requests of tenant1 (idx % 2000 above 1500) fall in the 2000ms bucket
+    exemplars = stats.exemplars(0.99, "tenant1")
+    assert len(exemplars) == 2
+    assert all(1500 < e.value <= 2000 and int(e.msg_id) % 2000 == e.value for e in exemplars)
+    assert all(len(e.trace_id) == 32 and len(e.span_id) == 16 for e in exemplars)
+
+    points = metric_points(reader, "stats_test_process_time")
+    assert sorted(point.attributes["tenant"] for point in points) == sorted(TENANTS)
+    for point in points:
+        assert "msg_id" not in point.attributes
+        # at most one per bucket
+        assert 0 < len(point.exemplars) <= len(tracing_lib.LATENCY_BUCKETS_MS) + 1
+        assert all(e.trace_id and e.span_id for e in point.exemplars)
+
+    # spans of unsampled traces give no exemplars
+    stats = tracing_lib.RequestStats(metrics=MeterProvider(), meter_name="stats_test", mode="histogram")
+    add_requests(stats, 100, TracerProvider(sampler=ALWAYS_OFF).get_tracer("stats_test"))
+    assert stats.exemplars(0.5, "tenant1") == []
+
+
+def test_gauge_mode_has_no_msg_id():
+    reader = InMemoryMetricReader()
+    stats = tracing_lib.RequestStats(metrics=MeterProvider(metric_readers=[reader]), meter_name="stats_test",
+                                     mode="gauge")
+    add_requests(stats, 10, TracerProvider().get_tracer("stats_test"))
+    points = metric_points(reader, "stats_test_process_time")
+    assert points and all(set(point.attributes) == {"tenant"} for point in points)
+
+
+def test_gauge_mode_one_point_per_tenant():
+    reader = InMemoryMetricReader()
+    stats = tracing_lib.RequestStats(metrics=MeterProvider(metric_readers=[reader]), meter_name="stats_test",
+                                     mode="gauge", max_tenants=3)
+    add_requests(stats, 10, TracerProvider().get_tracer("stats_test"))
+    stats.add(5, tenant="tenant4")
+    points = {point.attributes["tenant"]: point for point in metric_points(reader, "stats_test_process_time")}
+    # the slowest request of each tenant, with its span as the exemplar
+    assert {tenant: point.value for tenant, point in points.items()} == {
+        "tenant1": 9, "tenant2": 7, "tenant3": 8, tracing_lib.OTHER_TENANT: 5}
+    assert all(point.exemplars[0].value == point.value for tenant, point in points.items() if tenant in TENANTS)
+    assert stats.slowest == {}
+
+
+def test_request_count_loses_nothing():
+    # the counter is read and reset by each export while other threads add
+    for mode in ("histogram", "gauge"):
+        reader = InMemoryMetricReader()
+        stats = tracing_lib.RequestStats(metrics=MeterProvider(metric_readers=[reader]), meter_name="stats_test",
+                                         mode=mode)
+        threads = [threading.Thread(target=add_requests, args=(stats, 20000)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        counted = 0
+        while any(t.is_alive() for t in threads):
+            counted += sum(point.value for point in metric_points(reader, "stats_test_requests"))
+        for t in threads:
+            t.join()
+        counted += sum(point.value for point in metric_points(reader, "stats_test_requests"))
+        assert counted == 80000, mode
+
+
+def test_tenant_cardinality_is_capped():
+    stats = tracing_lib.RequestStats(metrics=MeterProvider(), meter_name="stats_test", mode="histogram", max_tenants=2)
+    for idx in range(100):
+        stats.add(10, tenant=f"tenant{idx}")
+    assert sorted(stats.histograms) == [tracing_lib.OTHER_TENANT, "tenant0", "tenant1"]
+    assert stats.histograms[tracing_lib.OTHER_TENANT].count == 98
+    assert stats.percentile(0.5, "tenant0") == 10
+
+
+if __name__ == "__main__":
+    test_histogram_memory_ceiling()
+    test_exemplars_link_points_to_traces()
+    test_gauge_mode_has_no_msg_id()
+    test_gauge_mode_one_point_per_tenant()
+    test_request_count_loses_nothing()
+    test_tenant_cardinality_is_capped()
+    print("Done")
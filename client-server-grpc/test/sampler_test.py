@@ -0,0 +1,86 @@
+import types
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace.sampling import Decision
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+import tracing_lib
+
+# tracing_lib.TenantRateLimitedSampler, on a fake clock: spans with a parent follow it, new traces are capped per
+# tenant (tenants past max_tenants share one bucket), the cap shrinks while the export queue backs up and
+# recovers once it drains, and rates under 1/s still sample.
+# run from client-server-grpc: python -m pytest test/sampler_test.py
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tracing_lib, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def sampled(sampler, tenant, parent_context=None):
+    result = sampler.should_sample(parent_context, 1, "request", attributes={"tenant_id": tenant})
+    return result.decision == Decision.RECORD_AND_SAMPLE
+
+
+# sampled spans of a tenant over seconds, one attempt every 10ms
+def sample_for(clock, sampler, tenant, seconds):
+    count = 0
+    for _ in range(int(seconds * 100)):
+        clock.now += 0.01
+        count += sampled(sampler, tenant)
+    return count
+
+
+def test_follows_parent(clock):
+    sampler = tracing_lib.TenantRateLimitedSampler(spans_per_second=0)
+    for flags, expected in ((TraceFlags.SAMPLED, True), (TraceFlags.DEFAULT, False)):
+        parent = SpanContext(trace_id=1, span_id=2, is_remote=True, trace_flags=TraceFlags(flags))
+        context = trace.set_span_in_context(NonRecordingSpan(parent))
+        assert [sampled(sampler, "tenant1", context) for _ in range(5)] == [expected] * 5
+
+
+def test_per_tenant_caps(clock):
+    sampler = tracing_lib.TenantRateLimitedSampler(spans_per_second=5, tenant_limits={"tenant1": 2})
+    assert sum(sampled(sampler, "tenant1") for _ in range(10)) == 2
+    assert sum(sampled(sampler, "tenant2") for _ in range(10)) == 5
+    assert sample_for(clock, sampler, "tenant1", 5) == pytest.approx(10, abs=1)
+    sampler.set_limit("tenant1", 0)
+    assert sample_for(clock, sampler, "tenant1", 2) == 0
+
+
+def test_max_tenants_share_a_bucket(clock):
+    sampler = tracing_lib.TenantRateLimitedSampler(spans_per_second=3, max_tenants=2)
+    assert sum(sampled(sampler, "tenant1") for _ in range(5)) == 3
+    assert sum(sampled(sampler, "tenant2") for _ in range(5)) == 3
+    # tenant3 and tenant4 draw from the one overflow bucket
+    assert sum(sampled(sampler, tenant) for tenant in ("tenant3", "tenant4") for _ in range(5)) == 3
+    assert set(sampler.buckets) == {"tenant1", "tenant2", tracing_lib.OTHER_TENANT}
+
+
+def test_backlog_scale_down_and_recovery(clock):
+    fill = [0.9]
+    sampler = tracing_lib.TenantRateLimitedSampler(spans_per_second=10, backlog=lambda: fill[0], min_scale=0.05)
+    sample_for(clock, sampler, "tenant1", 10)
+    assert sampler.scale == 0.05
+    # scaled down to 0.5/s, which still samples
+    assert sample_for(clock, sampler, "tenant1", 10) == pytest.approx(5, abs=1)
+    fill[0] = 0.0
+    sample_for(clock, sampler, "tenant1", 20)
+    assert sampler.scale == 1.0
+    assert sample_for(clock, sampler, "tenant1", 5) == pytest.approx(50, abs=2)
+
+
+def test_rate_under_one_per_second(clock):
+    sampler = tracing_lib.TenantRateLimitedSampler(spans_per_second=0.5)
+    assert sample_for(clock, sampler, "tenant1", 10) == pytest.approx(5, abs=1)
@@ -0,0 +1,88 @@
+import os
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+import tracing_lib
+from otlp_sink import OtlpSink
+
+# tracing_lib.DiskSpool and SpoolExporter: the ring buffer wraps and drops its oldest records when full and keeps
+# its records across reopening, and spans exported while the collector (an OtlpSink) is stopped reach it once it
+# is started again, also when the process that spooled them has shut down and a new exporter replays the file.
+# run from client-server-grpc: python -m pytest test/spool_test.py
+
+
+def test_ring_buffer_wraps_and_survives_reopen(tmp_path):
+    path = str(tmp_path / "ring.spool")
+    spool = tracing_lib.DiskSpool(path, max_bytes=100)
+    # 8 byte record header + 20 byte payload, 3 fit
+    for idx in range(5):
+        assert spool.append(bytes([idx]) * 20)
+    assert len(spool) == 3 and spool.dropped == 2
+    token, payload = spool.peek()
+    assert payload == bytes([2]) * 20
+    spool.pop(token)
+    spool.append(bytes([5]) * 20)
+    assert not spool.append(b"x" * 100)
+    spool.close()
+
+    spool = tracing_lib.DiskSpool(path, max_bytes=100)
+    seen = []
+    while True:
+        token, payload = spool.peek()
+        if payload is None:
+            break
+        seen.append(payload[0])
+        spool.pop(token)
+    spool.close()
+    assert seen == [3, 4, 5]
+
+
+def spool_provider(profile):
+    exporter = profile.span_exporter()
+    exporter.backoff, exporter.max_backoff = 0.05, 0.2
+    provider = TracerProvider()
+    provider.add_span_processor(BatchSpanProcessor(exporter, schedule_delay_millis=50))
+    return provider, exporter
+
+
+def make_spans(provider, count):
+    tracer = provider.get_tracer("spool_test")
+    for idx in range(count):
+        with tracer.start_as_current_span("request") as span:
+            span.set_attribute("idx", idx)
+
+
+def test_replay_after_collector_restart(tmp_path):
+    for transport in ("http", "grpc"):
+        sink = OtlpSink().start()
+        sink.stop()
+        profile = tracing_lib.ExporterProfile(server=sink.host, http_port=sink.http_port, grpc_port=sink.grpc_port,
+                                              transport=transport, spool_dir=str(tmp_path / transport))
+        provider, exporter = spool_provider(profile)
+        make_spans(provider, 100)
+        provider.force_flush()
+        time.sleep(0.3)
+        assert len(exporter.spool) > 0 and exporter.failures > 0
+
+        # the collector comes back: the spool is replayed
+        sink.start()
+        assert sink.wait_for("spans", 100) == 100
+        assert exporter.force_flush(5000)
+
+        # the collector goes away again and the process exits with spans still spooled
+        sink.stop()
+        sink.reset()
+        make_spans(provider, 50)
+        provider.force_flush()
+        time.sleep(0.2)
+        provider.shutdown()
+        assert os.path.getsize(os.path.join(profile.spool_dir, "traces.spool")) > 0
+
+        # a new process replays what the previous one left
+        sink.start()
+        provider, exporter = spool_provider(profile)
+        assert sink.wait_for("spans", 50) == 50
+        provider.shutdown()
+        sink.stop()
@@ -0,0 +1,167 @@
+import argparse
+import importlib
+import json
+import os
+import random
+import runpy
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+# startup time of service1.py / service2.py per set of enabled signals ($OTEL_TEST_SIGNALS), exporting to an
+# in-process OTLP sink. every run starts fresh processes and reports the median over --runs of
+#   import_ms     importing the service module (tracing_lib, grpc, OTel API), measured inside the child
+#   ready_ms      process spawn until "Server started" (imports, grpc_otel_config, server start)
+#   first_rpc_ms  process spawn until the first SayHello response, sent once the server is listening
+#   rpc_ms        first_rpc_ms - ready_ms, the first request including whatever it initialises lazily
+# the handlers sleep a random 0.5-1.5s per hop; each child gives tracing_lib its own seeded Random, so that
+# sleep is the same in every run and configuration and only the startup work differs.
+# service1 calls service2, so service1 runs start a fresh service2 (same signals) first and wait for it.
+# the child imports nothing but the service before import_ms is taken, grpc and the sink are parent-only.
+# --eager also runs every configuration with the modules tracing_lib used to import unconditionally preloaded.
+# run from client-server-grpc: PYTHONPATH=. python test/startup_bench.py [--runs 5] [--signals all,traces,none]
+
+SERVICES = {"service1": 50051, "service2": 50052}
+SIGNALS = {
+    "all": "traces,logs,metrics",
+    "traces": "traces",
+    "logs": "logs",
+    "metrics": "metrics",
+    "none": "none",
+}
+EAGER_MODULES = [
+    "opentelemetry.exporter.otlp.proto.http._log_exporter",
+    "opentelemetry.exporter.otlp.proto.http.metric_exporter",
+    "opentelemetry.exporter.otlp.proto.http.trace_exporter",
+    "opentelemetry.exporter.otlp.proto.grpc._log_exporter",
+    "opentelemetry.exporter.otlp.proto.grpc.trace_exporter",
+    "opentelemetry.exporter.otlp.proto.grpc.metric_exporter",
+    "opentelemetry.instrumentation.logging",
+    "opentelemetry.instrumentation.grpc",
+    "opentelemetry.sdk.metrics",
+]
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def child(args):
+    start = time.perf_counter()
+    if args.eager:
+        for name in EAGER_MODULES:
+            importlib.import_module(name)
+    importlib.import_module(args.child)
+    print(f"IMPORT {(time.perf_counter() - start) * 1000:.1f}", flush=True)
+    import tracing_lib
+    tracing_lib.random = random.Random(0)
+    sys.argv = [args.child + ".py"]
+    runpy.run_path(os.path.join(ROOT, args.child + ".py"), run_name="__main__")
+
+
+class ServiceProcess:
+    def __init__(self, service, signals, sink, eager=False):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, HERE, os.environ.get("PYTHONPATH", "")]),
+                   PYTHONUNBUFFERED="1", OTEL_TEST_SIGNALS=signals, OTEL_TEST_EXPORT_SERVER=sink.host,
+                   OTEL_TEST_EXPORT_HTTP_PORT=str(sink.http_port), OTEL_TEST_EXPORT_GRPC_PORT=str(sink.grpc_port))
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", service]
+        if eager:
+            cmd.append("--eager")
+        self.ready = threading.Event()
+        self.import_ms = None
+        self.ready_at = None
+        self.spawned_at = time.perf_counter()
+        self.process = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        for line in self.process.stdout:
+            if line.startswith("IMPORT "):
+                self.import_ms = float(line.split()[1])
+            elif line.startswith("Server started") and not self.ready.is_set():
+                self.ready_at = time.perf_counter()
+                self.ready.set()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def first_rpc(port, timeout=60):
+    import grpc
+    import tracing_lib
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+        stub = tracing_lib.greeter_stub(channel)
+        stub.SayHello(tracing_lib.make_request("startup_bench", "tenant1", "1"), wait_for_ready=True, timeout=timeout)
+    return time.perf_counter()
+
+
+def run_once(service, signals, sink, eager):
+    downstream = None
+    if service == "service1":
+        downstream = ServiceProcess("service2", signals, sink, eager)
+        if not downstream.ready.wait(60):
+            raise RuntimeError("service2 did not start")
+    proc = ServiceProcess(service, signals, sink, eager)
+    try:
+        # calling before the port is open would put the channel into reconnect backoff
+        if not proc.ready.wait(60):
+            raise RuntimeError(f"{service} did not start")
+        done_at = first_rpc(SERVICES[service])
+        return {
+            "import_ms": proc.import_ms,
+            "ready_ms": (proc.ready_at - proc.spawned_at) * 1000,
+            "first_rpc_ms": (done_at - proc.spawned_at) * 1000,
+            "rpc_ms": (done_at - proc.ready_at) * 1000,
+        }
+    finally:
+        proc.stop()
+        if downstream is not None:
+            downstream.stop()
+
+
+def main(args):
+    import otlp_sink
+    sink = otlp_sink.OtlpSink().start()
+    results = {}
+    print(f"{'service':9s} {'signals':16s} {'import_ms':>10s} {'ready_ms':>10s} {'first_rpc_ms':>13s} {'rpc_ms':>8s}")
+    variants = [False, True] if args.eager else [False]
+    for service in args.services.split(","):
+        for name in args.signals.split(","):
+            for eager in variants:
+                key = f"{service}:{name}" + (":eager" if eager else "")
+                runs = [run_once(service, SIGNALS[name], sink, eager) for _ in range(args.runs)]
+                result = {metric: round(statistics.median(r[metric] for r in runs), 1) for metric in runs[0]}
+                results[key] = result
+                label = name + (" (eager)" if eager else "")
+                print(f"{service:9s} {label:16s} {result['import_ms']:10.1f} {result['ready_ms']:10.1f} "
+                      f"{result['first_rpc_ms']:13.1f} {result['rpc_ms']:8.1f}")
+    sink.stop()
+    out = args.out or os.path.join("bench_results", f"startup_bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+    print(f"saved {out}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="service startup time per enabled signal set")
+    parser.add_argument("--services", default=",".join(SERVICES), help="comma separated subset of " + ",".join(SERVICES))
+    parser.add_argument("--signals", default=",".join(SIGNALS), help="comma separated subset of " + ",".join(SIGNALS))
+    parser.add_argument("--runs", type=int, default=5, help="fresh starts per configuration, the median is reported")
+    parser.add_argument("--eager", action="store_true", help="also run with all exporter/instrumentation modules preloaded")
+    parser.add_argument("--out", help="results file, default bench_results/startup_bench_<time>.json")
+    parser.add_argument("--child", choices=list(SERVICES), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
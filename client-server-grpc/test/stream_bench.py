@@ -0,0 +1,131 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# throughput of SayHello (one unary call per request) vs SayHelloStream (requests multiplexed on one long-lived
+# stream through tracing_lib.GreeterStream), the way Service1 forwards to service2 with and without --stream.
+# the server (a child process) does no work per request beyond handling it, so the numbers are per-request
+# overhead: grpc framing and scheduling, and with --traces the per-request span export to an in-process OTLP sink.
+#   unary_seq      one thread, one unary call at a time
+#   unary          --threads threads on tracing_lib.channel_pool
+#   stream         --threads threads sharing one GreeterStream
+# per mode it reports requests/s and p50/p99 latency.
+# client and server share the CPU; on one core the per-request CPU of both ends is what is compared.
+# run from client-server-grpc: PYTHONPATH=. python test/stream_bench.py [--requests 5000] [--threads 16] [--traces]
+
+MODES = ["unary_seq", "unary", "stream"]
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def child(args):
+    import tracing_lib
+
+    class NoWorkHandler(tracing_lib.HelloHandler):
+        def work(self):
+            pass
+
+    logger = logging.getLogger("stream_bench")
+    logger.setLevel(logging.CRITICAL)
+    tracing_lib.diagnostics.stream = open(os.devnull, "w")
+    tracer, _, metrics, stats = tracing_lib.grpc_otel_config(service_name="stream_bench", traces=args.traces,
+                                                             logs=False, metrics=False)
+    handler = NoWorkHandler("stream_bench", tracer=tracer if args.traces else None, logger=logger, stats=stats)
+    server = tracing_lib.create_grpc_server(0, handler)
+    server.wait_for_termination()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def run_mode(mode, target, args):
+    import tracing_lib
+
+    stream = tracing_lib.GreeterStream(target, window=args.window) if mode == "stream" else None
+    latencies = []
+    lock = threading.Lock()
+
+    def call(idx):
+        request = tracing_lib.make_request("stream_bench", "tenant1", str(idx))
+        if stream is not None:
+            return stream.call(request, timeout=30)
+        return tracing_lib.channel_pool.invoke(target, "SayHello", request, timeout=30)
+
+    def worker(indexes):
+        for idx in indexes:
+            start = time.perf_counter()
+            call(idx)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    # warm up the channel/stream
+    for idx in range(50):
+        call(idx)
+    threads = 1 if mode == "unary_seq" else args.threads
+    remaining = iter(range(args.requests))
+    workers = [threading.Thread(target=worker, args=(remaining,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    if stream is not None:
+        stream.close()
+    return {"rps": len(latencies) / elapsed, "p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99)}
+
+
+def main(args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, HERE, os.environ.get("PYTHONPATH", "")]),
+               PYTHONUNBUFFERED="1")
+    sink = None
+    if args.traces:
+        import otlp_sink
+        sink = otlp_sink.OtlpSink().start()
+        env.update(OTEL_TEST_EXPORT_SERVER=sink.host, OTEL_TEST_EXPORT_HTTP_PORT=str(sink.http_port),
+                   OTEL_TEST_EXPORT_GRPC_PORT=str(sink.grpc_port))
+    cmd = [sys.executable, os.path.abspath(__file__), "--child"] + (["--traces"] if args.traces else [])
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    port = None
+    for line in proc.stdout:
+        if line.startswith("Server started"):
+            port = int(line.split()[-1])
+            break
+    target = f"localhost:{port}"
+    print(f"{args.requests} requests, {args.threads} threads, stream window {args.window}, "
+          f"tracing {'on' if args.traces else 'off'}")
+    print(f"{'mode':10s} {'req/s':>8s} {'p50_ms':>8s} {'p99_ms':>8s}")
+    try:
+        for mode in args.modes.split(","):
+            result = run_mode(mode, target, args)
+            print(f"{mode:10s} {result['rps']:8.0f} {result['p50']:8.2f} {result['p99']:8.2f}")
+    finally:
+        proc.terminate()
+        proc.wait()
+        if sink is not None:
+            sink.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="unary vs streaming SayHello throughput")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated subset of " + ",".join(MODES))
+    parser.add_argument("--requests", type=int, default=5000, help="requests per mode")
+    parser.add_argument("--threads", type=int, default=16, help="client threads for unary and stream")
+    parser.add_argument("--window", type=int, default=64, help="GreeterStream window")
+    parser.add_argument("--traces", action="store_true", help="server exports spans to an in-process OTLP sink")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
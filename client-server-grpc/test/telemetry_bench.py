@@ -0,0 +1,193 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import otlp_sink
+
+# per-signal telemetry overhead of the tracing_lib configurations, exported to an in-process OTLP sink (no network).
+# every configuration runs in its own child process, since OTel providers can only be set once per process.
+# for each configuration and each operation (span, log record, metric point) it reports
+#   cpu_us_per_op        process CPU per op, includes the background export threads
+#   thread_cpu_us_per_op CPU of the calling thread only, i.e. what the request path pays
+#   alloc_peak_kb        tracemalloc peak while running --alloc-ops ops
+#   exported / export_per_s  items that reached the sink and end-to-end rate including the final flush
+# --profiles runs every configuration with each tracing_lib.EXPORTER_PROFILES preset (results keyed config:profile),
+# without it the configure_* defaults are used. export_bytes is what the sink received: compressed for OTLP/HTTP,
+# the decoded message size for OTLP/gRPC.
+# results are saved as JSON, --compare prints the change against an earlier run.
+# run from client-server-grpc: PYTHONPATH=. python test/telemetry_bench.py [--ops N] [--profiles default,throughput,latency] [--compare old.json]
+
+CONFIGS = {
+    "sdk_off": (),
+    "traces": ("traces",),
+    "logs": ("logs",),
+    "metrics": ("metrics",),
+    "all": ("traces", "logs", "metrics"),
+}
+SINK_KINDS = {"span": "spans", "log": "logs", "metric_point": "metric_points"}
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def setup(signals, host, http_port, grpc_port, profile_name=None):
+    from opentelemetry import _logs, metrics, trace
+    import tracing_lib
+
+    profile = None
+    if profile_name:
+        profile = tracing_lib.ExporterProfile(profile_name, server=host, http_port=http_port, grpc_port=grpc_port)
+    if "traces" in signals:
+        tracer = tracing_lib.configure_tracing(server=host, service_name="bench", port=http_port, profile=profile)
+    else:
+        tracer = trace.get_tracer("bench")
+    if "logs" in signals:
+        logger = tracing_lib.configure_logging(server=host, service_name="bench", port=http_port, profile=profile)
+    else:
+        logger = logging.getLogger("basic_otlp_test")
+        logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    if "metrics" in signals:
+        tracing_lib.configure_metrics(server=host, service_name="bench", port=grpc_port, profile=profile)
+    stats = tracing_lib.RequestStats(metrics=metrics, meter_name="bench", mode="histogram")
+
+    def flush():
+        for provider in (trace.get_tracer_provider(), _logs.get_logger_provider(), metrics.get_meter_provider()):
+            if hasattr(provider, "force_flush"):
+                provider.force_flush()
+
+    return tracer, logger, stats, flush
+
+
+def operations(tracer, logger, stats):
+    def span_op(idx):
+        with tracer.start_as_current_span("bench-span") as span:
+            span.set_attribute("tenant_id", "tenant1")
+            span.set_attribute("msg_id", idx)
+            span.add_event("bench-event")
+
+    def log_op(idx):
+        logger.error(f"bench - request from : client -> bench, tenant1, {idx}")
+
+    def metric_op(idx):
+        stats.add(idx % 1000, tenant="tenant1" if idx % 2 else "tenant2", msg_id=str(idx))
+
+    return {"span": span_op, "log": log_op, "metric_point": metric_op}
+
+
+def measure(op, ops, alloc_ops, flush):
+    start = time.perf_counter()
+    for idx in range(min(1000, ops)):
+        op(idx)
+    gc.collect()
+    cpu, thread_cpu = time.process_time(), time.thread_time()
+    for idx in range(ops):
+        op(idx)
+    cpu, thread_cpu = time.process_time() - cpu, time.thread_time() - thread_cpu
+    tracemalloc.start()
+    for idx in range(alloc_ops):
+        op(idx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    flush()
+    return {
+        "ops": ops,
+        "emitted": min(1000, ops) + ops + alloc_ops,
+        "cpu_us_per_op": round(cpu / ops * 1e6, 3),
+        "thread_cpu_us_per_op": round(thread_cpu / ops * 1e6, 3),
+        "alloc_peak_kb": round(peak / 1024, 1),
+        "elapsed_s": round(time.perf_counter() - start, 4),
+    }
+
+
+def child(args):
+    tracer, logger, stats, flush = setup(CONFIGS[args.child], args.host, args.http_port, args.grpc_port, args.profile)
+    results = {}
+    for name, op in operations(tracer, logger, stats).items():
+        results[name] = measure(op, args.ops, args.alloc_ops, flush)
+    # tracing_lib prints from metric callbacks, so mark the result line
+    print("RESULT " + json.dumps(results))
+
+
+def run_config(config, profile, sink, args):
+    sink.reset()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(HERE), os.environ.get("PYTHONPATH", "")]))
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", config, "--host", sink.host,
+           "--http-port", str(sink.http_port), "--grpc-port", str(sink.grpc_port),
+           "--ops", str(args.ops), "--alloc-ops", str(args.alloc_ops)]
+    if profile:
+        cmd += ["--profile", profile]
+    out = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+    results = json.loads([line for line in out.splitlines() if line.startswith("RESULT ")][-1][len("RESULT "):])
+    received = sink.counts()
+    for name, result in results.items():
+        exported = received[SINK_KINDS[name]] if CONFIGS[config] else 0
+        result["exported"] = exported
+        result["export_per_s"] = round(exported / result["elapsed_s"], 1)
+    results["export_bytes"] = received["bytes"]
+    results["export_requests"] = received["requests"]
+    return results
+
+
+def compare(results, old):
+    print("\nchange in cpu_us_per_op vs baseline")
+    for config, ops in results.items():
+        for name, result in ops.items():
+            if not isinstance(result, dict) or name not in old.get(config, {}):
+                continue
+            before, after = old[config][name]["cpu_us_per_op"], result["cpu_us_per_op"]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"{config:21s} {name:12s} {before:9.2f} -> {after:9.2f} us  ({change:+.1f}%)")
+
+
+def main(args):
+    sink = otlp_sink.OtlpSink().start()
+    results = {}
+    print(f"{'config':21s} {'op':12s} {'cpu_us':>9s} {'thread_us':>9s} {'alloc_kb':>9s} {'exported':>9s} {'export/s':>10s}")
+    profiles = args.profiles.split(",") if args.profiles else [None]
+    for config in args.configs.split(","):
+        for profile in profiles:
+            key = f"{config}:{profile}" if profile else config
+            results[key] = run_config(config, profile, sink, args)
+            for name in SINK_KINDS:
+                r = results[key][name]
+                print(f"{key:21s} {name:12s} {r['cpu_us_per_op']:9.2f} {r['thread_cpu_us_per_op']:9.2f} "
+                      f"{r['alloc_peak_kb']:9.1f} {r['exported']:9d} {r['export_per_s']:10.1f}")
+            print(f"{key:21s} export_bytes={results[key]['export_bytes']} requests={results[key]['export_requests']}")
+    sink.stop()
+    out = args.out or os.path.join("bench_results", f"telemetry_bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+    print(f"saved {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="telemetry overhead benchmark against a local OTLP sink")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="comma separated subset of " + ",".join(CONFIGS))
+    parser.add_argument("--profiles", help="comma separated exporter profiles, e.g. default,throughput,latency")
+    parser.add_argument("--ops", type=int, default=20000, help="timed ops per operation")
+    parser.add_argument("--alloc-ops", type=int, default=2000, help="ops run under tracemalloc")
+    parser.add_argument("--out", help="results file, default bench_results/telemetry_bench_<time>.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--child", choices=list(CONFIGS), help=argparse.SUPPRESS)
+    parser.add_argument("--profile", help=argparse.SUPPRESS)
+    parser.add_argument("--host", default="127.0.0.1", help=argparse.SUPPRESS)
+    parser.add_argument("--http-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--grpc-port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
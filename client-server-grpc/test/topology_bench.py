@@ -0,0 +1,375 @@
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import grpc
+from opentelemetry import trace
+
+import helloworld_pb2
+import tracing_lib
+
+# synthetic call graphs of HelloHandler services, started locally in one command. per --depth/--fanout pair it
+# starts a tree of services, one process each: the root calls --fanout children, each of those calls --fanout
+# of its own, --depth levels deep (leaves call nobody). every hop burns CPU and then waits for a simulated
+# downstream, each drawn from a distribution, fails a share of its requests, and calls its children
+# concurrently. all of them export to an in-process OTLP sink. --threads client threads drive the root in a
+# closed loop, once with telemetry off (OTEL_TEST_SIGNALS=none) and once on, and per mode it reports:
+#   client  requests/s, p50/p99 ms and error rate
+#   export  spans, log records and kB received by the sink per request
+#   hops    per level: services, p50/p99 ms of a hop (its own work plus its subtree, measured in the service)
+#           and CPU ms per request of the level's processes, including their telemetry export
+# so the cost of tracing can be compared as the call graph gets deeper and wider.
+# distributions are in ms: fixed:5, uniform:2,8, exp:5 (mean), lognormal:5,0.5 (median, sigma) or 0, and may
+# differ per level, separated by "/" with the last one for the levels below (e.g. --latency exp:2/exp:2/lognormal:10,1
+# gives the leaves of a depth 3 graph, stand-ins for a database, a slower tail).
+# run from client-server-grpc: PYTHONPATH=. python test/topology_bench.py [--depth 1,2,3] [--fanout 1,2] [--duration 5] [--threads 4] [--latency exp:2] [--cpu fixed:0.5] [--error-rate 0]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+# finer than LATENCY_BUCKETS_MS, hops of a few ms are the interesting ones here
+HOP_BUCKETS_MS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000, 2000, 5000)
+MAX_SERVICES = 64
+MODES = {"off": "none", "on": "traces,logs,metrics"}
+
+
+# a hop failing on purpose, --error-rate of the requests
+class InjectedError(Exception):
+    pass
+
+
+# ms sampler for a distribution spec, see the header
+def parse_distribution(spec):
+    name, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if name in ("0", "none"):
+        return lambda: 0.0
+    if name == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if name == "uniform" and len(values) == 2:
+        return lambda: random.uniform(*values)
+    if name == "exp" and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    if name == "lognormal" and len(values) == 2:
+        return lambda: random.lognormvariate(0, values[1]) * values[0]
+    raise ValueError(f"bad distribution {spec}, expected fixed:MS, uniform:LOW,HIGH, exp:MEAN, lognormal:MEDIAN,SIGMA or 0")
+
+
+# spec of each level, the last one repeated for the levels below
+def level_spec(specs, level):
+    specs = specs.split("/")
+    return specs[min(level, len(specs) - 1)]
+
+
+# (level, index) of every service, the children of (level, i) are (level + 1, i * fanout ... i * fanout + fanout - 1)
+def layout(depth, fanout):
+    return [(level, idx) for level in range(depth) for idx in range(fanout ** level)]
+
+
+def service_name(level, idx):
+    return f"hop{level}_{idx}"
+
+
+class TopologyService(tracing_lib.HelloHandler):
+    def __init__(self, service_name, tracer=None, logger=None, stats=None, targets=(), latency=None, cpu=None,
+                 error_rate=0.0):
+        super().__init__(service_name, tracer, logger, stats)
+        self.targets = list(targets)
+        self.latency = latency or (lambda: 0.0)
+        self.cpu = cpu or (lambda: 0.0)
+        self.error_rate = error_rate
+        self.hops = tracing_lib.LatencyHistogram(HOP_BUCKETS_MS)
+        self.fanout = tracing_lib.ContextExecutor(max_workers=10 * max(1, len(self.targets)), max_queue=10000,
+                                                  name="fanout")
+
+    def process(self, request, context, span):
+        start = time.perf_counter()
+        response = super().process(request, context, span)
+        self.hops.record((time.perf_counter() - start) * 1000)
+        return response
+
+    def work(self):
+        end = time.thread_time() + self.cpu() / 1000
+        while time.thread_time() < end:
+            pass
+        time.sleep(self.latency() / 1000)
+
+    def handle_message(self, request_from, tenant, msg_id):
+        if random.random() < self.error_rate:
+            raise InjectedError(f"{self.service_name} failed {msg_id}")
+        request = tracing_lib.make_request(request_from, tenant, msg_id)
+        timeout = tracing_lib.downstream_timeout(default=30)
+        try:
+            calls = [self.fanout.submit(tracing_lib.channel_pool.invoke, target, "SayHello", request, timeout=timeout)
+                     for target in self.targets[1:]]
+            # the first child on this thread, the others (rejected ones too) alongside
+            if self.targets:
+                tracing_lib.channel_pool.invoke(self.targets[0], "SayHello", request, timeout=timeout)
+            for call, target in zip(calls, self.targets[1:]):
+                if call is None:
+                    tracing_lib.channel_pool.invoke(target, "SayHello", request, timeout=timeout)
+                else:
+                    call.result()
+        except grpc.RpcError as e:
+            tracing_lib.record_exception(trace.get_current_span(), e)
+            raise
+        return helloworld_pb2.HelloReply(message=f"Hello [{request_from}] - response {self.service_name}")
+
+
+# one service of the graph, in its own process. reads commands from stdin: "reset" starts the hop latencies and
+# CPU over, "stop" prints them as JSON and exits after flushing its telemetry
+def service(args):
+    tracing_lib.diagnostics.stream = open(os.devnull, "w")
+    tracer, logger, _, stats = tracing_lib.grpc_otel_config(service_name=args.service, sampling_ratio=args.ratio)
+    logger.propagate = False
+    handler = TopologyService(args.service, tracer=tracer, logger=logger, stats=stats,
+                              targets=[t for t in args.targets.split(",") if t],
+                              latency=parse_distribution(level_spec(args.latency, args.level)),
+                              cpu=parse_distribution(level_spec(args.cpu, args.level)), error_rate=args.error_rate)
+    server = tracing_lib.create_grpc_server(0, handler)
+    cpu = time.process_time()
+    for line in sys.stdin:
+        if line.strip() == "reset":
+            handler.hops.reset()
+            cpu = time.process_time()
+        elif line.strip() == "stop":
+            break
+    print(json.dumps({"cpu": time.process_time() - cpu, "counts": handler.hops.counts}), flush=True)
+    server.stop(1).wait()
+    handler.fanout.shutdown()
+    tracing_lib.shutdown_telemetry()
+
+
+# a service process started by the runner, its stdout read on a thread so it never blocks on a full pipe
+class ServiceProcess:
+    def __init__(self, level, idx, targets, mode, env, args):
+        self.level, self.name = level, service_name(level, idx)
+        cmd = [sys.executable, os.path.abspath(__file__), "--service", self.name, "--level", str(level),
+               "--targets", ",".join(targets), "--latency", args.latency, "--cpu", args.cpu,
+               "--error-rate", str(args.error_rate), "--ratio", str(args.ratio)]
+        env = dict(env, OTEL_TEST_SIGNALS=MODES[mode])
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True)
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        for line in self.proc.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def wait_for(self, prefix, timeout=60):
+        stop_at = time.monotonic() + timeout
+        while True:
+            line = self.lines.get(timeout=max(0.0, stop_at - time.monotonic()))
+            if line is None:
+                raise RuntimeError(f"{self.name} exited")
+            if line.startswith(prefix):
+                return line
+
+    def send(self, command):
+        self.proc.stdin.write(command + "\n")
+        self.proc.stdin.flush()
+
+    # the service's port, once it listens
+    def port(self):
+        return int(self.wait_for("Server started").split()[-1])
+
+    # hop latencies and CPU since the last reset, then waits for the process to flush and exit
+    def stop(self):
+        self.send("stop")
+        result = json.loads(self.wait_for("{"))
+        self.proc.wait(timeout=30)
+        return result
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+
+# starts the graph leaves first, so every service is started with its children's addresses. the root is first
+def start_graph(depth, fanout, mode, env, args):
+    targets = {}
+    services = []
+    for level in reversed(range(depth)):
+        started = []
+        for idx in range(fanout ** level):
+            children = [targets[(level + 1, idx * fanout + c)] for c in range(fanout)] if level + 1 < depth else []
+            started.append((idx, ServiceProcess(level, idx, children, mode, env, args)))
+            services.append(started[-1][1])
+        for idx, proc in started:
+            targets[(level, idx)] = f"localhost:{proc.port()}"
+    return list(reversed(services)), targets[(0, 0)]
+
+
+# closed loop against the root for duration seconds: latencies (s) of successes, errors by status code
+def drive(target, duration, threads):
+    latencies, errors = [], {}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(worker_idx):
+        for msg_idx in itertools.count():
+            if time.perf_counter() >= stop_at:
+                return
+            request = tracing_lib.make_request("topology_bench", "tenant1", f"{worker_idx}-{msg_idx}")
+            start = time.perf_counter()
+            try:
+                tracing_lib.channel_pool.invoke(target, "SayHello", request, timeout=30)
+            except grpc.RpcError as e:
+                with lock:
+                    errors[e.code().name] = errors.get(e.code().name, 0) + 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(idx,)) for idx in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, errors
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0
+
+
+# one graph in one mode: client results, sink counts and per service results
+def run_graph(depth, fanout, mode, sink, env, args):
+    services, root = start_graph(depth, fanout, mode, env, args)
+    try:
+        drive(root, args.warmup, args.threads)
+        # let the warmup's telemetry reach the sink before counting
+        time.sleep(1)
+        sink.reset()
+        for s in services:
+            s.send("reset")
+        latencies, errors = drive(root, args.duration, args.threads)
+        results = {s.name: (s.level, s.stop()) for s in services}
+        counts = sink.counts()
+    finally:
+        for s in services:
+            s.kill()
+    return latencies, errors, counts, results
+
+
+def merged_hops(results, level):
+    histogram = tracing_lib.LatencyHistogram(HOP_BUCKETS_MS)
+    for service_level, result in results.values():
+        if service_level != level:
+            continue
+        # a bucket's upper bound lands in that bucket again, inf in the overflow one
+        for idx, count in enumerate(result["counts"]):
+            histogram.record(HOP_BUCKETS_MS[idx] if idx < len(HOP_BUCKETS_MS) else float("inf"), count)
+    return histogram
+
+
+def report(depth, fanout, runs, args):
+    services = len(layout(depth, fanout))
+    print(f"\ndepth {depth}, fanout {fanout}: {services} services")
+    print(f"{'mode':4s} {'req/s':>7s} {'p50_ms':>7s} {'p99_ms':>7s} {'errors':>7s} {'cpu_ms':>7s} {'spans/req':>9s} "
+          f"{'logs/req':>8s} {'kB/req':>7s}")
+    for mode, (latencies, errors, counts, results) in runs.items():
+        requests = max(1, len(latencies) + sum(errors.values()))
+        cpu = sum(result["cpu"] for _, result in results.values())
+        print(f"{mode:4s} {requests / args.duration:7.0f} {percentile(latencies, 0.5):7.2f} "
+              f"{percentile(latencies, 0.99):7.2f} {sum(errors.values()) / requests * 100:6.1f}% "
+              f"{cpu / requests * 1000:7.2f} {counts['spans'] / requests:9.2f} {counts['logs'] / requests:8.2f} "
+              f"{counts['bytes'] / requests / 1024:7.2f}")
+    print(f"{'hop':4s} {'services':>8s} " + " ".join(f"{f'p50_{m}':>7s} {f'p99_{m}':>7s} {f'cpu_{m}':>7s}"
+                                                     for m in runs))
+    for level in range(depth):
+        row = []
+        for latencies, errors, counts, results in runs.values():
+            requests = max(1, len(latencies) + sum(errors.values()))
+            hops = merged_hops(results, level)
+            cpu = sum(result["cpu"] for service_level, result in results.values() if service_level == level)
+            row.append(f"{hops.percentile(0.5) or 0:7} {hops.percentile(0.99) or 0:7} {cpu / requests * 1000:7.2f}")
+        print(f"{level:<4d} {fanout ** level:8d} " + " ".join(row))
+
+
+def main(args):
+    import otlp_sink
+
+    combos = []
+    for depth in [int(d) for d in args.depth.split(",")]:
+        for fanout in [int(f) for f in args.fanout.split(",")]:
+            # the root alone has no children, one run covers every fanout
+            combo = (depth, fanout if depth > 1 else 1)
+            if combo not in combos:
+                combos.append(combo)
+    for depth, fanout in combos:
+        if len(layout(depth, fanout)) > MAX_SERVICES:
+            sys.exit(f"depth {depth}, fanout {fanout} needs {len(layout(depth, fanout))} services, at most "
+                     f"{MAX_SERVICES}")
+    sink = otlp_sink.OtlpSink().start()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, HERE, os.environ.get("PYTHONPATH", "")]),
+               PYTHONUNBUFFERED="1", OTEL_TEST_EXPORT_PROFILE=args.profile, OTEL_TEST_EXPORT_SERVER=sink.host,
+               OTEL_TEST_EXPORT_HTTP_PORT=str(sink.http_port), OTEL_TEST_EXPORT_GRPC_PORT=str(sink.grpc_port))
+    print(f"{args.threads} client threads, {args.duration}s per run, latency {args.latency}, cpu {args.cpu}, "
+          f"error rate {args.error_rate}, sampling ratio {args.ratio}, export profile {args.profile}")
+    summary = []
+    try:
+        for depth, fanout in combos:
+            runs = {mode: run_graph(depth, fanout, mode, sink, env, args) for mode in args.modes.split(",")}
+            report(depth, fanout, runs, args)
+            summary.append((depth, fanout, runs))
+    finally:
+        sink.stop()
+    if len(summary) < 2 or set(args.modes.split(",")) != set(MODES):
+        return
+    print(f"\n{'depth':>5s} {'fanout':>6s} {'services':>8s} {'spans/req':>9s} {'cpu_off':>7s} {'cpu_on':>7s} "
+          f"{'cpu_overhead':>12s} {'p50_off':>7s} {'p50_on':>7s}")
+    for depth, fanout, runs in summary:
+        cpu, p50, spans = {}, {}, 0
+        for mode, (latencies, errors, counts, results) in runs.items():
+            requests = max(1, len(latencies) + sum(errors.values()))
+            cpu[mode] = sum(result["cpu"] for _, result in results.values()) / requests * 1000
+            p50[mode] = percentile(latencies, 0.5)
+            spans = counts["spans"] / requests if mode == "on" else spans
+        overhead = (cpu["on"] / cpu["off"] - 1) * 100 if cpu["off"] else 0
+        print(f"{depth:5d} {fanout:6d} {len(layout(depth, fanout)):8d} {spans:9.2f} {cpu['off']:7.2f} "
+              f"{cpu['on']:7.2f} {overhead:11.0f}% {p50['off']:7.2f} {p50['on']:7.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="tracing cost across synthetic call graphs of HelloHandler services")
+    parser.add_argument("--depth", default="1,2,3", help="comma separated levels of services, 1 is the root alone")
+    parser.add_argument("--fanout", default="1,2", help="comma separated children per service")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of measured load per graph and mode")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds of load before measuring")
+    parser.add_argument("--threads", type=int, default=4, help="client threads, closed loop")
+    parser.add_argument("--latency", default="exp:2", help="simulated downstream wait per hop, ms, see the header")
+    parser.add_argument("--cpu", default="fixed:0.5", help="CPU burnt per hop, ms, see the header")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests each hop fails")
+    parser.add_argument("--ratio", type=float, default=1.0, help="share of traces sampled")
+    parser.add_argument("--modes", default="off,on", help="telemetry off (no signals) and/or on (all three)")
+    parser.add_argument("--profile", default="latency", help="exporter profile of the services")
+    parser.add_argument("--service", help=argparse.SUPPRESS)
+    parser.add_argument("--level", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--targets", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    for specs in (args.latency, args.cpu):
+        for spec in specs.split("/"):
+            try:
+                parse_distribution(spec)
+            except ValueError as e:
+                parser.error(str(e))
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.service:
+        service(args)
+    else:
+        main(args)
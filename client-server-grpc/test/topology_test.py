@@ -0,0 +1,49 @@
+import os
+import random
+
+import pytest
+
+import topology_bench
+from otlp_sink import OtlpSink
+
+# test/topology_bench.py: distribution specs, the graph layout, and one small graph run end to end, where every
+# request leaves a server span per service and a client span per call in the sink.
+# run from client-server-grpc: python -m pytest test/topology_test.py
+
+
+def test_distributions():
+    random.seed(1)
+    assert topology_bench.parse_distribution("fixed:5")() == 5
+    assert topology_bench.parse_distribution("0")() == 0
+    assert 2 <= topology_bench.parse_distribution("uniform:2,8")() <= 8
+    samples = [topology_bench.parse_distribution("exp:5")() for _ in range(5000)]
+    assert 4.5 < sum(samples) / len(samples) < 5.5
+    samples = sorted(topology_bench.parse_distribution("lognormal:5,0.5")() for _ in range(5000))
+    assert 4.5 < samples[len(samples) // 2] < 5.5
+    for spec in ("exp", "uniform:1", "normal:5", "fixed:x"):
+        with pytest.raises(ValueError):
+            topology_bench.parse_distribution(spec)
+    assert [topology_bench.level_spec("exp:2/fixed:9", level) for level in range(3)] == ["exp:2", "fixed:9", "fixed:9"]
+
+
+def test_layout():
+    assert topology_bench.layout(1, 3) == [(0, 0)]
+    assert len(topology_bench.layout(3, 2)) == 7
+    assert topology_bench.layout(2, 2) == [(0, 0), (1, 0), (1, 1)]
+
+
+def test_graph_run():
+    sink = OtlpSink().start()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([topology_bench.ROOT, topology_bench.HERE]),
+               PYTHONUNBUFFERED="1", OTEL_TEST_EXPORT_PROFILE="latency", OTEL_TEST_EXPORT_SERVER=sink.host,
+               OTEL_TEST_EXPORT_HTTP_PORT=str(sink.http_port), OTEL_TEST_EXPORT_GRPC_PORT=str(sink.grpc_port))
+    args = topology_bench.parse_args(["--duration", "1", "--warmup", "0.2", "--threads", "2", "--latency", "fixed:1"])
+    try:
+        latencies, errors, counts, results = topology_bench.run_graph(2, 2, "on", sink, env, args)
+    finally:
+        sink.stop()
+    assert latencies and not errors
+    # 3 server spans and 2 client spans per request, give or take the requests in flight at the edges
+    assert 4.5 < counts["spans"] / len(latencies) < 5.5
+    assert sorted(results) == ["hop0_0", "hop1_0", "hop1_1"]
+    assert sum(results["hop1_0"][1]["counts"]) > 0
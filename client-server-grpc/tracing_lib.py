@@ -1,110 +1,1455 @@
+import ast
+import asyncio
+import atexit
+import bisect
+import collections
+import contextlib
+import copy
 import datetime
+import fcntl
+import gzip
+import json
 import logging
+import math
+import mmap
+import os
+import queue
 import random
+import re
+import signal
+import socket
+import struct
+import sys
+import threading
 import time
+import traceback
+import zlib
 
 from opentelemetry import _logs
+from opentelemetry._logs import SeverityNumber
+from opentelemetry import baggage
+from opentelemetry import context as otel_context
 from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.logging import LoggingInstrumentor
-from opentelemetry.sdk._logs import LoggingHandler, LoggerProvider
+from opentelemetry.sdk._logs import LoggingHandler, LoggerProvider, ReadableLogRecord
 from opentelemetry.sdk._logs._internal.export import BatchLogRecordProcessor
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ALWAYS_OFF
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ALWAYS_OFF, Decision, Sampler, SamplingResult, TraceIdRatioBased
 from opentelemetry.trace import SpanKind
-from opentelemetry import metrics
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics._internal.export import PeriodicExportingMetricReader
+# otel_metrics, not metrics: grpc_otel_config and the classes taking a meter provider call theirs metrics
+from opentelemetry import metrics as otel_metrics
 from opentelemetry.metrics import Observation, CallbackOptions
-from opentelemetry.instrumentation import grpc as grpc_instrumentation
 
-import helloworld_pb2
-import helloworld_pb2_grpc
 from concurrent import futures
 import grpc
 
+# the OTLP exporters, the metrics SDK, the logging and grpc instrumentations and the generated protos are
+# imported where they are first used, so a process only pays the import time of the signals it turns on
+
 # todo: is log formatting done even if trace is discarded by sampling ?
 # todo: semantics of events
 # todo: How will grpc errors show up ? e.g. timeout. how will it show up ? Python grpc error mimic.
 # todo: what is stacktrace. It may be very expensive. Should be enabled in a selectable manner. Server side control ??
+#       -> ExceptionRecorder modes, changeable at runtime through TelemetryAdmin
 
 OTEL_COLLECTOR = "34.72.18.251"
+OTLP_GRPC_PORT = 4317
+OTLP_HTTP_PORT = 4318
+
+# exporter settings per profile. transport "mixed" is the original wiring: traces and logs over OTLP/HTTP,
+# metrics over OTLP/gRPC
+EXPORTER_PROFILES = {
+    "default": dict(transport="mixed", compression=False, max_export_batch_size=512, max_queue_size=2048,
+                    schedule_delay_millis=5000, metric_export_interval_millis=60000, timeout=100,
+                    processor="batch", spool_dir=None, spool_max_bytes=64 * 1024 * 1024),
+    # large gzip batches, exported rarely: fewest requests and bytes per item, most buffering
+    "throughput": dict(transport="grpc", compression=True, max_export_batch_size=4096, max_queue_size=32768,
+                       schedule_delay_millis=5000, metric_export_interval_millis=60000, timeout=30,
+                       processor="batch", spool_dir=None, spool_max_bytes=64 * 1024 * 1024),
+    # small uncompressed batches, exported quickly: telemetry shows up within a fraction of a second
+    "latency": dict(transport="grpc", compression=False, max_export_batch_size=128, max_queue_size=4096,
+                    schedule_delay_millis=200, metric_export_interval_millis=5000, timeout=5,
+                    processor="batch", spool_dir=None, spool_max_bytes=64 * 1024 * 1024),
+}
+# processor "buffered" (any profile) uses ThreadBufferedSpanProcessor/ThreadBufferedLogProcessor instead of the
+# SDK batch processors. spool_dir routes all three signals through SpoolExporter, spooling to files in that directory
+
+# OTLP/gRPC export methods, for sending requests that are already serialized
+OTLP_GRPC_METHODS = {
+    "traces": "/opentelemetry.proto.collector.trace.v1.TraceService/Export",
+    "logs": "/opentelemetry.proto.collector.logs.v1.LogsService/Export",
+    "metrics": "/opentelemetry.proto.collector.metrics.v1.MetricsService/Export",
+}
+# failures worth retrying, the collector is down or overloaded. anything else rejects the request for good
+RETRYABLE_GRPC_CODES = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.RESOURCE_EXHAUSTED,
+                        grpc.StatusCode.ABORTED, grpc.StatusCode.CANCELLED}
+
+
+# requests.Sessions shared by the HTTP exporters of an ExporterProfile, closed by shutdown_telemetry
+http_sessions = []
+
+
+# exporter/processor settings shared by all three signals, see EXPORTER_PROFILES for the presets.
+# signals going over the same transport share one connection to the collector: the HTTP exporters use one
+# requests.Session, and the gRPC exporters are created with identical channel arguments so grpc core reuses
+# a single subchannel for them. each exporter closes its session on shutdown; the shared one ignores that, so
+# the first provider shut down does not drop the connection under the others, and shutdown_telemetry closes it.
+class ExporterProfile:
+    def __init__(self, name="default", server=OTEL_COLLECTOR, http_port=OTLP_HTTP_PORT, grpc_port=OTLP_GRPC_PORT, **settings):
+        values = dict(EXPORTER_PROFILES[name])
+        values.update(settings)
+        self.name = name
+        self.server = server
+        self.http_port = http_port
+        self.grpc_port = grpc_port
+        self.transport = values["transport"]
+        self.compression = values["compression"]
+        self.max_export_batch_size = values["max_export_batch_size"]
+        self.max_queue_size = values["max_queue_size"]
+        self.schedule_delay_millis = values["schedule_delay_millis"]
+        self.metric_export_interval_millis = values["metric_export_interval_millis"]
+        self.timeout = values["timeout"]
+        self.processor = values["processor"]
+        self.spool_dir = values["spool_dir"]
+        self.spool_max_bytes = values["spool_max_bytes"]
+        self.session = None
+
+    # profile named by $OTEL_TEST_EXPORT_PROFILE (default "default"), then overrides from a JSON file,
+    # then $OTEL_TEST_EXPORT_<SETTING> overrides, e.g. OTEL_TEST_EXPORT_COMPRESSION=true
+    @staticmethod
+    def load(path=None, env=os.environ):
+        values = {}
+        if path:
+            with open(path) as f:
+                values.update(json.load(f))
+        name = env.get("OTEL_TEST_EXPORT_PROFILE", values.pop("name", "default"))
+        for key in ["server", "http_port", "grpc_port"] + list(EXPORTER_PROFILES["default"]):
+            raw = env.get(f"OTEL_TEST_EXPORT_{key.upper()}")
+            if raw is None:
+                continue
+            if key in ("server", "transport", "processor", "spool_dir"):
+                values[key] = raw
+            elif key == "compression":
+                values[key] = raw.lower() in ("1", "true", "gzip", "on")
+            else:
+                values[key] = int(raw)
+        return ExporterProfile(name, **values)
+
+    def transport_for(self, signal):
+        if self.transport == "mixed":
+            return "grpc" if signal == "metrics" else "http"
+        return self.transport
+
+    def http_endpoint(self, signal):
+        return f"http://{self.server}:{self.http_port}/v1/{signal}"
+
+    def grpc_endpoint(self):
+        return f"http://{self.server}:{self.grpc_port}"
+
+    def http_session(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+            self.session.close = lambda: None
+            http_sessions.append(self.session)
+        return self.session
+
+    def http_args(self, signal):
+        self.http_session()
+        from opentelemetry.exporter.otlp.proto.http import Compression as HttpCompression
+        compression = HttpCompression.Gzip if self.compression else HttpCompression.NoCompression
+        return dict(endpoint=self.http_endpoint(signal), timeout=self.timeout, compression=compression, session=self.session)
+
+    def grpc_args(self):
+        compression = grpc.Compression.Gzip if self.compression else grpc.Compression.NoCompression
+        return dict(endpoint=self.grpc_endpoint(), insecure=True, timeout=self.timeout, compression=compression)
+
+    # each exporter module is imported on first use, only for the transport the signal goes over
+    def span_exporter(self):
+        if self.spool_dir:
+            return self.spool_exporter("traces")
+        if self.transport_for("traces") == "grpc":
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter as GrpcSpanExporter
+            return GrpcSpanExporter(**self.grpc_args())
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(**self.http_args("traces"))
+
+    def log_exporter(self):
+        if self.spool_dir:
+            return self.spool_exporter("logs")
+        if self.transport_for("logs") == "grpc":
+            from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter as GrpcLogExporter
+            return GrpcLogExporter(**self.grpc_args())
+        from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
+        return OTLPLogExporter(**self.http_args("logs"))
+
+    def metric_exporter(self):
+        if self.spool_dir:
+            return self.spool_exporter("metrics")
+        if self.transport_for("metrics") == "grpc":
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+            return OTLPMetricExporter(**self.grpc_args())
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter as HttpMetricExporter
+        return HttpMetricExporter(**self.http_args("metrics"))
+
+    # SpoolExporter for signal, spooling to <spool_dir>/<signal>[-<worker index>].spool. a spool file is used by
+    # one process at a time, when it is taken the next free <name>-1, <name>-2 ... is used; a restarted process
+    # takes the lowest free one and replays what an earlier process left in it
+    def spool_exporter(self, signal):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        worker = resource_attributes.get("worker.index")
+        name = signal if worker is None else f"{signal}-{worker}"
+        for idx in range(64):
+            path = os.path.join(self.spool_dir, f"{name}.spool" if idx == 0 else f"{name}-{idx}.spool")
+            try:
+                spool = DiskSpool(path, self.spool_max_bytes)
+            except BlockingIOError:
+                continue
+            return SpoolExporter(signal, spool, self.spool_sender(signal))
+        raise RuntimeError(f"no free spool file for {name} in {self.spool_dir}")
+
+    # send(payload) for a serialized OTLP export request of signal, returning "sent", "retry" (collector down or
+    # overloaded) or "rejected" (sending it again won't help). timeout is per attempt, short so a hung collector
+    # does not hold up the replay for long
+    def spool_sender(self, signal, timeout=5):
+        if self.transport_for(signal) == "grpc":
+            compression = grpc.Compression.Gzip if self.compression else grpc.Compression.NoCompression
+            channel = grpc.insecure_channel(f"{self.server}:{self.grpc_port}", compression=compression)
+            # no serializers, the payload goes out as it is
+            export = channel.unary_unary(OTLP_GRPC_METHODS[signal])
+
+            def send(payload):
+                try:
+                    export(payload, timeout=timeout)
+                    return "sent"
+                except grpc.RpcError as e:
+                    return "retry" if e.code() in RETRYABLE_GRPC_CODES else "rejected"
+            return send
+
+        import requests
+        session = self.http_session()
+        endpoint = self.http_endpoint(signal)
+        headers = {"Content-Type": "application/x-protobuf"}
+        if self.compression:
+            headers["Content-Encoding"] = "gzip"
+
+        def send(payload):
+            try:
+                response = session.post(endpoint, data=gzip.compress(payload) if self.compression else payload,
+                                        headers=headers, timeout=timeout)
+            except requests.RequestException:
+                return "retry"
+            if response.ok:
+                return "sent"
+            return "retry" if response.status_code in (408, 429) or response.status_code >= 500 else "rejected"
+        return send
+
+    def span_processor(self):
+        if self.processor == "buffered":
+            return ThreadBufferedSpanProcessor(self.span_exporter(), schedule_delay_millis=self.schedule_delay_millis,
+                                               max_export_batch_size=self.max_export_batch_size,
+                                               max_queue_size=self.max_queue_size)
+        return BatchSpanProcessor(self.span_exporter(), max_queue_size=self.max_queue_size,
+                                  schedule_delay_millis=self.schedule_delay_millis,
+                                  max_export_batch_size=self.max_export_batch_size)
+
+    def log_processor(self):
+        if self.processor == "buffered":
+            return ThreadBufferedLogProcessor(self.log_exporter(), schedule_delay_millis=self.schedule_delay_millis,
+                                              max_export_batch_size=self.max_export_batch_size,
+                                              max_queue_size=self.max_queue_size)
+        return BatchLogRecordProcessor(self.log_exporter(), max_queue_size=self.max_queue_size,
+                                       schedule_delay_millis=self.schedule_delay_millis,
+                                       max_export_batch_size=self.max_export_batch_size)
+
+    def metric_reader(self):
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        return PeriodicExportingMetricReader(self.metric_exporter(), export_interval_millis=self.metric_export_interval_millis)
+
+    def __repr__(self):
+        return (f"ExporterProfile({self.name}, transport={self.transport}, compression={self.compression}, "
+                f"batch={self.max_export_batch_size}, queue={self.max_queue_size}, delay={self.schedule_delay_millis}ms, "
+                f"metric_interval={self.metric_export_interval_millis}ms"
+                + (f", processor={self.processor}" if self.processor != "batch" else "")
+                + (f", spool={self.spool_dir}" if self.spool_dir else "") + ")")
+
+
+# size capped ring buffer of byte records in a memory mapped file, kept across restarts. each record is its
+# length and crc32 followed by the payload, and may wrap around the end of the file. when a new record does not
+# fit, the oldest ones are dropped (counted in dropped). a file that is not a spool of the same capacity, or a
+# record failing its crc, starts the spool over empty. the file is flock()ed, a second process opening it gets
+# BlockingIOError
+class DiskSpool:
+    MAGIC = b"OTSPOOL1"
+    # magic, capacity, head offset, bytes used, records
+    HEADER = struct.Struct("<8sQQQQ")
+    # payload length, crc32
+    RECORD = struct.Struct("<II")
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.capacity = max_bytes
+        self.dropped = 0
+        # records popped or dropped so far, identifies the record peek() returned
+        self.removed = 0
+        self.lock = threading.Lock()
+        self.file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise
+        size = self.HEADER.size + self.capacity
+        if os.fstat(self.file.fileno()).st_size != size:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        magic, capacity, self.head, self.used, self.records = self.HEADER.unpack_from(self.map, 0)
+        if magic != self.MAGIC or capacity != self.capacity or self.head >= capacity or self.used > capacity:
+            self.reset()
+
+    def reset(self):
+        self.head = self.used = self.records = 0
+        self.save_header()
+
+    def save_header(self):
+        self.HEADER.pack_into(self.map, 0, self.MAGIC, self.capacity, self.head, self.used, self.records)
+
+    def write_at(self, pos, data):
+        start = self.HEADER.size
+        first = min(len(data), self.capacity - pos)
+        self.map[start + pos:start + pos + first] = data[:first]
+        if first < len(data):
+            self.map[start:start + len(data) - first] = data[first:]
+
+    def read_at(self, pos, length):
+        start = self.HEADER.size
+        first = min(length, self.capacity - pos)
+        data = self.map[start + pos:start + pos + first]
+        if first < length:
+            data += self.map[start:start + length - first]
+        return data
+
+    # returns False when the record is larger than the whole spool
+    def append(self, payload):
+        size = self.RECORD.size + len(payload)
+        with self.lock:
+            if size > self.capacity:
+                self.dropped += 1
+                return False
+            while self.used + size > self.capacity:
+                self.remove()
+                self.dropped += 1
+            self.write_at((self.head + self.used) % self.capacity, self.RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.used += size
+            self.records += 1
+            self.save_header()
+        return True
+
+    # (token, payload) of the oldest record, (None, None) when empty. pop(token) removes it once it is handled
+    def peek(self):
+        with self.lock:
+            if not self.records:
+                return None, None
+            length, crc = self.RECORD.unpack(self.read_at(self.head, self.RECORD.size))
+            if length + self.RECORD.size > self.used:
+                self.dropped += self.records
+                self.reset()
+                return None, None
+            payload = self.read_at((self.head + self.RECORD.size) % self.capacity, length)
+            if zlib.crc32(payload) != crc:
+                self.dropped += self.records
+                self.reset()
+                return None, None
+            return self.removed, payload
+
+    # removes the record peek() returned, unless it was dropped meanwhile
+    def pop(self, token):
+        with self.lock:
+            if token == self.removed and self.records:
+                self.remove()
+                self.save_header()
+
+    # drop the oldest record, caller holds the lock
+    def remove(self):
+        length, _ = self.RECORD.unpack(self.read_at(self.head, self.RECORD.size))
+        size = self.RECORD.size + length
+        self.head = (self.head + size) % self.capacity
+        self.used -= size
+        self.records -= 1
+        self.removed += 1
+        if not self.records:
+            self.head = self.used = 0
+
+    def __len__(self):
+        return self.records
+
+    def close(self):
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+
+
+# exporter for any of the three signals that never waits on the collector: export() serializes the batch to an
+# OTLP export request and appends it to a DiskSpool, and a sender thread replays the spool in order through
+# send (ExporterProfile.spool_sender). while the collector is unreachable the sender retries with exponential
+# backoff and jitter (backoff up to max_backoff seconds) and the spool keeps the data, up to its size cap. what
+# is spooled survives a restart and is sent by the next process opening the same spool.
+# force_flush waits for the spool to drain. shutdown waits up to shutdown_timeout for it while the collector is
+# reachable, whatever is left stays on disk
+class SpoolExporter:
+    def __init__(self, signal, spool, send, backoff=0.5, max_backoff=30.0, shutdown_timeout=5.0):
+        self.signal = signal
+        self.spool = spool
+        self.send = send
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.shutdown_timeout = shutdown_timeout
+        self.sent = 0
+        self.rejected = 0
+        self.failures = 0
+        # the last send had to be retried
+        self.down = False
+        if signal == "traces":
+            from opentelemetry.sdk.trace.export import SpanExportResult as Result
+        elif signal == "logs":
+            from opentelemetry.sdk._logs.export import LogRecordExportResult as Result
+        else:
+            from opentelemetry.sdk.metrics.export import MetricExportResult as Result
+        self.result = Result
+        # what PeriodicExportingMetricReader takes from a MetricExporter: the SDK defaults
+        self._preferred_temporality = None
+        self._preferred_aggregation = None
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"spool-{signal}", daemon=True)
+        self.thread.start()
+
+    def encode(self, batch):
+        if self.signal == "traces":
+            from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+            return encode_spans(batch)
+        if self.signal == "logs":
+            from opentelemetry.exporter.otlp.proto.common._log_encoder import encode_logs
+            return encode_logs(batch)
+        from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+        return encode_metrics(batch)
+
+    # the SpanExporter, LogRecordExporter and MetricExporter export() in one
+    def export(self, batch, timeout_millis=None, **kwargs):
+        if self.stopped.is_set() or not self.spool.append(self.encode(batch).SerializeToString()):
+            return self.result.FAILURE
+        self.wakeup.set()
+        return self.result.SUCCESS
+
+    def run(self):
+        delay = self.backoff
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            token, payload = self.spool.peek()
+            if payload is None:
+                self.wakeup.wait(1)
+                continue
+            result = self.send(payload)
+            if result == "retry":
+                self.failures += 1
+                self.down = True
+                self.stopped.wait(random.uniform(delay / 2, delay))
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            self.down = False
+            delay = self.backoff
+            if result == "rejected":
+                self.rejected += 1
+            else:
+                self.sent += 1
+            self.spool.pop(token)
+
+    def force_flush(self, timeout_millis=30000):
+        deadline = time.monotonic() + timeout_millis / 1000
+        while len(self.spool) and not self.stopped.is_set():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout_millis=None, **kwargs):
+        if self.stopped.is_set():
+            return
+        if not self.down:
+            self.force_flush(self.shutdown_timeout * 1000)
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join()
+        self.spool.close()
+
+
+# span/log processor set up by configure_tracing/configure_logging, by signal
+export_processors = {}
+
 
+# added to the Resource of every provider configure_* creates, e.g. the pid and index of a pre-forked worker
+resource_attributes = {}
 
-def configure_metrics(server=OTEL_COLLECTOR, service_name="metrics_test"):
-    exporter = OTLPMetricExporter(endpoint=f"http://{server}:4317", insecure=True)
-    # reader = PeriodicExportingMetricReader(exporter, export_interval_millis=5000)
-    reader = PeriodicExportingMetricReader(exporter)
-    provider = MeterProvider(metric_readers=[reader], resource=Resource(attributes={SERVICE_NAME: service_name}))
-    metrics.set_meter_provider(provider)
-    return metrics
+
+def make_resource(attributes):
+    return Resource(attributes={**attributes, **resource_attributes})
+
+
+# profile=ExporterProfile(...) replaces server/port with the profile's transport, batching and compression
+def configure_metrics(server=OTEL_COLLECTOR, service_name="metrics_test", port=OTLP_GRPC_PORT, profile=None):
+    from opentelemetry.sdk.metrics import MeterProvider
+    if profile is not None:
+        reader = profile.metric_reader()
+    else:
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        exporter = OTLPMetricExporter(endpoint=f"http://{server}:{port}", insecure=True)
+        # reader = PeriodicExportingMetricReader(exporter, export_interval_millis=5000)
+        reader = PeriodicExportingMetricReader(exporter)
+    provider = MeterProvider(metric_readers=[reader], resource=make_resource({SERVICE_NAME: service_name}))
+    otel_metrics.set_meter_provider(provider)
+    return otel_metrics
     # meter = metrics.get_meter(service_name)
     # return exporter,meter
 
 
 # setup app tracing to send traces to otel collector
-def configure_tracing(server=OTEL_COLLECTOR, service_name="trace_test"):
-    endpoint = f"http://{server}:4318/v1/traces"
-    trace_processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, timeout=100))
-    tracer_provider = TracerProvider(resource=Resource(attributes={SERVICE_NAME: service_name}), sampler=ALWAYS_ON)
+def configure_tracing(server=OTEL_COLLECTOR, service_name="trace_test", port=OTLP_HTTP_PORT, sampler=ALWAYS_ON, profile=None):
+    if profile is not None:
+        trace_processor = profile.span_processor()
+    else:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        endpoint = f"http://{server}:{port}/v1/traces"
+        trace_processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, timeout=100))
+    tracer_provider = TracerProvider(resource=make_resource({SERVICE_NAME: service_name}), sampler=sampler)
     trace.set_tracer_provider(tracer_provider)
     tracer_provider.add_span_processor(trace_processor)
+    export_processors["traces"] = trace_processor
+    limiter = tenant_rate_limiter(sampler)
+    if limiter is not None and limiter.backlog is None:
+        limiter.backlog = lambda: queue_fill(trace_processor)
     _tracer = trace.get_tracer("harmeet-trace-test")
     return _tracer
 
 
-# setup app to send logs to otel collector
-def configure_logging(server=OTEL_COLLECTOR, service_name="log_test", tenant="test_tenant"):
-    endpoint = f"http://{server}:4318/v1/logs"
-    log_processor = BatchLogRecordProcessor(OTLPLogExporter(endpoint=endpoint, timeout=100))
-    logger_provider = LoggerProvider(resource=Resource(attributes={SERVICE_NAME: "harmeet-log-test", "tenant_id": tenant}))
+# (queued items, capacity) of a BatchSpanProcessor/BatchLogRecordProcessor, (0, 0) if it can't be read.
+# the queue is internal to the SDK: newer releases keep it on _batch_processor, older ones on the processor itself
+def queue_depth(processor):
+    if isinstance(processor, ThreadBufferedProcessor):
+        return processor.depth()
+    batch_processor = getattr(processor, "_batch_processor", processor)
+    queue = getattr(batch_processor, "_queue", None)
+    if queue is None:
+        queue = getattr(batch_processor, "queue", None)
+    if queue is None:
+        return 0, 0
+    return len(queue), queue.maxlen or 0
+
+
+# fraction (0..1) of the processor's queue in use
+def queue_fill(processor):
+    depth, capacity = queue_depth(processor)
+    return depth / capacity if capacity else 0.0
+
+
+# one producer thread's items in emit order. only that thread appends and only the flusher
+# pops, both atomic deque operations, so neither takes a lock
+class ThreadBuffer:
+    def __init__(self):
+        self.items = collections.deque()
+        # when the oldest item waiting was emitted (monotonic), set when the buffer goes from empty to not
+        self.since = 0.0
+        self.dropped = 0
+        self.thread = threading.current_thread()
+
+
+# drop-in for BatchSpanProcessor/BatchLogRecordProcessor where producers don't share a queue: each thread emits
+# into its own ThreadBuffer, and one flusher thread drains all of them in bulk every schedule_delay_millis, or as
+# soon as a thread has max_export_batch_size waiting, and exports in batches of at most that size.
+# max_queue_size bounds each thread's buffer, items beyond it are dropped and counted. force_flush exports what
+# is buffered and shutdown flushes then shuts the exporter down, as the SDK processors do. emit only timestamps
+# a buffer when it goes from empty to not, so queue_latency (a LatencyHistogram, ms) gets, for every item taken
+# from a buffer, the age of the oldest item waiting in it: an upper bound of each item's emit to export latency
+class ThreadBufferedProcessor:
+    def __init__(self, exporter, schedule_delay_millis=5000, max_export_batch_size=512, max_queue_size=2048,
+                 name="telemetry"):
+        self.exporter = exporter
+        self.schedule_delay = schedule_delay_millis / 1000
+        self.max_export_batch_size = max_export_batch_size
+        self.max_queue_size = max_queue_size
+        self.buffers = []
+        self.local = threading.local()
+        self.exported = 0
+        # drops of buffers already pruned
+        self.pruned_dropped = 0
+        self.queue_latency = LatencyHistogram()
+        # taken to register a new thread's buffer, and around every export
+        self.lock = threading.Lock()
+        self.export_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.done = False
+        self.thread = threading.Thread(target=self.run, name=f"{name}-flusher", daemon=True)
+        self.thread.start()
+
+    def emit(self, item):
+        if self.done:
+            return
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            buffer = self.local.buffer = ThreadBuffer()
+            with self.lock:
+                self.buffers.append(buffer)
+        items = buffer.items
+        waiting = len(items)
+        if waiting >= self.max_queue_size:
+            buffer.dropped += 1
+            return
+        if not waiting:
+            buffer.since = time.monotonic()
+        items.append(item)
+        if waiting >= self.max_export_batch_size - 1 and not self.wakeup.is_set():
+            self.wakeup.set()
+
+    def run(self):
+        while not self.done:
+            self.wakeup.wait(self.schedule_delay)
+            self.wakeup.clear()
+            if not self.done:
+                self.export_all()
+
+    # pop up to limit items across the thread buffers
+    def collect(self, limit):
+        batch = []
+        now = time.monotonic()
+        with self.lock:
+            buffers = list(self.buffers)
+        for buffer in buffers:
+            items = buffer.items
+            since = buffer.since
+            taken = len(batch)
+            while len(batch) < limit:
+                try:
+                    batch.append(items.popleft())
+                except IndexError:
+                    break
+            if len(batch) > taken:
+                self.queue_latency.record((now - since) * 1000, len(batch) - taken)
+            if len(batch) >= limit:
+                break
+        return batch
+
+    # export everything buffered, until deadline (monotonic) if given. returns False if it ran out of time
+    def export_all(self, deadline=None):
+        with self.export_lock:
+            # exporting must not create spans of its own (grpc/requests instrumentation)
+            token = otel_context.attach(otel_context.set_value(otel_context._SUPPRESS_INSTRUMENTATION_KEY, True))
+            try:
+                while True:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        return False
+                    batch = self.collect(self.max_export_batch_size)
+                    if not batch:
+                        break
+                    try:
+                        self.exporter.export(batch)
+                    except Exception:
+                        logging.getLogger(__name__).exception("export failed")
+                    self.exported += len(batch)
+            finally:
+                otel_context.detach(token)
+            self.prune()
+        return True
+
+    # forget drained buffers of threads that have exited
+    def prune(self):
+        with self.lock:
+            keep = [b for b in self.buffers if b.items or b.thread.is_alive()]
+            self.pruned_dropped += sum(b.dropped for b in self.buffers if b not in keep)
+            self.buffers = keep
+
+    def dropped(self):
+        with self.lock:
+            return self.pruned_dropped + sum(b.dropped for b in self.buffers)
+
+    # (items buffered, capacity) for queue_depth(); capacity is per thread, so this is the fullest buffer
+    def depth(self):
+        with self.lock:
+            fullest = max((len(b.items) for b in self.buffers), default=0)
+        return fullest, self.max_queue_size
+
+    def force_flush(self, timeout_millis=30000):
+        if self.done:
+            return False
+        return self.export_all(time.monotonic() + timeout_millis / 1000)
+
+    def shutdown(self, timeout_millis=30000):
+        if self.done:
+            return
+        self.done = True
+        self.wakeup.set()
+        self.thread.join(timeout_millis / 1000)
+        self.export_all(time.monotonic() + timeout_millis / 1000)
+        self.exporter.shutdown()
+
+    def observe_dropped(self, options: CallbackOptions = CallbackOptions()):
+        yield Observation(self.dropped())
+
+    def observe_queue_latency_p99(self, options: CallbackOptions = CallbackOptions()):
+        value = self.queue_latency.percentile(0.99)
+        if value is not None:
+            yield Observation(value)
+
+
+class ThreadBufferedSpanProcessor(ThreadBufferedProcessor, SpanProcessor):
+    def __init__(self, exporter, **settings):
+        ThreadBufferedProcessor.__init__(self, exporter, name="span", **settings)
+
+    def on_start(self, span, parent_context=None):
+        pass
+
+    def on_end(self, span):
+        if span.context and span.context.trace_flags.sampled:
+            self.emit(span)
+
+
+class ThreadBufferedLogProcessor(ThreadBufferedProcessor):
+    def __init__(self, exporter, **settings):
+        ThreadBufferedProcessor.__init__(self, exporter, name="log", **settings)
+
+    # the same conversion BatchLogRecordProcessor does: a readable record, without the context it was emitted in
+    def on_emit(self, log_record):
+        record = copy.copy(log_record.log_record)
+        record.context = otel_context.Context()
+        resource = log_record.resource if log_record.resource is not None else Resource.create({})
+        self.emit(ReadableLogRecord(log_record=record, resource=resource,
+                                    instrumentation_scope=log_record.instrumentation_scope, limits=log_record.limits))
+
+
+# tenant of a new span: its tenant_id attribute, else the tenant_id baggage entry set by the caller
+def span_tenant(parent_context, attributes):
+    tenant = attributes.get("tenant_id") if attributes else None
+    if tenant is None:
+        tenant = baggage.get_baggage("tenant_id", parent_context)
+    return tenant
+
+
+# caps new root spans per second per tenant_id with a token bucket per tenant. spans with a parent (local or
+# from an upstream service) follow the parent's decision, so a trace is kept or dropped as a whole.
+# the rate is scaled down while the export queue is filling up and recovers once it drains. a bucket holds at
+# most one second worth of spans, and at least one span, so rates under 1/s still sample now and then; 0 samples
+# nothing.
+class TenantRateLimitedSampler(Sampler):
+    def __init__(self, spans_per_second=50, tenant_limits=None, default_tenant="unknown", backlog=None,
+                 high_backlog=0.5, low_backlog=0.1, min_scale=0.05, adjust_interval=1.0, max_tenants=100):
+        self.spans_per_second = spans_per_second
+        self.tenant_limits = dict(tenant_limits or {})
+        self.default_tenant = default_tenant
+        # callable returning export queue fill 0..1, set by configure_tracing when not given
+        self.backlog = backlog
+        self.high_backlog = high_backlog
+        self.low_backlog = low_backlog
+        self.min_scale = min_scale
+        self.adjust_interval = adjust_interval
+        self.max_tenants = max_tenants
+        self.scale = 1.0
+        self.next_adjust = time.monotonic() + adjust_interval
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    # configured spans/s for a tenant, before backlog scaling
+    def limit(self, tenant):
+        return self.tenant_limits.get(tenant, self.spans_per_second)
+
+    # spans/s currently allowed for a tenant
+    def current_rate(self, tenant):
+        return self.limit(tenant) * self.scale
+
+    def set_limit(self, tenant, spans_per_second):
+        with self.lock:
+            self.tenant_limits[tenant] = spans_per_second
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        parent = trace.get_current_span(parent_context).get_span_context()
+        if parent.is_valid:
+            if parent.trace_flags.sampled:
+                return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes, parent.trace_state)
+            return SamplingResult(Decision.DROP, None, parent.trace_state)
+        tenant = span_tenant(parent_context, attributes) or self.default_tenant
+        if self.acquire(tenant):
+            return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes, trace_state)
+        return SamplingResult(Decision.DROP, None, trace_state)
+
+    def acquire(self, tenant):
+        now = time.monotonic()
+        with self.lock:
+            if now >= self.next_adjust:
+                self.adjust(now)
+            bucket = self.buckets.get(tenant)
+            if bucket is None:
+                if len(self.buckets) >= self.max_tenants:
+                    tenant = OTHER_TENANT
+                    bucket = self.buckets.get(tenant)
+            rate = self.current_rate(tenant)
+            burst = max(1.0, rate) if rate > 0 else 0.0
+            if bucket is None:
+                bucket = [burst, now]
+                self.buckets[tenant] = bucket
+            # refill
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            return False
+
+    # multiplicative decrease while the export queue is backed up, gradual recovery once it drains
+    def adjust(self, now):
+        self.next_adjust = now + self.adjust_interval
+        if self.backlog is None:
+            return
+        fill = self.backlog()
+        if fill >= self.high_backlog:
+            self.scale = max(self.min_scale, self.scale * 0.5)
+        elif fill <= self.low_backlog:
+            self.scale = min(1.0, self.scale * 1.25)
+
+    def get_description(self):
+        return f"TenantRateLimitedSampler{{{self.spans_per_second}/s}}"
+
+
+# samples ratio (0..1) of new root spans, by trace id like TraceIdRatioBased, and leaves the ones it keeps to
+# inner; spans with a parent follow the parent's decision. grpc_otel_config always puts one in front of its
+# sampler, so the ratio can be changed at runtime (set_ratio, TelemetryAdmin)
+class AdjustableSampler(Sampler):
+    def __init__(self, inner=ALWAYS_ON, ratio=1.0):
+        self.inner = inner
+        self.set_ratio(ratio)
+
+    def set_ratio(self, ratio):
+        if not 0 <= ratio <= 1:
+            raise ValueError(f"sampling ratio {ratio} is not between 0 and 1")
+        self.ratio = ratio
+        self.bound = TraceIdRatioBased.get_bound_for_rate(ratio)
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        parent = trace.get_current_span(parent_context).get_span_context()
+        if parent.is_valid:
+            if parent.trace_flags.sampled:
+                return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes, parent.trace_state)
+            return SamplingResult(Decision.DROP, None, parent.trace_state)
+        if trace_id & TraceIdRatioBased.TRACE_ID_LIMIT >= self.bound:
+            return SamplingResult(Decision.DROP, None, trace_state)
+        return self.inner.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+
+    def get_description(self):
+        return f"AdjustableSampler{{{self.ratio}, {self.inner.get_description()}}}"
+
+
+# the TenantRateLimitedSampler of sampler, which may be one itself or the inner sampler of an AdjustableSampler
+def tenant_rate_limiter(sampler):
+    if isinstance(sampler, AdjustableSampler):
+        sampler = sampler.inner
+    return sampler if isinstance(sampler, TenantRateLimitedSampler) else None
+
+
+# sampler of the configured tracer provider, None when tracing is not set up with the SDK
+def active_sampler():
+    return getattr(trace.get_tracer_provider(), "sampler", None)
+
+
+def is_sampled(span):
+    return span.get_span_context().trace_flags.sampled
+
+
+# makes tenant_id baggage current, so the sampler sees the tenant of new root spans (e.g. the client span of an
+# outbound call) and downstream services receive it with the propagated context
+@contextlib.contextmanager
+def tenant_baggage(tenant):
+    token = otel_context.attach(baggage.set_baggage("tenant_id", tenant))
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
+
+
+# setup app to send logs to otel collector.
+# sampling_aware=True drops records of unsampled traces below unsampled_level before they are translated
+# (see LogSamplingPolicy), and installs SamplingAwareLoggingHandler which translates each record once
+def configure_logging(server=OTEL_COLLECTOR, service_name="log_test", tenant="test_tenant", port=OTLP_HTTP_PORT,
+                      sampling_aware=False, unsampled_level=logging.CRITICAL, profile=None):
+    if profile is not None:
+        log_processor = profile.log_processor()
+    else:
+        from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
+        endpoint = f"http://{server}:{port}/v1/logs"
+        log_processor = BatchLogRecordProcessor(OTLPLogExporter(endpoint=endpoint, timeout=100))
+    logger_provider = LoggerProvider(resource=make_resource({SERVICE_NAME: "harmeet-log-test", "tenant_id": tenant}))
     _logs.set_logger_provider(logger_provider)
     logger_provider.add_log_record_processor(log_processor)
+    export_processors["logs"] = log_processor
 
     # Automatically inject trace context into logs
+    from opentelemetry.instrumentation.logging import LoggingInstrumentor
     instrumentation = LoggingInstrumentor()
     instrumentation.instrument()
 
     # Setup logger
     _logger = logging.getLogger("basic_otlp_test")
     # Set up logging to use the OpenTelemetry logging integration
-    handler = LoggingHandler()
+    if sampling_aware:
+        log_policy.unsampled_level = unsampled_level
+        handler = SamplingAwareLoggingHandler()
+    else:
+        handler = LoggingHandler()
     _logger.addHandler(handler)
     return _logger
 
 
-class DynamicLogLevelHandler(LoggingHandler):
+# decides whether a log call is worth making, before the message is formatted or a LogRecord is created:
+# the logger must be enabled for the level, and records below unsampled_level are skipped while the active
+# span belongs to a trace that is not sampled. unsampled_level=None turns the sampling check off.
+class LogSamplingPolicy:
+    def __init__(self, unsampled_level=None):
+        self.unsampled_level = unsampled_level
+
+    def allows(self, level, span=None):
+        if self.unsampled_level is None or level >= self.unsampled_level:
+            return True
+        span_context = (span or trace.get_current_span()).get_span_context()
+        return not span_context.is_valid or span_context.trace_flags.sampled
+
+    def enabled(self, _logger, level, span=None):
+        return _logger.isEnabledFor(level) and self.allows(level, span)
+
+
+# process wide policy, set by configure_logging(sampling_aware=True)
+log_policy = LogSamplingPolicy()
+
+
+# lazy log call: msg is a %-format string (formatted once, at export) or a callable returning the message,
+# neither is evaluated when the logger level or the sampling policy skips the record
+def log_lazy(_logger, level, msg, *args, span=None):
+    if not log_policy.enabled(_logger, level, span):
+        return
+    if callable(msg):
+        msg = msg()
+    _logger.log(level, msg, *args)
+
+
+# where emit() sends a message: the console (diagnostics), an OTLP log record, an event on the span
+EMIT_SINKS = ("console", "log", "event")
+
+# emit policies by name: level -> (sinks while the span is sampled, sinks while it is not), see EmitPolicy
+EMIT_POLICIES = {
+    # every message as a log record and as a span event, what HelloHandler.log_msg always did (the default)
+    "all": {logging.NOTSET: (("console", "log", "event"), ("console", "log"))},
+    # one copy per message: the span event when the trace is sampled, since it is exported with the trace,
+    # else the log record. CRITICAL goes to both, so log based alerting still sees it. opt in, log based queries
+    # then miss the messages of sampled traces
+    "dedup": {logging.NOTSET: (("console", "event"), ("console", "log")),
+              logging.CRITICAL: (("console", "log", "event"), ("console", "log"))},
+    "log": {logging.NOTSET: (("console", "log"), ("console", "log"))},
+    "event": {logging.NOTSET: (("console", "event"), ("console",))},
+}
+
+
+# picks the sinks of a message by its level and by whether its span is sampled. rules is an EMIT_POLICIES name
+# or a dict like its values; a message takes the rule of the highest level at or below its own (the lowest
+# rule below that). events of unsampled spans are never exported, so "event" is ignored for them.
+# configure() may be called at runtime (TelemetryAdmin)
+class EmitPolicy:
+    def __init__(self, rules="all"):
+        self.configure(rules)
+
+    def configure(self, rules):
+        name = "custom"
+        if isinstance(rules, str):
+            if rules not in EMIT_POLICIES:
+                raise ValueError(f"unknown emit policy {rules}, expected one of {tuple(EMIT_POLICIES)}")
+            name, rules = rules, EMIT_POLICIES[rules]
+        table = []
+        for level in sorted(rules):
+            sampled, unsampled = rules[level]
+            unknown = set(sampled).union(unsampled).difference(EMIT_SINKS)
+            if unknown:
+                raise ValueError(f"unknown emit sinks {sorted(unknown)}, expected some of {EMIT_SINKS}")
+            table.append((level, frozenset(sampled), frozenset(unsampled) - {"event"}))
+        # one assignment, emit() may be reading it on other threads
+        self.state = (name, [rule[0] for rule in table], table)
+
+    @property
+    def name(self):
+        return self.state[0]
+
+    def sinks(self, level, sampled):
+        _, levels, table = self.state
+        rule = table[max(0, bisect.bisect_right(levels, level) - 1)]
+        return rule[1] if sampled else rule[2]
+
+
+# process wide policy used by emit(), set by grpc_otel_config
+emit_policy = EmitPolicy()
+
+
+# emits a message to the sinks emit_policy picks for level and for the sampling state of span (the current span
+# when None). prefix + msg % args is formatted once, only when the message goes anywhere, and the same string is
+# the console line, the log record body and the span event name. the logger level and log_policy gate it first
+def emit(_logger, level, msg, *args, span=None, prefix=""):
+    span = span or trace.get_current_span()
+    if not log_policy.enabled(_logger, level, span):
+        return
+    sinks = emit_policy.sinks(level, span.get_span_context().trace_flags.sampled)
+    if not sinks:
+        return
+    text = prefix + (msg % args if args else msg)
+    if "console" in sinks:
+        diagnostics.print(text)
+    if "log" in sinks:
+        diagnostics.log(_logger, level, text, stacklevel=2)
+    if "event" in sinks and span.is_recording():
+        span.add_event(text)
+
+
+# LoggingHandler that applies the sampling policy before translating, and translates each record once
+class SamplingAwareLoggingHandler(LoggingHandler):
+    def __init__(self, level=logging.NOTSET, logger_provider=None, policy=None):
+        super().__init__(level=level, logger_provider=logger_provider)
+        self.policy = policy or log_policy
+        self.otel_loggers = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self.policy.allows(record.levelno):
+            return
+        self.emit_translated(record, self._translate(record))
+
+    def emit_translated(self, record, rec):
+        otel_logger = self.otel_loggers.get(record.name)
+        if otel_logger is None:
+            otel_logger = _logs.get_logger(record.name, logger_provider=self._logger_provider)
+            self.otel_loggers[record.name] = otel_logger
+        otel_logger.emit(rec)
+
+
+# raises records of sampled traces to ERROR, so they pass severity filters downstream
+class DynamicLogLevelHandler(SamplingAwareLoggingHandler):
     def __init__(
             self,
             level=logging.NOTSET,
             logger_provider=None,
 
     ) -> None:
-        super().__init__(level=level, logger_provider=logger_provider)
+        super().__init__(level=level, logger_provider=logger_provider, policy=LogSamplingPolicy())
 
     def emit(self, record: logging.LogRecord) -> None:
         rec = self._translate(record)
-        is_sampled = rec.trace_flags > 0
-        print(f"sampled={is_sampled}, severity={rec.severity_number}, {rec.severity_text}")
-        if is_sampled:
-            rec.severity_number = 40
+        sampled = is_sampled(trace.get_current_span())
+        diagnostics.print("sampled=%s, severity=%s, %s", sampled, rec.severity_number, rec.severity_text)
+        if sampled:
+            rec.severity_number = SeverityNumber.ERROR
             rec.severity_text = "ERROR"
-        super().emit(record=record)
+        self.emit_translated(record, rec)
+
+
+# moves console output and log handler calls off the request path: callers enqueue, a background thread
+# writes. the queue is bounded, when it is full the item is dropped and counted instead of blocking the caller.
+# the caller's OTel context is captured and re-attached in the writer, so log records keep their trace ids.
+class DiagnosticsSink:
+    def __init__(self, max_queue=10000, stream=None):
+        self.queue = queue.Queue(maxsize=max_queue)
+        # None writes to sys.stdout as it is at write time
+        self.stream = stream
+        self.dropped = 0
+        self.errors = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="diagnostics-sink", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    # run fn(*args) on the writer thread, returns False if it was dropped
+    def submit(self, fn, *args):
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait((otel_context.get_current(), fn, args))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+    # print msg % args, formatted on the writer thread
+    def print(self, msg, *args):
+        return self.submit(self.write, msg, args)
+
+    # print prefix + span_info(span context), formatted on the writer thread
+    def print_span(self, prefix, span):
+        return self.submit(self.write_span, prefix, span.get_span_context())
+
+    # the LogRecord is made here, on the caller's thread, so its time, thread and source location are the caller's
+    # (stacklevel as in Logger.log, 1 is the function calling this); only the handlers run on the writer thread
+    def log(self, _logger, level, msg, *args, stacklevel=1):
+        if not _logger.isEnabledFor(level):
+            return False
+        fn, lno, func, sinfo = _logger.findCaller(stacklevel=stacklevel + 1)
+        record = _logger.makeRecord(_logger.name, level, fn, lno, msg, args, None, func, None, sinfo)
+        return self.submit(_logger.handle, record)
+
+    def write(self, msg, args):
+        (self.stream or sys.stdout).write((msg % args if args else msg) + "\n")
+
+    def write_span(self, prefix, span_context):
+        (self.stream or sys.stdout).write(f"{prefix}{span_info(span_context)}\n")
+
+    def run(self):
+        while True:
+            ctx, fn, args = self.queue.get()
+            token = otel_context.attach(ctx)
+            try:
+                fn(*args)
+            except Exception:
+                self.errors += 1
+            finally:
+                otel_context.detach(token)
+                self.queue.task_done()
+
+    # in a forked child: the writer thread was not carried over, start a new one (and queue) on next use
+    def after_fork(self):
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    # wait until everything queued so far is written, at most timeout seconds
+    def flush(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def observe_dropped(self, options: CallbackOptions = CallbackOptions()):
+        yield Observation(self.dropped)
+
+
+# process wide sink used by log_msg and HelloHandler
+diagnostics = DiagnosticsSink()
+
+
+# fixed size thread pool for background span work. submit() captures the caller's OTel context (current span
+# and baggage) and attaches it in the worker, so spans started there parent correctly. at most max_queue tasks
+# may be waiting or running, beyond that submit() rejects and returns None instead of growing; max_queue=None
+# never rejects (the grpc server's pool, grpc needs a future for every call). it counts its own tasks, see occupancy
+class ContextExecutor:
+    def __init__(self, max_workers=4, max_queue=1000, name="background"):
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.running = 0
+        self.rejected = 0
+        self.closed = False
+        self.lock = threading.Lock()
 
+    def submit(self, fn, *args, **kwargs):
+        with self.lock:
+            if self.closed or (self.max_queue is not None and self.pending >= self.max_queue):
+                self.rejected += 1
+                return None
+            self.pending += 1
+            # under the lock, so shutdown() cannot close the executor in between
+            future = self.executor.submit(self.run, otel_context.get_current(), fn, args, kwargs)
+        future.add_done_callback(self.done)
+        return future
 
-# log messages, with delays and console output
-def log_msg(_logger, msg):
+    def run(self, ctx, fn, args, kwargs):
+        with self.lock:
+            self.running += 1
+        token = otel_context.attach(ctx)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            otel_context.detach(token)
+            with self.lock:
+                self.running -= 1
+
+    def done(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    # tasks accepted but not started yet
+    def queue_depth(self):
+        with self.lock:
+            return self.pending - self.running
+
+    # (max_workers, busy, queued, rejected), read together
+    def occupancy(self):
+        with self.lock:
+            return self.max_workers, self.running, self.pending - self.running, self.rejected
+
+    # stop accepting work and wait for accepted tasks; cancel_pending drops tasks that have not started
+    def shutdown(self, wait=True, cancel_pending=False):
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+
+    def observe_queue_depth(self, options: CallbackOptions = CallbackOptions()):
+        yield Observation(self.queue_depth())
+
+    def observe_rejected(self, options: CallbackOptions = CallbackOptions()):
+        yield Observation(self.rejected)
+
+
+# process wide executor for background spans, drained when the server stops
+background = ContextExecutor()
+
+# process wide executor for SayHelloStream messages, shared by all streams (each one bounded by
+# HelloHandler.stream_window)
+stream_workers = ContextExecutor(max_workers=32, max_queue=10000, name="stream")
+
+
+# log messages, with delays and console output. msg may be a %-format string with args
+def log_msg(_logger, msg, *args):
     #time.sleep(.1)
-    print(f"{datetime.datetime.now()} {msg}")
-    _logger.error(msg)
-    _logger.debug(f"debug {msg}")
+    if log_policy.enabled(_logger, logging.ERROR):
+        diagnostics.print("%s %s", datetime.datetime.now(), msg % args if args else msg)
+        diagnostics.log(_logger, logging.ERROR, msg, *args, stacklevel=2)
+    if log_policy.enabled(_logger, logging.DEBUG):
+        diagnostics.log(_logger, logging.DEBUG, "debug " + msg, *args, stacklevel=2)
     time.sleep(.1)
 
 
+# records exceptions on spans without formatting a traceback every time. exceptions are fingerprinted by type and
+# the code location that raised them, and the formatted stack is cached per fingerprint. modes:
+#   "full"    every occurrence gets the (cached) stack
+#   "first_n" the first full_per_interval occurrences of a fingerprint per interval get the stack, the rest only
+#             type, message, count and exception.fingerprint, which refers back to an event that has the stack
+#   "summary" never attach the stack
+#   "off"     record nothing
+# mode, full_per_interval and interval can be changed at runtime with configure()
+class ExceptionRecorder:
+    MODES = ("full", "first_n", "summary", "off")
+
+    def __init__(self, mode="first_n", full_per_interval=5, interval=60, max_fingerprints=1000):
+        self.configure(mode, full_per_interval, interval)
+        self.max_fingerprints = max_fingerprints
+        # fingerprint -> [fingerprint id, formatted stack, count this interval, interval start, total count]
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def configure(self, mode=None, full_per_interval=None, interval=None):
+        if mode is not None:
+            if mode not in self.MODES:
+                raise ValueError(f"unknown exception recording mode {mode}, expected one of {self.MODES}")
+            self.mode = mode
+        if full_per_interval is not None:
+            self.full_per_interval = full_per_interval
+        if interval is not None:
+            self.interval = interval
+
+    @staticmethod
+    def fingerprint(exception):
+        tb = exception.__traceback__
+        if tb is None:
+            return type(exception).__qualname__, "", 0
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        return type(exception).__qualname__, tb.tb_frame.f_code.co_filename, tb.tb_lineno
+
+    def record(self, span, exception, attributes=None):
+        if self.mode == "off" or not span.is_recording():
+            return
+        key = self.fingerprint(exception)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                fingerprint_id = format(zlib.crc32(f"{key[0]}:{key[1]}:{key[2]}".encode()), "08x")
+                entry = [fingerprint_id, None, 0, now, 0]
+                if len(self.entries) < self.max_fingerprints:
+                    self.entries[key] = entry
+            if now - entry[3] >= self.interval:
+                entry[2] = 0
+                entry[3] = now
+            entry[2] += 1
+            entry[4] += 1
+            with_stack = self.mode == "full" or (self.mode == "first_n" and entry[2] <= self.full_per_interval)
+            if with_stack and entry[1] is None:
+                entry[1] = "".join(traceback.format_exception(type(exception), exception, exception.__traceback__))
+            fingerprint_id, stack, total = entry[0], entry[1], entry[4]
+        event_attributes = {
+            "exception.type": key[0],
+            "exception.message": str(exception),
+            "exception.fingerprint": fingerprint_id,
+            "exception.count": total,
+        }
+        if with_stack:
+            event_attributes["exception.stacktrace"] = stack
+        if attributes:
+            event_attributes.update(attributes)
+        span.add_event("exception", event_attributes)
+
+
+# process wide recorder, see record_exception
+exception_recorder = ExceptionRecorder()
+
+
+def record_exception(span, exception, attributes=None):
+    exception_recorder.record(span, exception, attributes)
+
+
+# wall clock sampling profiler attributing thread stacks to spans. a sampler thread wakes rate_hz times a second,
+# takes the stack of every thread that has a span open (sys._current_frames) and counts it, folded outermost
+# first as "file:function;...", against that thread's innermost open span. spans are tracked per thread from
+# on_start to end, which is right for the threaded server where a request stays on one thread; on grpc.aio all
+# requests share the loop thread and samples go to the span started last.
+# when a span ends its stacks become a "profile" child span over the same time (profile.stacks: the max_stacks
+# most sampled, one "stack count" per line; profile.samples), started on tracer_provider (the global one when
+# None), and are added to the aggregate per span name, which write_collapsed() saves as
+# "span_name;frame;...;frame count" lines (flamegraph.pl / speedscope input).
+# slow_ms profiles only slow spans: a span is not sampled before it has run that long and gets no profile span or
+# aggregate unless it took at least that long. overhead is bounded by rate_hz and max_depth, samples and
+# sample_seconds show what it cost. path, if set, is written on shutdown; {pid} in it is the process id
+class SpanProfiler(SpanProcessor):
+    def __init__(self, rate_hz=100, slow_ms=None, max_depth=64, max_stacks=20, events=True, path=None,
+                 tracer_provider=None):
+        self.interval = 1.0 / rate_hz
+        self.slow_ms = slow_ms
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.events = events
+        self.path = path
+        self.tracer_provider = tracer_provider
+        # thread id -> open spans started on it, innermost last
+        self.open_spans = {}
+        # span id -> thread id, for the spans in open_spans
+        self.owner = {}
+        # span id -> Counter of folded stacks
+        self.stacks = {}
+        # (span name, folded stack) -> samples, over all profiled spans that ended
+        self.aggregate = collections.Counter()
+        self.samples = 0
+        self.sample_seconds = 0.0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # SpanProfiler from $OTEL_TEST_PROFILE_HZ (unset: None, no profiling), $OTEL_TEST_PROFILE_SLOW_MS and
+    # $OTEL_TEST_PROFILE_PATH
+    @staticmethod
+    def from_env(env=os.environ):
+        rate_hz = env.get("OTEL_TEST_PROFILE_HZ")
+        if not rate_hz:
+            return None
+        slow_ms = env.get("OTEL_TEST_PROFILE_SLOW_MS")
+        return SpanProfiler(rate_hz=float(rate_hz), slow_ms=float(slow_ms) if slow_ms else None,
+                            path=env.get("OTEL_TEST_PROFILE_PATH"))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="span-profiler", daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        start = time.perf_counter()
+        now = time.time_ns()
+        with self.lock:
+            targets = {tid: spans[-1] for tid, spans in self.open_spans.items() if spans}
+        if self.slow_ms is not None:
+            targets = {tid: span for tid, span in targets.items() if now - span.start_time >= self.slow_ms * 1e6}
+        if targets:
+            frames = sys._current_frames()
+            folded = {tid: self.fold(frames[tid]) for tid in targets if tid in frames}
+            with self.lock:
+                for tid, stack in folded.items():
+                    span_id = targets[tid].get_span_context().span_id
+                    # the span may have ended since
+                    if span_id in self.owner:
+                        self.stacks.setdefault(span_id, collections.Counter())[stack] += 1
+        self.samples += 1
+        self.sample_seconds += time.perf_counter() - start
+
+    def fold(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def on_start(self, span, parent_context=None):
+        if span.instrumentation_scope is not None and span.instrumentation_scope.name == "span-profiler":
+            # our own profile spans, ended right away
+            return
+        tid = threading.get_ident()
+        with self.lock:
+            self.open_spans.setdefault(tid, []).append(span)
+            self.owner[span.get_span_context().span_id] = tid
+
+    # called by the SDK as the span ends, before any processor's on_end, so the profile span is exported before
+    # the span itself
+    def _on_ending(self, span):
+        span_id = span.get_span_context().span_id
+        with self.lock:
+            tid = self.owner.pop(span_id, None)
+            if tid is not None:
+                spans = self.open_spans[tid]
+                spans.remove(span)
+                if not spans:
+                    del self.open_spans[tid]
+            stacks = self.stacks.pop(span_id, None)
+            if not stacks:
+                return
+            if self.slow_ms is not None and span.end_time - span.start_time < self.slow_ms * 1e6:
+                return
+            for stack, count in stacks.items():
+                self.aggregate[(span.name, stack)] += count
+        if self.events:
+            top = stacks.most_common(self.max_stacks)
+            attributes = {"profile.samples": sum(stacks.values()),
+                          "profile.stacks": "\n".join(f"{stack} {count}" for stack, count in top)}
+            # the span has ended by now and takes no more events, the profile goes on a child span instead
+            tracer = trace.get_tracer("span-profiler", tracer_provider=self.tracer_provider)
+            profile = tracer.start_span("profile", context=trace.set_span_in_context(span), attributes=attributes,
+                                        start_time=span.start_time)
+            profile.end(end_time=span.end_time)
+
+    def on_end(self, span):
+        pass
+
+    # "span_name;frame;...;frame count" lines, most sampled first
+    def collapsed(self):
+        with self.lock:
+            items = self.aggregate.most_common()
+        return [f"{name};{stack} {count}" for (name, stack), count in items]
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
+
+    def shutdown(self):
+        self.stopped.set()
+        if self.path:
+            self.write_collapsed(self.path.format(pid=os.getpid()))
+
+    def force_flush(self, timeout_millis=30000):
+        return True
+
+
 def gen_test_data(_tracer, _logger):
     trace_id = int("0x7648f5b2583007f9d007739dde452a41", 0)
     span_id = int("0xd3b6efb24e645484", 0)
@@ -119,7 +1464,7 @@ def gen_test_data(_tracer, _logger):
         try:
             raise ValueError('Invalid input')
         except ValueError as e:
-            span.record_exception(e)
+            record_exception(span, e)
         # Get trace context
         span_context = span.get_span_context()
         is_sampled = span_context.trace_flags > 0
@@ -149,101 +1494,1646 @@ def gen_test_data(_tracer, _logger):
         log_msg(_logger, "Ending span service1")
 
 
+# default latency bucket upper bounds (ms) for histogram mode
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 75, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 30000)
+
+# tenant label used once max_tenants distinct tenants have been seen, keeps series count bounded
+OTHER_TENANT = "_other"
+
+
+# fixed-bucket latency histogram. with exemplars_per_bucket, each bucket also keeps the last that many exemplars
+# recorded into it (RequestExemplar), so memory stays constant
+class LatencyHistogram:
+    def __init__(self, bounds=LATENCY_BUCKETS_MS, exemplars_per_bucket=0):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.exemplars_per_bucket = exemplars_per_bucket
+        self.exemplars = self.new_exemplars()
+        self.lock = threading.Lock()
+
+    def new_exemplars(self):
+        if not self.exemplars_per_bucket:
+            return None
+        return [collections.deque(maxlen=self.exemplars_per_bucket) for _ in range(len(self.bounds) + 1)]
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0
+            self.exemplars = self.new_exemplars()
+
+    # count > 1 records the same value that many times
+    def record(self, value, count=1, exemplar=None):
+        idx = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[idx] += count
+            self.count += count
+            self.total += value * count
+            if exemplar is not None and self.exemplars is not None:
+                self.exemplars[idx].append(exemplar)
+
+    # exemplars of the bucket holding the q-th quantile, newest last
+    def quantile_exemplars(self, q):
+        bound = self.percentile(q)
+        if bound is None or self.exemplars is None:
+            return []
+        idx = self.bounds.index(bound) if bound in self.bounds else len(self.bounds)
+        with self.lock:
+            return list(self.exemplars[idx])
+
+    # upper bound of the bucket holding the q-th quantile (0 < q <= 1), None if empty
+    def percentile(self, q):
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for idx, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.bounds[idx] if idx < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+# request that a latency was recorded for: the span it ran in, and its msg_id, which is not a metric attribute
+class RequestExemplar:
+    def __init__(self, value, span_context, msg_id):
+        self.value = value
+        self.span_context = span_context
+        self.msg_id = msg_id
+
+    @property
+    def trace_id(self):
+        return trace.format_trace_id(self.span_context.trace_id)
+
+    @property
+    def span_id(self):
+        return trace.format_span_id(self.span_context.span_id)
+
+
 class RequestStats:
-    def __init__(self, metrics=None, meter_name="hb_test"):
-        self.stat_items = []
+    # mode="gauge" exports, per tenant, the slowest request since the last export as a gauge observation (the SDK
+    # keeps one observation per attribute set and collection, so add() aggregates). at most max_tenants tenants
+    # per export, the rest under OTHER_TENANT
+    # mode="histogram" aggregates into fixed-bucket per tenant histograms exported via an OTel Histogram
+    # metric attributes are only the tenant, so series stay few. a request links to its trace through exemplars
+    # instead: add() records with the request's span in the context, and the SDK attaches the trace_id/span_id of
+    # sampled spans to the exported points (one per tenant and bucket per export for histograms). the local per
+    # tenant histograms keep the last exemplars_per_bucket sampled requests per bucket, see exemplars()
+    def __init__(self, metrics=None, meter_name="hb_test", mode="gauge", buckets=LATENCY_BUCKETS_MS, max_tenants=100,
+                 exemplars_per_bucket=2):
+        # gauge mode: tenant -> RequestStatItem of its slowest request since the last export
+        self.slowest = {}
         self.request_count = 0
+        self.mode = mode
+        self.buckets = tuple(buckets)
+        self.max_tenants = max_tenants
+        self.exemplars_per_bucket = exemplars_per_bucket
+        self.histograms = {}
+        self.tenant_attributes = {}
+        self.other_attributes = {"tenant": OTHER_TENANT}
+        self.lock = threading.Lock()
 
         meter = metrics.get_meter(meter_name)
-        meter.create_observable_gauge(
-            f"{meter_name}_process_time",
-            callbacks=[self.request_time_taken_observations],
-        )
+        if mode == "histogram":
+            self.histogram = meter.create_histogram(
+                f"{meter_name}_process_time",
+                unit="ms",
+                explicit_bucket_boundaries_advisory=self.buckets,
+            )
+        else:
+            meter.create_observable_gauge(
+                f"{meter_name}_process_time",
+                callbacks=[self.request_time_taken_observations],
+            )
         meter.create_observable_counter(
             f"{meter_name}_requests",
             callbacks=[self.request_count_observation],
         )
 
-    def add(self, process_time, tenant="test_tenant", msg_id="msg_id_0001"):
-        self.request_count = self.request_count + 1
-        self.stat_items.append(RequestStatItem(process_time, tenant, msg_id))
+    # span is the request's span, the current span when None
+    def add(self, process_time, tenant="test_tenant", msg_id="msg_id_0001", span=None):
+        context = trace.set_span_in_context(span) if span is not None else None
+        if self.mode == "histogram":
+            self.add_to_histogram(process_time, tenant, msg_id, span, context)
+            return
+        with self.lock:
+            self.request_count += 1
+            if tenant not in self.slowest and len(self.slowest) >= self.max_tenants:
+                tenant = OTHER_TENANT
+            slowest = self.slowest.get(tenant)
+            if slowest is None or process_time > slowest.process_time:
+                # observed later, on the collection thread. only the slowest request's context is kept
+                self.slowest[tenant] = RequestStatItem(process_time, tenant, context or otel_context.get_current())
+
+    def add_to_histogram(self, process_time, tenant, msg_id, span, context):
+        attributes = self.tenant_attributes.get(tenant)
+        if attributes is None:
+            attributes = self.register_tenant(tenant)
+        with self.lock:
+            self.request_count += 1
+        exemplar = None
+        span_context = (span or trace.get_current_span()).get_span_context()
+        if span_context.trace_flags.sampled:
+            exemplar = RequestExemplar(process_time, span_context, msg_id)
+        self.histograms[attributes["tenant"]].record(process_time, exemplar=exemplar)
+        self.histogram.record(process_time, attributes, context=context)
+
+    # first request of a tenant allocates its histogram and attributes, later requests reuse them
+    def register_tenant(self, tenant):
+        with self.lock:
+            attributes = self.tenant_attributes.get(tenant)
+            if attributes is not None:
+                return attributes
+            if len(self.tenant_attributes) >= self.max_tenants:
+                if OTHER_TENANT not in self.histograms:
+                    self.histograms[OTHER_TENANT] = LatencyHistogram(self.buckets, self.exemplars_per_bucket)
+                return self.other_attributes
+            self.histograms[tenant] = LatencyHistogram(self.buckets, self.exemplars_per_bucket)
+            attributes = {"tenant": tenant}
+            self.tenant_attributes[tenant] = attributes
+            return attributes
+
+    # latency upper bound (ms) of the q-th quantile for a tenant, None if no requests seen
+    def percentile(self, q, tenant):
+        histogram = self.histograms.get(tenant)
+        return histogram.percentile(q) if histogram is not None else None
+
+    # recent sampled requests (RequestExemplar) of a tenant in the bucket of the q-th quantile, e.g. a trace of a
+    # p99 request
+    def exemplars(self, q, tenant):
+        histogram = self.histograms.get(tenant)
+        return histogram.quantile_exemplars(q) if histogram is not None else []
+
+    # start the per tenant histograms behind percentile() over, e.g. to see the effect of a change. what is
+    # exported is not affected
+    def reset_latency(self):
+        with self.lock:
+            histograms = list(self.histograms.values())
+        for histogram in histograms:
+            histogram.reset()
 
     def request_count_observation(self, options: CallbackOptions = CallbackOptions()):
-        print(f"request_count_observation = {self.request_count}")
-        yield Observation(self.request_count)
-        self.request_count = 0
+        # read and reset together, under the lock add() counts with
+        with self.lock:
+            count, self.request_count = self.request_count, 0
+        diagnostics.print("request_count_observation = %s", count)
+        yield Observation(count)
 
     def request_time_taken_observations(self, options: CallbackOptions = CallbackOptions()):
-        idx = 0
-        while True:
-            if len(self.stat_items) == 0:
-                break
-            item = self.stat_items.pop()
-            idx = idx + 1
-            print(f"time_taken_observations = {idx} {item.process_time} {item.attributes}")
-            yield Observation(item.process_time, item.attributes)
+        with self.lock:
+            items, self.slowest = self.slowest, {}
+        for idx, item in enumerate(items.values(), 1):
+            diagnostics.print("time_taken_observations = %s %s %s", idx, item.process_time, item.attributes)
+            yield Observation(item.process_time, item.attributes, item.context)
 
 
 class RequestStatItem:
-    def __init__(self, process_time, tenant, msg_id):
+    def __init__(self, process_time, tenant, context):
         self.process_time = process_time
-        self.attributes = {"tenant": tenant, "msg_id": msg_id}
+        self.attributes = {"tenant": tenant}
+        # with the request's span, for the exemplar
+        self.context = context
+
+
+# matches one 'key': 'value' or 'key': value (an unquoted scalar such as 5 or None) pair of the legacy str(dict)
+# payload. _LEGACY_DICT matches a whole payload made of only such pairs, nothing in it goes unparsed
+_LEGACY_PAIR_PATTERN = r"'(\w+)':\s*(?:'([^']*)'|([^,'{}\s][^,}]*?))\s*"
+_LEGACY_PAIR = re.compile(_LEGACY_PAIR_PATTERN + r"(?=[,}])")
+_LEGACY_DICT = re.compile(r"\s*\{\s*(?:%s(?:,\s*%s)*)?\}\s*" % (_LEGACY_PAIR_PATTERN, _LEGACY_PAIR_PATTERN))
+
+
+# a HelloRequest whose legacy payload is not a dict. a ValueError, the server answers it with INVALID_ARGUMENT
+class InvalidRequest(ValueError):
+    pass
+
+
+# parse legacy HelloRequest.name payload, e.g. "{'src': 'client', 'tenant': 't1', 'msg_id': '1'}", without eval.
+# values come back as str, e.g. {'msg_id': 5} as {"msg_id": "5"}. raises InvalidRequest for anything but a dict
+def parse_legacy_name(name):
+    if not name.strip().startswith("{"):
+        raise InvalidRequest(f"legacy payload is not a dict: {name[:100]!r}")
+    if '"' in name or "\\" in name or not _LEGACY_DICT.fullmatch(name):
+        # not the plain single quoted form str() produces for simple values, use the safe literal parser
+        try:
+            data = ast.literal_eval(name)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError) as e:
+            raise InvalidRequest(f"legacy payload does not parse: {e}") from None
+        if not isinstance(data, dict):
+            raise InvalidRequest(f"legacy payload is not a dict: {name[:100]!r}")
+        return {str(key): value if isinstance(value, str) else str(value) for key, value in data.items()}
+    return {key: quoted or unquoted for key, quoted, unquoted in _LEGACY_PAIR.findall(name)}
+
+
+# build a request with typed fields. legacy=True also fills `name` for receivers not yet on the typed fields
+def make_request(src, tenant, msg_id, legacy=False):
+    import helloworld_pb2
+    request = helloworld_pb2.HelloRequest(src=src, tenant=tenant, msg_id=msg_id)
+    if legacy:
+        request.name = str({"src": src, "tenant": tenant, "msg_id": msg_id})
+    return request
+
+
+# returns (src, tenant, msg_id) from typed fields, or from the legacy `name` payload when compat is enabled and
+# only `name` is set (typed fields win when a sender fills both). raises InvalidRequest for a bad legacy payload
+def decode_request(request, compat=True):
+    if not compat or not request.name or request.tenant or request.msg_id:
+        return request.src, request.tenant, request.msg_id
+    data = parse_legacy_name(request.name)
+    return data.get("src", ""), data.get("tenant", ""), data.get("msg_id", "")
+
+
+def helloworld_reply(**fields):
+    import helloworld_pb2
+    return helloworld_pb2.HelloReply(**fields)
+
+
+# link to the sender's span for a message carrying W3C trace context (HelloRequest.trace_context)
+def message_links(request):
+    if not request.trace_context:
+        return None
+    from opentelemetry import propagate
+    span_context = trace.get_current_span(propagate.extract(request.trace_context)).get_span_context()
+    return [trace.Link(span_context)] if span_context.is_valid else None
 
 
-class HelloHandler(helloworld_pb2_grpc.GreeterServicer):
-    def __init__(self, service_name, tracer=None, logger=None, stats=None):
+# Greeter servicer. it does not subclass helloworld_pb2_grpc.GreeterServicer, so the generated protos are only
+# imported once a server is started or a request is built
+class HelloHandler:
+    log_level = logging.ERROR
+    # SayHelloStream messages of one stream handled at once. the stream is not read further while the window is
+    # full, which holds the sender back through HTTP/2 flow control
+    stream_window = 32
+
+    def __init__(self, service_name, tracer=None, logger=None, stats=None, compat=True):
         self.service_name = service_name;
+        self.log_prefix = f"{service_name} - "
         self.tracer = tracer
         self.logger = logger
         self.stats = stats
+        # accept legacy str(dict) payload in HelloRequest.name from senders not yet on typed fields
+        self.compat = compat
+        self.sampler = active_sampler()
         print(f"{service_name} started")
 
+    # spans/s currently allowed for a tenant by a TenantRateLimitedSampler, None for other samplers
+    def sampling_rate(self, tenant):
+        limiter = tenant_rate_limiter(self.sampler)
+        if limiter is not None:
+            return limiter.current_rate(tenant)
+        return None
+
     def SayHello(self, request, context):
         span = trace.get_current_span()
         #self.log_msg(span, "got request")
-        print(f"span > {span_info(span.get_span_context())}")
+        diagnostics.print_span("span > ", span)
         # gen_linked_span_context(_tracer, _logger)
-        data = eval(getattr(request, "name"))
-        request_from = f"{data['src']} -> {self.service_name}"
-        tenant = data['tenant']
-        msg_id = data['msg_id']
-        span.set_attribute("tenant_id", tenant)
-        span.set_attribute("msg_id", msg_id)
-        self.log_msg(span, f"request from : {request_from}, {tenant}, {msg_id}")
+        try:
+            return self.process(request, context, span)
+        except InvalidRequest as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    # handling shared by SayHello and the messages of SayHelloStream, span is the span of the request/message
+    def process(self, request, context, span):
+        src, tenant, msg_id = decode_request(request, self.compat)
+        request_from = f"{src} -> {self.service_name}"
+        if span.is_recording():
+            span.set_attribute("tenant_id", tenant)
+            span.set_attribute("msg_id", msg_id)
+        self.log_msg(span, "request from : %s, %s, %s", request_from, tenant, msg_id)
         start = time.time()
-        time.sleep(.1*random.randrange(5, 15))
-        response = self.handle_message(request_from, tenant, msg_id)
-        self.stats.add(int(round(time.time() - start, 3) * 1000), tenant=tenant, msg_id=msg_id)
-        self.log_msg(span, f"got response {request_from}, {tenant}, {msg_id}")
+        self.work()
+        with request_deadline(context):
+            response = self.handle_message(request_from, tenant, msg_id)
+        self.stats.add(int(round(time.time() - start, 3) * 1000), tenant=tenant, msg_id=msg_id, span=span)
+        self.log_msg(span, "got response %s, %s, %s", request_from, tenant, msg_id)
         return response
 
+    # the request's own processing time, simulated
+    def work(self):
+        time.sleep(.1*random.randrange(5, 15))
+
+    # bidirectional stream, each message is handled like a SayHello call on stream_workers and replied to as
+    # soon as it is done, so replies can be out of order (HelloReply.seq matches them up). at most stream_window
+    # messages per stream are in flight. a failed message gets a reply with error set, the stream carries on
+    def SayHelloStream(self, request_iterator, context):
+        diagnostics.print_span("stream > ", trace.get_current_span())
+        replies = queue.Queue()
+        window = threading.BoundedSemaphore(self.stream_window)
+        # the reader runs in the stream's context, so per-message spans are children of the stream span
+        threading.Thread(target=self.read_stream, args=(otel_context.get_current(), request_iterator, context, window, replies),
+                         name="stream-reader", daemon=True).start()
+        handled, received = 0, None
+        while received is None or handled < received:
+            reply = replies.get()
+            if isinstance(reply, int):
+                received = reply
+                continue
+            handled += 1
+            window.release()
+            yield reply
+
+    def read_stream(self, ctx, request_iterator, context, window, replies):
+        token = otel_context.attach(ctx)
+        received = 0
+        try:
+            for request in request_iterator:
+                while not window.acquire(timeout=1):
+                    if not context.is_active():
+                        return
+                received += 1
+                if stream_workers.submit(self.process_message, request, context, replies) is None:
+                    replies.put(helloworld_reply(seq=request.seq, error="overloaded"))
+        except grpc.RpcError:
+            # stream cancelled by the client, what was received is still answered
+            pass
+        finally:
+            otel_context.detach(token)
+            replies.put(received)
+
+    # one SayHelloStream message, in its own span, linked to the sender's span when the message carries its
+    # trace context
+    def process_message(self, request, context, replies):
+        tracer = self.tracer or trace.get_tracer("harmeet-trace-test")
+        try:
+            with tracer.start_as_current_span("SayHelloStream.message", links=message_links(request)) as span:
+                reply = self.process(request, context, span)
+            reply.seq = request.seq
+        except Exception as e:
+            reply = helloworld_reply(seq=request.seq, error=f"{type(e).__name__}: {e}")
+        replies.put(reply)
+
     def handle_message(self, request_from, tenant, msg_id):
-        response = helloworld_pb2.HelloReply(message=f"Hello [{request_from}] tenant={tenant}, msg_id={msg_id}")
+        response = helloworld_reply(message=f"Hello [{request_from}] tenant={tenant}, msg_id={msg_id}")
         return response
 
-    def log_msg(self, span, msg):
-        msg = f"{self.service_name} - {msg}"
-        print(msg)
-        self.logger.error(msg)
-        span.add_event(msg)
+    # msg may be a %-format string with args, emitted at log_level to the sinks emit_policy picks (see emit)
+    def log_msg(self, span, msg, *args):
+        emit(self.logger, self.log_level, msg, *args, span=span, prefix=self.log_prefix)
+
+# keepalive pings keep idle pooled connections open through NATs/proxies and detect dead peers
+DEFAULT_CHANNEL_OPTIONS = (
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+)
+
+
+# OTel context key for the absolute deadline (time.monotonic()) of the request being handled
+DEADLINE_KEY = otel_context.create_key("request_deadline")
+
+
+# makes the deadline of the incoming call (its grpc servicer context) current, so downstream calls made while
+# handling it, also from the background and diagnostics threads, can tell how much time is left
+@contextlib.contextmanager
+def request_deadline(context):
+    remaining = context.time_remaining() if context is not None else None
+    # grpc reports a huge time_remaining when the caller set no deadline
+    if remaining is None or remaining > 1e9:
+        yield None
+        return
+    deadline = time.monotonic() + remaining
+    token = otel_context.attach(otel_context.set_value(DEADLINE_KEY, deadline))
+    try:
+        yield deadline
+    finally:
+        otel_context.detach(token)
+
+
+# raised by downstream_timeout instead of sending a call nobody will wait for. it is a grpc.RpcError with code
+# DEADLINE_EXCEEDED, so callers handle it like the downstream call timing out
+class DeadlineExceeded(grpc.RpcError):
+    def __init__(self, details="deadline of the incoming request expired before the downstream call"):
+        super().__init__(details)
+        self._details = details
+
+    def code(self):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+
+    def details(self):
+        return self._details
+
+
+# the GreeterStream a message was sent on ended before its reply, without an error of its own from grpc
+class StreamClosed(grpc.RpcError):
+    def __init__(self, details="stream closed"):
+        super().__init__(details)
+        self._details = details
+
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+    def details(self):
+        return self._details
+
+
+# a GreeterStream message the server answered with HelloReply.error, the stream itself is fine
+class StreamMessageFailed(grpc.RpcError):
+    def __init__(self, details):
+        super().__init__(details)
+        self._details = details
+
+    def code(self):
+        return grpc.StatusCode.UNKNOWN
+
+    def details(self):
+        return self._details
+
+
+# timeout for a downstream call: what is left of the current request's deadline minus margin seconds, kept for
+# the work after the call returns, or default when there is no deadline. raises DeadlineExceeded when nothing
+# is left
+def downstream_timeout(default=30, margin=0.05):
+    deadline = otel_context.get_value(DEADLINE_KEY)
+    if deadline is None:
+        return default
+    remaining = deadline - time.monotonic() - margin
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return remaining
+
+
+# hedged requests: when a call has not returned after delay() (the quantile of recent attempt latencies, no
+# hedging until min_samples are seen) a second attempt is sent, the first to succeed wins and the other is
+# cancelled. a retry budget bounds the extra load: every call adds budget_ratio tokens (at most max_tokens) and
+# a hedge spends one, so hedges stay under ~budget_ratio of calls even when the downstream is slow for everyone
+class HedgePolicy:
+    def __init__(self, quantile=0.95, min_delay=0.005, min_samples=20, window=1000, budget_ratio=0.1, max_tokens=10):
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = collections.deque(maxlen=window)
+        self.cached_delay = None
+        self.since_update = 0
+        self.budget_ratio = budget_ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+        self.lock = threading.Lock()
+
+    # seconds to wait before hedging, None while there are too few samples. recomputed every 50 samples
+    def delay(self):
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            if self.cached_delay is None or self.since_update >= 50:
+                latencies = sorted(self.latencies)
+                self.cached_delay = max(self.min_delay, latencies[int(self.quantile * (len(latencies) - 1))])
+                self.since_update = 0
+            return self.cached_delay
+
+    # latency of an attempt. cancelled attempts record the time until cancellation, a lower bound that keeps
+    # the slow tail in the sample
+    def record(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            self.since_update += 1
+
+    def deposit(self):
+        with self.lock:
+            self.calls += 1
+            self.tokens = min(self.max_tokens, self.tokens + self.budget_ratio)
+
+    def try_hedge(self):
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.hedges += 1
+                return True
+            self.budget_exhausted += 1
+            return False
+
+    def won(self, attempt):
+        if attempt > 0:
+            with self.lock:
+                self.hedge_wins += 1
+
+    # hedge.* attributes on the span of the call
+    def annotate(self, attempts, winner):
+        span = trace.get_current_span()
+        if span.is_recording():
+            span.set_attribute("hedge.attempts", attempts)
+            if winner is not None:
+                span.set_attribute("hedge.winner", winner)
+
+
+# GreeterStub, imported on first use
+def greeter_stub(channel):
+    import helloworld_pb2_grpc
+    return helloworld_pb2_grpc.GreeterStub(channel)
+
+
+# shared pool of long lived channels and stubs, keyed by (target, options).
+# size > 1 opens that many channels per key, each with its own subchannel (connection), used round-robin.
+class ChannelPool:
+    def __init__(self, size=1, options=DEFAULT_CHANNEL_OPTIONS, stub_class=greeter_stub):
+        self.size = size
+        self.options = tuple(options)
+        self.stub_class = stub_class
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get_stub(self, target, options=None):
+        key = (target, self.options if options is None else tuple(options))
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.open(key)
+        with self.lock:
+            idx = entry["next"]
+            entry["next"] = (idx + 1) % self.size
+        return entry["stubs"][idx]
+
+    # call stub.<method>(request, **kwargs) on the next pooled channel. on UNAVAILABLE the channel is
+    # replaced so the next call reconnects instead of waiting out a channel stuck in backoff (see reconnect)
+    def invoke(self, target, method, request, options=None, **kwargs):
+        stub = self.get_stub(target, options)
+        try:
+            return getattr(stub, method)(request, **kwargs)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                self.reconnect(target, stub, options)
+            raise
+
+    # invoke() with hedging (see HedgePolicy): a second attempt, on the next pooled channel, when the first has
+    # not returned after hedge.delay(). returns the first successful response, raises if every attempt failed.
+    # as in invoke(), an attempt failing with UNAVAILABLE replaces its channel
+    def hedged_invoke(self, target, method, request, hedge, options=None, timeout=None, **kwargs):
+        hedge.deposit()
+        delay = hedge.delay()
+        done = threading.Event()
+        start = time.monotonic()
+        attempts = []
+
+        def send(remaining):
+            sent = time.monotonic()
+            stub = self.get_stub(target, options)
+
+            def finished(future):
+                hedge.record(time.monotonic() - sent)
+                error = None if future.cancelled() else future.exception()
+                if isinstance(error, grpc.RpcError) and error.code() == grpc.StatusCode.UNAVAILABLE:
+                    self.reconnect(target, stub, options)
+                done.set()
+
+            future = getattr(stub, method).future(request, timeout=remaining, **kwargs)
+            future.add_done_callback(finished)
+            attempts.append(future)
+
+        send(timeout)
+        if delay is not None and (timeout is None or delay < timeout) and not done.wait(delay) and hedge.try_hedge():
+            send(None if timeout is None else timeout - (time.monotonic() - start))
+        winner = None
+        while winner is None:
+            done.wait()
+            done.clear()
+            finished = [idx for idx, future in enumerate(attempts) if future.done()]
+            winner = next((idx for idx in finished if attempts[idx].exception() is None), None)
+            if len(finished) == len(attempts):
+                break
+        for future in attempts:
+            future.cancel()
+        hedge.annotate(len(attempts), winner)
+        if winner is None:
+            return attempts[0].result()
+        hedge.won(winner)
+        return attempts[winner].result()
+
+    # swaps the channel behind stub for a new one. the old channel is not closed, that would cancel the other
+    # calls still running on it: the pool drops it and grpc releases it once those calls are done
+    def reconnect(self, target, stub, options=None):
+        key = (target, self.options if options is None else tuple(options))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or stub not in entry["stubs"]:
+                return
+            idx = entry["stubs"].index(stub)
+            entry["channels"][idx] = self.new_channel(key)
+            entry["stubs"][idx] = self.stub_class(entry["channels"][idx])
+        diagnostics.print("channel_pool - reconnecting %s [%s]", target, idx)
+
+    def open(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                channels = [self.new_channel(key) for _ in range(self.size)]
+                entry = {"channels": channels, "stubs": [self.stub_class(c) for c in channels], "next": 0}
+                self.entries[key] = entry
+            return entry
+
+    def new_channel(self, key):
+        target, options = key
+        if self.size > 1:
+            # without a local subchannel pool, channels with equal args share one connection
+            options = options + (("grpc.use_local_subchannel_pool", 1),)
+        return grpc.insecure_channel(target, options=options)
+
+    def close(self):
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries = {}
+        for entry in entries:
+            for channel in entry["channels"]:
+                channel.close()
+
+
+# process wide pool used by client and services for outbound Greeter calls
+channel_pool = ChannelPool()
+
+
+# grpc.aio counterpart of ChannelPool. channels belong to the event loop they are created on,
+# so use one pool per loop (the aio services run a single loop per process)
+class AioChannelPool:
+    close_grace = 30
+
+    def __init__(self, size=1, options=DEFAULT_CHANNEL_OPTIONS, stub_class=greeter_stub):
+        self.size = size
+        self.options = tuple(options)
+        self.stub_class = stub_class
+        self.entries = {}
+        # close() of channels replaced by reconnect, waiting for their calls
+        self.closing = set()
+
+    def get_stub(self, target, options=None):
+        key = (target, self.options if options is None else tuple(options))
+        entry = self.entries.get(key)
+        if entry is None:
+            channels = [self.new_channel(key) for _ in range(self.size)]
+            entry = {"channels": channels, "stubs": [self.stub_class(c) for c in channels], "next": 0}
+            self.entries[key] = entry
+        idx = entry["next"]
+        entry["next"] = (idx + 1) % self.size
+        return entry["stubs"][idx]
+
+    async def invoke(self, target, method, request, options=None, **kwargs):
+        stub = self.get_stub(target, options)
+        try:
+            return await getattr(stub, method)(request, **kwargs)
+        except grpc.aio.AioRpcError as e:
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                await self.reconnect(target, stub, options)
+            raise
+
+    async def hedged_invoke(self, target, method, request, hedge, options=None, timeout=None, **kwargs):
+        hedge.deposit()
+        delay = hedge.delay()
+        start = time.monotonic()
+
+        async def attempt(remaining):
+            sent = time.monotonic()
+            stub = self.get_stub(target, options)
+            try:
+                return await getattr(stub, method)(request, timeout=remaining, **kwargs)
+            except grpc.aio.AioRpcError as e:
+                if e.code() == grpc.StatusCode.UNAVAILABLE:
+                    await self.reconnect(target, stub, options)
+                raise
+            finally:
+                hedge.record(time.monotonic() - sent)
+
+        attempts = [asyncio.ensure_future(attempt(timeout))]
+        if delay is not None and (timeout is None or delay < timeout):
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done and hedge.try_hedge():
+                attempts.append(asyncio.ensure_future(attempt(None if timeout is None else timeout - (time.monotonic() - start))))
+        winner = None
+        pending = set(attempts)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((attempts.index(task) for task in done if task.exception() is None), None)
+        for task in attempts:
+            task.cancel()
+        hedge.annotate(len(attempts), winner)
+        if winner is None:
+            return attempts[0].result()
+        hedge.won(winner)
+        return attempts[winner].result()
+
+    async def reconnect(self, target, stub, options=None):
+        key = (target, self.options if options is None else tuple(options))
+        entry = self.entries.get(key)
+        if entry is None or stub not in entry["stubs"]:
+            return
+        idx = entry["stubs"].index(stub)
+        old_channel = entry["channels"][idx]
+        entry["channels"][idx] = self.new_channel(key)
+        entry["stubs"][idx] = self.stub_class(entry["channels"][idx])
+        diagnostics.print("aio_channel_pool - reconnecting %s [%s]", target, idx)
+        # closed in the background once the calls still running on it are done (at most close_grace seconds),
+        # closing it right away would cancel them
+        task = asyncio.ensure_future(old_channel.close(grace=self.close_grace))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    def new_channel(self, key):
+        target, options = key
+        if self.size > 1:
+            options = options + (("grpc.use_local_subchannel_pool", 1),)
+        return grpc.aio.insecure_channel(target, options=options)
+
+    async def close(self):
+        entries = list(self.entries.values())
+        self.entries = {}
+        for entry in entries:
+            for channel in entry["channels"]:
+                await channel.close()
+
+
+# pool used by the aio services for outbound Greeter calls
+aio_channel_pool = AioChannelPool()
+
+
+# client side of SayHelloStream: one long-lived stream to target that any number of threads send requests on.
+# call() blocks until the reply with the request's seq comes back; at most window requests are outstanding, more
+# wait in send(). every request carries the sender's trace context, the server links its message span to it.
+# the stream is opened on first use and again after it failed (its pending calls fail with its status)
+class GreeterStream:
+    def __init__(self, target, window=64, options=DEFAULT_CHANNEL_OPTIONS, stub_class=greeter_stub):
+        self.target = target
+        self.window = threading.BoundedSemaphore(window)
+        self.options = tuple(options)
+        self.stub_class = stub_class
+        self.channel = None
+        # request queue of the open stream, None when there is none
+        self.requests = None
+        # seq -> (future, request queue of the stream it was sent on)
+        self.pending = {}
+        self.seq = 0
+        self.lock = threading.Lock()
 
-def start_grpc_server(port, handler):
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    def open(self):
+        if self.channel is None:
+            self.channel = grpc.insecure_channel(self.target, options=self.options)
+        requests = self.requests = queue.Queue()
+
+        def request_iterator():
+            while True:
+                request = requests.get()
+                if request is None:
+                    return
+                yield request
+
+        # the stream outlives the request that opened it, its span must not be a child of that request
+        token = otel_context.attach(otel_context.Context())
+        try:
+            responses = self.stub_class(self.channel).SayHelloStream(request_iterator())
+        finally:
+            otel_context.detach(token)
+        threading.Thread(target=self.read, args=(responses, requests), name="greeter-stream", daemon=True).start()
+
+    def read(self, responses, requests):
+        error = StreamClosed(f"stream to {self.target} closed")
+        try:
+            for reply in responses:
+                with self.lock:
+                    future, _ = self.pending.pop(reply.seq, (None, None))
+                if future is None:
+                    # the call timed out already
+                    continue
+                self.window.release()
+                if reply.error:
+                    future.set_exception(StreamMessageFailed(reply.error))
+                else:
+                    future.set_result(reply)
+        except grpc.RpcError as e:
+            error = e
+        with self.lock:
+            requests.put(None)
+            if self.requests is requests:
+                self.requests = None
+            failed = [seq for seq, (_, sent_on) in self.pending.items() if sent_on is requests]
+            failed = [self.pending.pop(seq)[0] for seq in failed]
+        for future in failed:
+            self.window.release()
+            future.set_exception(error)
+
+    # queue request on the stream, returns a future of the reply. waits at most timeout seconds for room in the
+    # window, raises DeadlineExceeded after that
+    def send(self, request, timeout=None):
+        from opentelemetry import propagate
+        if not self.window.acquire(timeout=timeout):
+            raise DeadlineExceeded(f"stream window to {self.target} still full after {timeout:.3f}s")
+        future = futures.Future()
+        future.set_running_or_notify_cancel()
+        with self.lock:
+            if self.requests is None:
+                self.open()
+            self.seq += 1
+            request.seq = self.seq
+            propagate.inject(request.trace_context)
+            self.pending[request.seq] = (future, self.requests)
+            self.requests.put(request)
+        return future
+
+    def call(self, request, timeout=None):
+        start = time.monotonic()
+        future = self.send(request, timeout=timeout)
+        try:
+            return future.result(timeout=None if timeout is None else max(0.0, timeout - (time.monotonic() - start)))
+        except futures.TimeoutError:
+            with self.lock:
+                timed_out = self.pending.pop(request.seq, None) is not None
+            if timed_out:
+                self.window.release()
+                raise DeadlineExceeded(f"no reply on the stream to {self.target} within {timeout:.3f}s")
+            # the reply raced the timeout
+            return future.result()
+
+    # end the stream, calls still pending fail once the server has closed it
+    def close(self):
+        with self.lock:
+            if self.requests is not None:
+                self.requests.put(None)
+            self.requests = None
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+
+# downstream responses by key (Service1 uses (tenant, msg_id)), kept for ttl seconds, least recently used evicted
+# beyond max_entries. singleflight: while a key's call is in flight identical requests wait for it instead of
+# sending their own. errors are not cached, the callers waiting on a failed call get its exception.
+# every lookup is a hit, a miss (this caller makes the call) or coalesced (waited for another caller's call),
+# counted in {meter}_cache (result attribute) and set as the cache.result span attribute; coalesced waits are
+# also recorded in {meter}_cache_wait and cache.wait_ms
+class ResponseCache:
+    def __init__(self, max_entries=1000, ttl=30.0, metrics=None, meter_name="hb_test"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, response), least recently used first
+        self.entries = collections.OrderedDict()
+        # key -> future of the call in flight (concurrent.futures for call(), asyncio for async_call())
+        self.in_flight = {}
+        self.counts = {"hit": 0, "miss": 0, "coalesced": 0}
+        self.lock = threading.Lock()
+        self.lookups = None
+        self.wait = None
+        if metrics is not None:
+            meter = metrics.get_meter(meter_name)
+            self.lookups = meter.create_counter(f"{meter_name}_cache")
+            self.wait = meter.create_histogram(f"{meter_name}_cache_wait", unit="ms")
+            meter.create_observable_gauge(f"{meter_name}_cache_entries", callbacks=[self.observe_entries])
+
+    # returns (result, value): the response on a hit, else the future to wait on or, for a miss, to complete.
+    # caller holds the lock
+    def lookup(self, key, new_future):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                return "hit", entry[1]
+            del self.entries[key]
+        future = self.in_flight.get(key)
+        if future is not None:
+            return "coalesced", future
+        future = self.in_flight[key] = new_future()
+        return "miss", future
+
+    def store(self, key, response):
+        with self.lock:
+            del self.in_flight[key]
+            if response is not None:
+                self.entries[key] = (time.monotonic() + self.ttl, response)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+    def record(self, result, wait_ms=None):
+        with self.lock:
+            self.counts[result] += 1
+        span = trace.get_current_span()
+        if span.is_recording():
+            span.set_attribute("cache.result", result)
+            if wait_ms is not None:
+                span.set_attribute("cache.wait_ms", wait_ms)
+        if self.lookups is not None:
+            self.lookups.add(1, {"result": result})
+        if self.wait is not None and wait_ms is not None:
+            self.wait.record(wait_ms)
+
+    # response for key, from the cache, from the call in flight, or from fn(). timeout bounds the wait on
+    # another caller's call (DeadlineExceeded when it runs out), fn applies its own
+    def call(self, key, fn, timeout=None):
+        with self.lock:
+            result, value = self.lookup(key, futures.Future)
+        if result == "hit":
+            self.record(result)
+            return value
+        if result == "coalesced":
+            start = time.monotonic()
+            try:
+                return value.result(timeout=timeout)
+            except futures.TimeoutError:
+                raise DeadlineExceeded(f"call in flight for {key} did not finish within {timeout:.3f}s")
+            finally:
+                self.record(result, (time.monotonic() - start) * 1000)
+        self.record(result)
+        try:
+            response = fn()
+        except BaseException as e:
+            self.store(key, None)
+            value.set_exception(e)
+            raise
+        self.store(key, response)
+        value.set_result(response)
+        return response
+
+    # call() for grpc.aio, fn is a coroutine function
+    async def async_call(self, key, fn, timeout=None):
+        with self.lock:
+            result, value = self.lookup(key, asyncio.get_running_loop().create_future)
+        if result == "hit":
+            self.record(result)
+            return value
+        if result == "coalesced":
+            start = time.monotonic()
+            try:
+                # shield, so a waiter timing out does not cancel the call for everyone else
+                return await asyncio.wait_for(asyncio.shield(value), timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"call in flight for {key} did not finish within {timeout:.3f}s")
+            finally:
+                self.record(result, (time.monotonic() - start) * 1000)
+        self.record(result)
+        try:
+            response = await fn()
+        except BaseException as e:
+            self.store(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                value.cancel()
+            else:
+                value.set_exception(e)
+                # retrieved, so asyncio does not warn about it when nobody was waiting
+                value.exception()
+            raise
+        self.store(key, response)
+        value.set_result(response)
+        return response
+
+    def observe_entries(self, options: CallbackOptions = CallbackOptions()):
+        yield Observation(len(self.entries))
+
+
+# asyncio variant of HelloHandler for grpc.aio servers. waits are awaited instead of blocking a worker thread,
+# so in-flight requests are not capped by a thread pool. the OTel context lives in contextvars, which asyncio
+# carries across awaits and into tasks, so trace.get_current_span() stays correct.
+class AsyncHelloHandler(HelloHandler):
+    async def SayHello(self, request, context):
+        span = trace.get_current_span()
+        diagnostics.print_span("span > ", span)
+        try:
+            return await self.process(request, context, span)
+        except InvalidRequest as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    async def process(self, request, context, span):
+        src, tenant, msg_id = decode_request(request, self.compat)
+        request_from = f"{src} -> {self.service_name}"
+        if span.is_recording():
+            span.set_attribute("tenant_id", tenant)
+            span.set_attribute("msg_id", msg_id)
+        self.log_msg(span, "request from : %s, %s, %s", request_from, tenant, msg_id)
+        start = time.time()
+        await self.work()
+        with request_deadline(context):
+            response = await self.handle_message(request_from, tenant, msg_id)
+        self.stats.add(int(round(time.time() - start, 3) * 1000), tenant=tenant, msg_id=msg_id, span=span)
+        self.log_msg(span, "got response %s, %s, %s", request_from, tenant, msg_id)
+        return response
+
+    async def work(self):
+        await asyncio.sleep(.1*random.randrange(5, 15))
+
+    async def handle_message(self, request_from, tenant, msg_id):
+        return HelloHandler.handle_message(self, request_from, tenant, msg_id)
+
+    # same contract as HelloHandler.SayHelloStream, messages run as tasks on the event loop
+    async def SayHelloStream(self, request_iterator, context):
+        diagnostics.print_span("stream > ", trace.get_current_span())
+        replies = asyncio.Queue()
+        window = asyncio.Semaphore(self.stream_window)
+        tasks = set()
+
+        async def read():
+            received = 0
+            try:
+                async for request in request_iterator:
+                    await window.acquire()
+                    received += 1
+                    task = asyncio.create_task(self.process_message(request, context, replies))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            except grpc.RpcError:
+                pass
+            finally:
+                await replies.put(received)
+
+        reader = asyncio.create_task(read())
+        handled, received = 0, None
+        try:
+            while received is None or handled < received:
+                reply = await replies.get()
+                if isinstance(reply, int):
+                    received = reply
+                    continue
+                handled += 1
+                window.release()
+                yield reply
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    async def process_message(self, request, context, replies):
+        tracer = self.tracer or trace.get_tracer("harmeet-trace-test")
+        try:
+            with tracer.start_as_current_span("SayHelloStream.message", links=message_links(request)) as span:
+                reply = await self.process(request, context, span)
+            reply.seq = request.seq
+        except Exception as e:
+            reply = helloworld_reply(seq=request.seq, error=f"{type(e).__name__}: {e}")
+        await replies.put(reply)
+
+
+# adaptive concurrency limit, driven by the latency of completed requests from admission to completion (queue
+# wait excluded, but the time an admitted request waits for a thread or the GIL is included). once per window:
+#   aimd:     limit * backoff when the window's average latency is over latency_threshold_ms, else limit + 1
+#   gradient: limit * (baseline latency / window average), the ratio clamped to 0.5..1, plus sqrt(limit) headroom,
+#             smoothed. the baseline follows the lowest window average and drifts up slowly, so latency rising
+#             with concurrency shrinks the limit
+# the limit only grows while at least half of it is in use, so an idle server does not drift to max_limit
+class ConcurrencyLimit:
+    ALGORITHMS = ("aimd", "gradient")
+
+    def __init__(self, algorithm="gradient", initial=10, min_limit=1, max_limit=100, latency_threshold_ms=2000,
+                 backoff=0.9, window=1.0, smoothing=0.2):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"unknown algorithm {algorithm}, expected one of {self.ALGORITHMS}")
+        self.algorithm = algorithm
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold_ms = latency_threshold_ms
+        self.backoff = backoff
+        self.window = window
+        self.smoothing = smoothing
+        self.window_end = time.monotonic() + window
+        self.window_total = 0.0
+        self.window_count = 0
+        self.window_in_flight = 0
+        self.baseline = None
+
+    # requests allowed to run at once
+    def current(self):
+        return max(1, int(self.limit))
+
+    # called by AdmissionController under its lock when a request finishes
+    def update(self, latency_ms, in_flight, now):
+        self.window_total += latency_ms
+        self.window_count += 1
+        self.window_in_flight = max(self.window_in_flight, in_flight)
+        if now < self.window_end:
+            return
+        self.window_end = now + self.window
+        average = self.window_total / self.window_count
+        app_limited = self.window_in_flight < self.limit / 2
+        self.window_total, self.window_count, self.window_in_flight = 0.0, 0, 0
+        if self.algorithm == "aimd":
+            if average > self.latency_threshold_ms:
+                limit = self.limit * self.backoff
+            elif not app_limited:
+                limit = self.limit + 1
+            else:
+                return
+        else:
+            if self.baseline is None or average < self.baseline:
+                self.baseline = average
+            else:
+                self.baseline = 0.98 * self.baseline + 0.02 * average
+            gradient = max(0.5, min(1.0, self.baseline / average)) if average > 0 else 1.0
+            new_limit = self.limit * gradient + math.sqrt(self.limit)
+            if app_limited and new_limit > self.limit:
+                return
+            limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+
+class QueuedRequest:
+    def __init__(self, key):
+        self.key = key
+        self.event = threading.Event()
+        self.admitted = False
+        self.admitted_at = None
+
+
+# request tenant for admission: the typed/legacy payload of a HelloRequest, else the tenant_id baggage entry
+def request_tenant(request):
+    tenant = None
+    if hasattr(request, "tenant"):
+        try:
+            tenant = decode_request(request)[1]
+        except InvalidRequest:
+            # admitted as an unknown tenant, the handler rejects it
+            pass
+    return tenant or baggage.get_baggage("tenant_id") or "unknown"
+
+
+# admission control for the threaded server (start_grpc_server(admission=...)). up to limit.current() requests
+# run at once; beyond that a request waits in a bounded queue, at most queue_timeout seconds or its remaining
+# deadline, and is rejected with RESOURCE_EXHAUSTED when the queue is full or the wait runs out, instead of
+# queueing without bound in the server's thread pool. fair=True keeps one queue per tenant and admits from
+# them round-robin, so one busy tenant does not hold up the others.
+# with metrics, exports {meter_name}_queue_wait (ms histogram), {meter_name}_in_flight,
+# {meter_name}_concurrency_limit and {meter_name}_shed (by reason); the same values go on the server span as
+# admission.* attributes
+class AdmissionController:
+    def __init__(self, limit=None, max_queue=100, max_queue_per_tenant=None, queue_timeout=1.0, fair=False,
+                 metrics=None, meter_name="hb_test", tenant_of=request_tenant):
+        self.limit = limit or ConcurrencyLimit()
+        self.max_queue = max_queue
+        self.max_queue_per_tenant = max_queue_per_tenant
+        self.queue_timeout = queue_timeout
+        self.fair = fair
+        self.tenant_of = tenant_of
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+        # key (tenant, or "" when not fair) -> waiting requests, in round-robin order
+        self.queues = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.queue_wait = None
+        self.shed_counter = None
+        if metrics is not None:
+            meter = metrics.get_meter(meter_name)
+            self.queue_wait = meter.create_histogram(f"{meter_name}_queue_wait", unit="ms")
+            self.shed_counter = meter.create_counter(f"{meter_name}_shed")
+            meter.create_observable_gauge(f"{meter_name}_in_flight", callbacks=[self.observe_in_flight])
+            meter.create_observable_gauge(f"{meter_name}_concurrency_limit", callbacks=[self.observe_limit])
+
+    # worst case number of requests holding a server thread: running plus queued
+    def capacity(self):
+        return self.limit.max_limit + self.max_queue
+
+    # returns (admitted_at, reason), admitted_at is None when shed. blocks while queued
+    def acquire(self, tenant, timeout):
+        with self.lock:
+            if self.in_flight < self.limit.current() and not self.queued:
+                self.in_flight += 1
+                return time.monotonic(), None
+            key = tenant if self.fair else ""
+            waiting = self.queues.get(key)
+            if self.queued >= self.max_queue or (self.max_queue_per_tenant is not None and waiting is not None
+                                                 and len(waiting) >= self.max_queue_per_tenant):
+                self.shed += 1
+                return None, "queue_full"
+            if waiting is None:
+                waiting = collections.deque()
+                self.queues[key] = waiting
+            request = QueuedRequest(key)
+            waiting.append(request)
+            self.queued += 1
+        request.event.wait(timeout)
+        with self.lock:
+            if request.admitted:
+                return request.admitted_at, None
+            # timed out, admission may not have happened in the meantime since it is decided under the lock
+            waiting = self.queues[key]
+            waiting.remove(request)
+            if not waiting:
+                del self.queues[key]
+            self.queued -= 1
+            self.shed += 1
+            return None, "queue_timeout"
+
+    def release(self, latency_ms):
+        with self.lock:
+            self.limit.update(latency_ms, self.in_flight, time.monotonic())
+            self.in_flight -= 1
+            self.dispatch()
+
+    # admit queued requests while below the limit, one per tenant queue in turn. caller holds the lock
+    def dispatch(self):
+        while self.queued and self.in_flight < self.limit.current():
+            key, waiting = next(iter(self.queues.items()))
+            request = waiting.popleft()
+            if waiting:
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+            self.queued -= 1
+            self.in_flight += 1
+            request.admitted = True
+            request.admitted_at = time.monotonic()
+            request.event.set()
+
+    # runs behavior(request, context) once admitted, aborts with RESOURCE_EXHAUSTED when shed
+    def run(self, behavior, request, context):
+        timeout = self.queue_timeout
+        remaining = context.time_remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        start = time.monotonic()
+        admitted_at, reason = self.acquire(self.tenant_of(request), timeout)
+        admitted = admitted_at is not None
+        wait_ms = ((admitted_at if admitted else time.monotonic()) - start) * 1000
+        span = trace.get_current_span()
+        if span.is_recording():
+            span.set_attribute("admission.queue_wait_ms", wait_ms)
+            span.set_attribute("admission.in_flight", self.in_flight)
+            span.set_attribute("admission.limit", self.limit.current())
+            span.set_attribute("admission.shed_count", self.shed)
+            if not admitted:
+                span.set_attribute("admission.shed", reason)
+        if self.queue_wait is not None:
+            self.queue_wait.record(wait_ms)
+        if not admitted:
+            if self.shed_counter is not None:
+                self.shed_counter.add(1, {"reason": reason})
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, f"overloaded ({reason})")
+        try:
+            return behavior(request, context)
+        finally:
+            self.release((time.monotonic() - admitted_at) * 1000)
+
+    def interceptor(self):
+        return AdmissionInterceptor(self)
+
+    def observe_in_flight(self, options: CallbackOptions = CallbackOptions()):
+        yield Observation(self.in_flight)
+
+    def observe_limit(self, options: CallbackOptions = CallbackOptions()):
+        yield Observation(self.limit.current())
+
+
+# puts every unary-unary method of the server behind an AdmissionController, except TelemetryAdmin's, which
+# must get through while the server is overloaded. the OTel server interceptor is installed ahead of it, so the
+# admission runs inside the server span
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    def __init__(self, controller):
+        self.controller = controller
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.unary_unary is None:
+            return handler
+        if handler_call_details.method.startswith("/helloworld.TelemetryAdmin/"):
+            return handler
+        behavior = handler.unary_unary
+        controller = self.controller
+
+        def admitted(request, context):
+            return controller.run(behavior, request, context)
+
+        return grpc.unary_unary_rpc_method_handler(admitted, request_deserializer=handler.request_deserializer,
+                                                   response_serializer=handler.response_serializer)
+
+
+# server threads set aside for TelemetryAdmin calls, see create_grpc_server
+ADMIN_SLOTS = 2
+
+
+# TelemetryAdmin servicer (helloworld.proto), registered next to the Greeter by create_grpc_server(admin=True):
+# changes the telemetry settings of a running process and reports its load. the settings are process wide:
+# the ratio of the AdjustableSampler and the tenant limits of the TenantRateLimitedSampler grpc_otel_config set
+# up, the level of the service logger, log_policy.unsampled_level and exception_recorder's mode. SetTelemetry
+# checks every field before applying any and aborts with INVALID_ARGUMENT on a bad one.
+# the status has the occupancy of pools (name -> ContextExecutor, background and stream always) and of the admission controller, export queue depths, drop counts and per tenant latency percentiles
+# from stats (a RequestStats in histogram mode)
+class TelemetryAdmin:
+    def __init__(self, logger=None, stats=None, admission=None, pools=None):
+        self.logger = logger
+        self.stats = stats
+        self.admission = admission
+        self.pools = {"background": background, "stream": stream_workers, **(pools or {})}
+        self.lock = threading.Lock()
+
+    def GetTelemetry(self, request, context):
+        return self.status()
+
+    def SetTelemetry(self, request, context):
+        try:
+            self.apply(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return self.status()
+
+    @staticmethod
+    def parse_level(name):
+        level = logging.getLevelName(name.upper())
+        if not isinstance(level, int):
+            raise ValueError(f"unknown log level {name}")
+        return level
+
+    def apply(self, request):
+        sampler = active_sampler()
+        limiter = tenant_rate_limiter(sampler)
+        if request.HasField("sampling_ratio"):
+            if not isinstance(sampler, AdjustableSampler):
+                raise ValueError("tracing is not set up with an AdjustableSampler")
+            if not 0 <= request.sampling_ratio <= 1:
+                raise ValueError(f"sampling ratio {request.sampling_ratio} is not between 0 and 1")
+        if request.tenant_spans_per_second:
+            if limiter is None:
+                raise ValueError("tracing is not set up with a TenantRateLimitedSampler")
+            if any(rate < 0 for rate in request.tenant_spans_per_second.values()):
+                raise ValueError("spans per second must not be negative")
+        log_level = unsampled_level = None
+        if request.HasField("log_level"):
+            if self.logger is None:
+                raise ValueError("no service logger to set the level of")
+            log_level = self.parse_level(request.log_level)
+        if request.HasField("unsampled_log_level") and request.unsampled_log_level.upper() != "NONE":
+            unsampled_level = self.parse_level(request.unsampled_log_level)
+        if request.HasField("exception_mode") and request.exception_mode not in ExceptionRecorder.MODES:
+            raise ValueError(f"unknown exception recording mode {request.exception_mode}, "
+                             f"expected one of {ExceptionRecorder.MODES}")
+        if request.HasField("emit_policy") and request.emit_policy not in EMIT_POLICIES:
+            raise ValueError(f"unknown emit policy {request.emit_policy}, expected one of {tuple(EMIT_POLICIES)}")
+        with self.lock:
+            if request.HasField("sampling_ratio"):
+                sampler.set_ratio(request.sampling_ratio)
+            for tenant, rate in request.tenant_spans_per_second.items():
+                limiter.set_limit(tenant, rate)
+            if log_level is not None:
+                self.logger.setLevel(log_level)
+            if request.HasField("unsampled_log_level"):
+                log_policy.unsampled_level = unsampled_level
+            if request.HasField("emit_policy"):
+                emit_policy.configure(request.emit_policy)
+            exception_recorder.configure(request.exception_mode if request.HasField("exception_mode") else None,
+                                         request.exception_full_per_interval
+                                         if request.HasField("exception_full_per_interval") else None)
+            if request.reset_latency and self.stats is not None:
+                self.stats.reset_latency()
+        diagnostics.print("telemetry settings changed: %s",
+                          ", ".join(f"{field.name}={value}" for field, value in request.ListFields()))
+
+    def status(self):
+        import helloworld_pb2
+        sampler = active_sampler()
+        limiter = tenant_rate_limiter(sampler)
+        status = helloworld_pb2.TelemetryStatus(
+            pid=os.getpid(),
+            sampling_ratio=sampler.ratio if isinstance(sampler, AdjustableSampler) else 1.0,
+            sampler=sampler.get_description() if sampler is not None else "none",
+            unsampled_log_level=("NONE" if log_policy.unsampled_level is None
+                                 else logging.getLevelName(log_policy.unsampled_level)),
+            exception_mode=exception_recorder.mode,
+            exception_full_per_interval=exception_recorder.full_per_interval,
+            emit_policy=emit_policy.name,
+        )
+        if limiter is not None:
+            status.tenant_spans_per_second.update(limiter.tenant_limits)
+        if self.logger is not None:
+            status.log_level = logging.getLevelName(self.logger.getEffectiveLevel())
+        for name, pool in self.pools.items():
+            size, busy, queued, rejected = pool.occupancy()
+            status.pools.add(name=name, size=size, busy=busy, queued=queued, rejected=rejected)
+        if self.admission is not None:
+            admission = self.admission
+            status.pools.add(name="admission", size=admission.limit.current(), busy=admission.in_flight,
+                             queued=admission.queued, rejected=admission.shed)
+        for signal_name, processor in export_processors.items():
+            depth, capacity = queue_depth(processor)
+            status.export_queues.add(signal=signal_name, depth=depth, capacity=capacity)
+            if isinstance(processor, ThreadBufferedProcessor):
+                status.dropped[f"{signal_name}_export"] = processor.dropped()
+        status.dropped["diagnostics"] = diagnostics.dropped
+        if self.stats is not None:
+            for tenant, histogram in list(self.stats.histograms.items()):
+                exemplars = self.stats.exemplars(0.99, tenant)
+                status.latency.add(tenant=tenant, count=histogram.count,
+                                   p50_ms=self.stats.percentile(0.5, tenant) or 0,
+                                   p90_ms=self.stats.percentile(0.9, tenant) or 0,
+                                   p99_ms=self.stats.percentile(0.99, tenant) or 0,
+                                   p99_trace_id=exemplars[-1].trace_id if exemplars else "")
+        return status
+
+
+# creates and starts the threaded Greeter server, its thread pool is a ContextExecutor that never rejects (so
+# TelemetryAdmin can report its occupancy). admission: an AdmissionController, the thread pool and grpc's
+# own maximum_concurrent_rpcs are then sized to its capacity, so requests past it are rejected by grpc up front
+# rather than queued in the pool. admin=True also serves TelemetryAdmin, reporting the server's thread pool too;
+# with admission the pool and limit get ADMIN_SLOTS more, so admin calls get in while Greeter calls are being
+# shed (a Greeter call taking such a slot is still shed by the controller)
+def create_grpc_server(port, handler, admission=None, options=None, admin=False):
+    import helloworld_pb2_grpc
+    if admission is not None:
+        capacity = admission.capacity() + (ADMIN_SLOTS if admin else 0)
+        executor = ContextExecutor(max_workers=capacity, max_queue=None, name="server")
+        server = grpc.server(executor, options=options, interceptors=[admission.interceptor()],
+                             maximum_concurrent_rpcs=capacity)
+    else:
+        executor = ContextExecutor(max_workers=10, max_queue=None, name="server")
+        server = grpc.server(executor, options=options)
     helloworld_pb2_grpc.add_GreeterServicer_to_server(handler, server)
-    server.add_insecure_port(f"[::]:{port}")
+    if admin:
+        telemetry_admin = TelemetryAdmin(handler.logger, handler.stats, admission, pools={"server": executor})
+        helloworld_pb2_grpc.add_TelemetryAdminServicer_to_server(telemetry_admin, server)
+    port = server.add_insecure_port(f"[::]:{port}")
     server.start()
     print(f"Server started, listening on {port}")
-    server.wait_for_termination()
+    return server
+
+
+def start_grpc_server(port, handler, admission=None, admin=False):
+    server = create_grpc_server(port, handler, admission, admin=admin)
+    try:
+        server.wait_for_termination()
+    finally:
+        background.shutdown()
+
+
+# flush and shut down the providers grpc_otel_config set up (the API's no-op ones have no shutdown), then close
+# the HTTP sessions their exporters shared
+def shutdown_telemetry():
+    for provider in (trace.get_tracer_provider(), _logs.get_logger_provider(), otel_metrics.get_meter_provider()):
+        shutdown = getattr(provider, "shutdown", None)
+        if shutdown is not None:
+            shutdown()
+    while http_sessions:
+        session = http_sessions.pop()
+        # the class's close, the instance's is the no-op the exporters call
+        type(session).close(session)
+
+
+# binds port (0 picks a free one) with SO_REUSEPORT without listening, so the port stays ours while pre-forked
+# workers bind it too. yields the port
+@contextlib.contextmanager
+def reserve_port(port):
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", port))
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+# pre-forked server: workers processes each run a threaded server on the same port with SO_REUSEPORT, the kernel
+# spreads incoming connections over them (a connection stays with one worker). setup(worker_index) runs in each
+# worker after the fork and returns (handler, admission); OTel is configured there, so no exporter thread, lock
+# or connection is inherited. the parent must not have configured OTel or created a grpc server or channel before
+# calling this. every worker's Resource gets process.pid and worker.index.
+# SIGTERM/SIGINT to the parent, or any worker exiting, stops all workers: the parent sends SIGTERM to the ones
+# still running, each stops accepting, gives running requests grace seconds, then drains background work and
+# flushes telemetry. returns the workers' exit codes.
+# admin=True serves TelemetryAdmin in every worker; a call reaches the one worker its connection went to
+def start_prefork_server(port, workers, setup, grace=5, admin=False):
+    import multiprocessing
+    ctx = multiprocessing.get_context("fork")
+    stopping = []
+    with reserve_port(port) as port:
+        processes = [ctx.Process(target=prefork_worker, args=(port, idx, setup, grace, admin),
+                                 name=f"worker-{idx}")
+                     for idx in range(workers)]
+        for process in processes:
+            process.start()
+        print(f"Pre-forked {workers} workers, listening on {port}")
+        # the handler only flags, the workers are signalled from the loop below
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+        while not stopping and all(process.is_alive() for process in processes):
+            time.sleep(0.2)
+        # a signal, not a shared Event: waiters on a multiprocessing Event that died with their worker would
+        # block the parent's set() forever
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        # grace, plus time to flush telemetry, for all workers together
+        deadline = time.monotonic() + grace + 10
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+    return [process.exitcode for process in processes]
+
+
+def prefork_worker(port, worker, setup, grace, admin):
+    # Ctrl-C reaches the whole process group, the parent coordinates the shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    random.seed()
+    diagnostics.after_fork()
+    resource_attributes.update({"process.pid": os.getpid(), "worker.index": worker})
+    handler, admission = setup(worker)
+    server = create_grpc_server(port, handler, admission, options=[("grpc.so_reuseport", 1)], admin=admin)
+    signal.signal(signal.SIGTERM, lambda *_: server.stop(grace))
+    try:
+        server.wait_for_termination()
+    finally:
+        # forked workers exit without running atexit hooks, flush here
+        background.shutdown()
+        shutdown_telemetry()
+        diagnostics.flush()
+
+
+async def serve_aio(port, handler):
+    import helloworld_pb2_grpc
+    server = grpc.aio.server()
+    helloworld_pb2_grpc.add_GreeterServicer_to_server(handler, server)
+    server.add_insecure_port(f"[::]:{port}")
+    await server.start()
+    print(f"Server started (aio), listening on {port}")
+    try:
+        await server.wait_for_termination()
+    finally:
+        await aio_channel_pool.close()
+
+
+def start_aio_grpc_server(port, handler):
+    asyncio.run(serve_aio(port, handler))
+
+
+# signals turned on by $OTEL_TEST_SIGNALS, a comma separated subset of traces,logs,metrics ("none" for none).
+# unset turns all three on
+def enabled_signals(env=os.environ):
+    raw = env.get("OTEL_TEST_SIGNALS")
+    if raw is None:
+        return {"traces", "logs", "metrics"}
+    return {s.strip() for s in raw.split(",") if s.strip() in ("traces", "logs", "metrics")}
 
 
-def grpc_otel_config(service_name):
+# aio=True instruments grpc.aio servers and channels instead of the threaded ones.
+# spans_per_second caps new traces per tenant with TenantRateLimitedSampler, None samples everything.
+# sampling_ratio is the share of new traces sampled at all (AdjustableSampler, changeable at runtime).
+# sampling_aware_logs skips log records (and their formatting) for traces that are not sampled.
+# emit is the emit_policy for log_msg, an EMIT_POLICIES name or rules dict, None takes $OTEL_TEST_EMIT_POLICY
+# (default "all": a log record and a span event per message; "dedup" sends one, the event when sampled).
+# profile is an ExporterProfile for all three signals, None loads one from the environment (ExporterProfile.load)
+# traces/logs/metrics turn each signal on or off, None takes it from $OTEL_TEST_SIGNALS (see enabled_signals).
+# a signal that is off imports none of its exporter or instrumentation modules, nor the metrics SDK (the trace
+# and logs SDKs are imported with this module): without traces the tracer is the no-op API tracer and grpc is not
+# instrumented, without logs the logger has no OTel handler, without metrics RequestStats records into the no-op
+# API meter (its local histograms still work).
+# profiler is a SpanProfiler added to the tracer provider, None takes one from the environment
+# (SpanProfiler.from_env, off unless $OTEL_TEST_PROFILE_HZ is set); it needs traces on
+def grpc_otel_config(service_name, stats_mode="histogram", aio=False, spans_per_second=None, tenant_limits=None,
+                     sampling_aware_logs=False, profile=None, traces=None, logs=None, metrics=None, profiler=None,
+                     sampling_ratio=1.0, emit=None):
     logging.basicConfig()
-    _tracer = configure_tracing(service_name=service_name)
-    _logger = configure_logging(service_name=service_name)
-    _metrics = configure_metrics(service_name=service_name)
-    stats = RequestStats(metrics=_metrics, meter_name=service_name)
-    grpc_instrumentation.GrpcInstrumentorServer().instrument()
-    grpc_instrumentation.GrpcInstrumentorClient().instrument()
+    emit_policy.configure(emit or os.environ.get("OTEL_TEST_EMIT_POLICY", "all"))
+    signals = enabled_signals()
+    traces = "traces" in signals if traces is None else traces
+    logs = "logs" in signals if logs is None else logs
+    metrics = "metrics" in signals if metrics is None else metrics
+    if profile is None:
+        profile = ExporterProfile.load()
+    if traces:
+        sampler = ALWAYS_ON
+        if spans_per_second is not None:
+            sampler = TenantRateLimitedSampler(spans_per_second=spans_per_second, tenant_limits=tenant_limits)
+        sampler = AdjustableSampler(sampler, sampling_ratio)
+        _tracer = configure_tracing(service_name=service_name, sampler=sampler, profile=profile)
+        profiler = profiler or SpanProfiler.from_env()
+        if profiler is not None:
+            trace.get_tracer_provider().add_span_processor(profiler.start())
+    else:
+        _tracer = trace.get_tracer("harmeet-trace-test")
+    if logs:
+        _logger = configure_logging(service_name=service_name, sampling_aware=sampling_aware_logs, profile=profile)
+    else:
+        _logger = logging.getLogger("basic_otlp_test")
+    if metrics:
+        _metrics = configure_metrics(service_name=service_name, profile=profile)
+    else:
+        _metrics = otel_metrics
+    stats = RequestStats(metrics=_metrics, meter_name=service_name, mode=stats_mode)
+    meter = _metrics.get_meter(service_name)
+    meter.create_observable_counter(
+        f"{service_name}_diagnostics_dropped",
+        callbacks=[diagnostics.observe_dropped],
+    )
+    meter.create_observable_gauge(
+        f"{service_name}_background_queue_depth",
+        callbacks=[background.observe_queue_depth],
+    )
+    meter.create_observable_counter(
+        f"{service_name}_background_rejected",
+        callbacks=[background.observe_rejected],
+    )
+    for signal_name, processor in export_processors.items():
+        if isinstance(processor, ThreadBufferedProcessor):
+            meter.create_observable_counter(f"{service_name}_{signal_name}_export_dropped",
+                                            callbacks=[processor.observe_dropped])
+            meter.create_observable_gauge(f"{service_name}_{signal_name}_queue_latency_p99", unit="ms",
+                                          callbacks=[processor.observe_queue_latency_p99])
+    if traces:
+        from opentelemetry.instrumentation import grpc as grpc_instrumentation
+        if aio:
+            grpc_instrumentation.GrpcAioInstrumentorServer().instrument()
+            grpc_instrumentation.GrpcAioInstrumentorClient().instrument()
+        else:
+            grpc_instrumentation.GrpcInstrumentorServer().instrument()
+            grpc_instrumentation.GrpcInstrumentorClient().instrument()
     return _tracer, _logger, _metrics, stats
 
 def span_info(span_context):